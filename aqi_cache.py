@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CacheEntry:
+    """A cached upstream value, the monotonic time it was fetched and the wall time it was stored"""
+    __slots__ = ('value', 'fetched_at', 'stored_at')
+
+    def __init__(self, value, fetched_at, stored_at=None):
+        self.value = value
+        self.fetched_at = fetched_at
+        self.stored_at = stored_at if stored_at is not None else time.time()
+
+    def age(self):
+        return time.monotonic() - self.fetched_at
+
+
+class ReadingCache:
+    """TTL cache for upstream readings with stale-while-revalidate and request coalescing
+
+    Values younger than ``ttl`` seconds are served directly. Values older than
+    that but within ``ttl + stale_ttl`` are served immediately while a single
+    background refresh runs. Anything older (or missing) is fetched, and
+    concurrent callers for the same key share one in-flight upstream request.
+    Failed fetches (exceptions or None) are never cached.
+    """
+
+    def __init__(self, ttl=900, stale_ttl=3600):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.entries = {}
+        self.inflight = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.upstream_fetches = 0
+        self.upstream_errors = 0
+        # Bumped whenever a new value is stored, so renderers can reuse output
+        self.version = 0
+        self.updated_at = None
+
+    async def get(self, key, fetcher):
+        """Return the value for ``key``, calling ``fetcher()`` only when needed"""
+        entry = self.entries.get(key)
+        if entry is not None:
+            age = entry.age()
+            if age < self.ttl:
+                self.hits += 1
+                return entry.value
+            if age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                if key not in self.inflight:
+                    self.start_refresh(key, fetcher, background=True)
+                return entry.value
+
+        if key in self.inflight:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            self.start_refresh(key, fetcher)
+        return await asyncio.shield(self.inflight[key])
+
+    def get_fresh(self, key):
+        """Return the value for ``key`` if it is within the TTL, else None (no fetching)"""
+        entry = self.entries.get(key)
+        if entry is not None and entry.age() < self.ttl:
+            self.hits += 1
+            return entry.value
+        return None
+
+    async def refresh(self, key, fetcher):
+        """Fetch ``key`` now regardless of age, joining any in-flight request"""
+        if key not in self.inflight:
+            self.start_refresh(key, fetcher)
+        return await asyncio.shield(self.inflight[key])
+
+    def peek(self, key):
+        """Return the cached entry for ``key`` without fetching, or None"""
+        return self.entries.get(key)
+
+    def put(self, key, value, stored_at):
+        """Install a value fetched elsewhere (e.g. by an ingest worker) at wall time ``stored_at``
+
+        The entry ages from ``stored_at``, not from now. Returns False if the
+        cache already holds a value at least as recent.
+        """
+        entry = self.entries.get(key)
+        if entry is not None and entry.stored_at >= stored_at:
+            return False
+        age = max(0.0, time.time() - stored_at)
+        self.entries[key] = CacheEntry(value, time.monotonic() - age, stored_at)
+        self.version += 1
+        self.updated_at = stored_at if self.updated_at is None else max(self.updated_at, stored_at)
+        return True
+
+    def start_refresh(self, key, fetcher, background=False):
+        task = asyncio.ensure_future(self.load(key, fetcher))
+        task.add_done_callback(lambda t: self.check_refresh(key, t, background))
+        self.inflight[key] = task
+        return task
+
+    async def load(self, key, fetcher):
+        self.upstream_fetches += 1
+        try:
+            value = await fetcher()
+        except Exception:
+            self.upstream_errors += 1
+            raise
+        finally:
+            self.inflight.pop(key, None)
+
+        if value is None:
+            self.upstream_errors += 1
+        else:
+            self.entries[key] = CacheEntry(value, time.monotonic())
+            self.version += 1
+            self.updated_at = time.time()
+        return value
+
+    def check_refresh(self, key, task, background):
+        # Always retrieve the exception so shielded tasks whose callers gave up
+        # do not warn; foreground failures are reported by the caller
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None and background:
+            logger.warning(f"Background refresh of {key} failed: {error}")
+
+    def stats(self):
+        """Return hit/miss counters for operators"""
+        lookups = self.hits + self.stale_hits + self.misses + self.coalesced
+        # Coalesced callers shared a fetch but still waited on upstream
+        served_from_cache = self.hits + self.stale_hits
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'stale_hits': self.stale_hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'upstream_fetches': self.upstream_fetches,
+            'upstream_errors': self.upstream_errors,
+            'hit_ratio': served_from_cache / lookups if lookups else 0.0,
+        }
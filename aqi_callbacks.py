@@ -0,0 +1,83 @@
+import hashlib
+from collections import OrderedDict
+
+# Bumped whenever view codes or their arguments change meaning; buttons
+# carrying another version are treated as expired
+VERSION = 'v1'
+SEPARATOR = '|'
+# Telegram's limit on callback_data
+MAX_BYTES = 64
+# Marks an argument list kept server-side, looked up by token
+TOKEN_PREFIX = '~'
+
+# View codes
+MENU = 'm'
+ABOUT = 'a'
+REPORT = 'r'
+TREND = 't'
+DETAILS = 'd'  # city key, page
+STATION = 's'  # station id
+
+# Fixed callback strings used by messages sent before the encoding existed
+LEGACY = {
+    'check_aqi': (REPORT, []),
+    'about_aqi': (ABOUT, []),
+    'back_to_menu': (MENU, []),
+    'trend': (TREND, []),
+    'detailed_aqi': (DETAILS, ['jakarta', '0']),
+    'sg_details': (DETAILS, ['singapore', '0']),
+}
+
+
+def encode_inline(view, *args):
+    """Inline callback_data for ``view`` and its arguments, or None if they cannot be carried inline"""
+    args = [str(arg) for arg in args]
+    if any(SEPARATOR in arg or arg.startswith(TOKEN_PREFIX) for arg in args):
+        return None
+    data = SEPARATOR.join((VERSION, view, *args))
+    return data if len(data.encode()) <= MAX_BYTES else None
+
+
+class CallbackCodec:
+    """Compact, versioned callback_data with a bounded LRU of view state
+
+    Buttons carry ``v1|<view code>|arg|...`` when that fits in Telegram's 64
+    bytes. Longer argument lists are kept server-side and the button
+    carries a short token derived from them, so re-rendering the same view
+    yields the same callback_data. Tokens evicted from the LRU, or lost
+    with a restart, decode as expired. With ``max_states=0`` no state is
+    kept and ``encode`` returns None for what does not fit inline, for
+    workers that cannot decode each other's tokens.
+    """
+
+    def __init__(self, max_states=10000):
+        self.states = OrderedDict()
+        self.max_states = max_states
+
+    def encode(self, view, *args):
+        data = encode_inline(view, *args)
+        if data is not None or not self.max_states:
+            return data
+        args = [str(arg) for arg in args]
+        token = hashlib.blake2b(SEPARATOR.join((view, *args)).encode(), digest_size=9).hexdigest()
+        self.states[token] = args
+        self.states.move_to_end(token)
+        if len(self.states) > self.max_states:
+            self.states.popitem(last=False)
+        return SEPARATOR.join((VERSION, view, TOKEN_PREFIX + token))
+
+    def decode(self, data):
+        """Return ``(view, args)`` for callback_data, or None if it is unknown or expired"""
+        legacy = LEGACY.get(data)
+        if legacy is not None:
+            return legacy
+        parts = (data or '').split(SEPARATOR)
+        if len(parts) < 2 or parts[0] != VERSION:
+            return None
+        view, args = parts[1], parts[2:]
+        if len(args) == 1 and args[0].startswith(TOKEN_PREFIX):
+            args = self.states.get(args[0][len(TOKEN_PREFIX):])
+            if args is None:
+                return None
+            self.states.move_to_end(parts[2][len(TOKEN_PREFIX):])
+        return view, args
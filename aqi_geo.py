@@ -0,0 +1,93 @@
+import heapq
+import math
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def to_xyz(lat, lon):
+    """Project a latitude/longitude in degrees onto the unit sphere"""
+    phi, lam = math.radians(lat), math.radians(lon)
+    cos_phi = math.cos(phi)
+    return (cos_phi * math.cos(lam), cos_phi * math.sin(lam), math.sin(phi))
+
+
+def chord_to_km(chord):
+    """Convert a straight-line distance between unit-sphere points to a great-circle distance"""
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+def build_tree(items, depth=0):
+    """Build a balanced 3-d tree from ``(point, key)`` pairs
+
+    Nodes are ``(point, key, axis, left, right)`` tuples.
+    """
+    if not items:
+        return None
+    axis = depth % 3
+    items.sort(key=lambda item: item[0][axis])
+    median = len(items) // 2
+    point, key = items[median]
+    return (
+        point, key, axis,
+        build_tree(items[:median], depth + 1),
+        build_tree(items[median + 1:], depth + 1)
+    )
+
+
+class StationIndex:
+    """Nearest-station lookup over a k-d tree of station coordinates
+
+    Stations are projected onto the unit sphere, so straight-line distance
+    orders them exactly like great-circle distance with no special cases at
+    the antimeridian or the poles. Positions are learned from readings as
+    they arrive; the tree is rebuilt lazily on the next lookup after a
+    station appears or moves.
+    """
+
+    def __init__(self, positions=None):
+        # station id -> (lat, lon)
+        self.positions = dict(positions or {})
+        self.tree = None
+        self.dirty = True
+
+    def __len__(self):
+        return len(self.positions)
+
+    def update(self, readings):
+        """Learn station coordinates from readings that carry a ``geo`` position"""
+        for reading in readings:
+            if reading.geo is not None and self.positions.get(reading.station.id) != reading.geo:
+                self.positions[reading.station.id] = reading.geo
+                self.dirty = True
+
+    def rebuild(self):
+        self.tree = build_tree([(to_xyz(lat, lon), key) for key, (lat, lon) in self.positions.items()])
+        self.dirty = False
+
+    def nearest(self, lat, lon, k=3, max_km=None):
+        """Return up to ``k`` ``(station_id, distance_km)`` pairs, closest first"""
+        if self.dirty:
+            self.rebuild()
+        target = to_xyz(lat, lon)
+        # Max-heap of (-squared chord distance, station id) holding the best k so far
+        best = []
+
+        def search(node):
+            if node is None:
+                return
+            point, key, axis, left, right = node
+            d2 = (point[0] - target[0]) ** 2 + (point[1] - target[1]) ** 2 + (point[2] - target[2]) ** 2
+            if len(best) < k:
+                heapq.heappush(best, (-d2, key))
+            elif d2 < -best[0][0]:
+                heapq.heapreplace(best, (-d2, key))
+            diff = target[axis] - point[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            search(near)
+            # Only cross the splitting plane if it is closer than the current k-th best
+            if len(best) < k or diff * diff < -best[0][0]:
+                search(far)
+
+        search(self.tree)
+        results = sorted((chord_to_km(math.sqrt(-neg_d2)), key) for neg_d2, key in best)
+        return [(key, km) for km, key in results if max_km is None or km <= max_km]
@@ -0,0 +1,154 @@
+import logging
+import math
+import sqlite3
+import struct
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Values stored per sample, in payload order. For Singapore regions the
+# 'aqi' slot holds the 24-hour PSI and 'pm25' the 24-hour PM2.5 reading.
+FIELDS = ('aqi', 'pm25', 'pm10', 'no2', 'o3', 'co', 'so2')
+# Fixed-width little-endian float32 per field; missing values are NaN
+SAMPLE = struct.Struct('<' + 'f' * len(FIELDS))
+NAN = float('nan')
+
+RAW = 0
+DAILY = 86400
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return NAN
+
+
+def pack_rows(samples, resolution):
+    return [
+        (station, ts, resolution, SAMPLE.pack(*(to_float(values.get(field)) for field in FIELDS)))
+        for station, ts, values in samples
+    ]
+
+
+class HistoryStore:
+    """Append-only time-series store of station readings
+
+    Samples live in one SQLite table keyed by (station, ts) without a rowid,
+    so range queries for a station are a single index scan. Each sample is a
+    fixed 28-byte blob. Raw samples older than ``raw_days`` are folded into
+    daily means, and anything older than ``retention_days`` is dropped, which
+    keeps disk usage bounded; an index on (resolution, ts) keeps compaction
+    from scanning the table. Writes and compaction block, so the bot runs
+    them in worker threads (``asyncio.to_thread``); a lock serialises every
+    method on the one connection.
+    """
+
+    def __init__(self, path="history.db", raw_days=30, retention_days=365):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS samples (
+                station TEXT NOT NULL,
+                ts INTEGER NOT NULL,
+                resolution INTEGER NOT NULL,
+                payload BLOB NOT NULL,
+                PRIMARY KEY (station, ts)
+            ) WITHOUT ROWID
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS samples_resolution_ts ON samples (resolution, ts)")
+        self.conn.commit()
+        self.raw_days = raw_days
+        self.retention_days = retention_days
+
+    def record_many(self, samples, resolution=RAW):
+        """Append ``(station, ts, values)`` samples; ``values`` maps FIELDS to numbers
+
+        Re-recording a station at an existing timestamp is ignored, so the
+        same upstream observation seen twice is stored once.
+        """
+        rows = pack_rows(samples, resolution)
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO samples VALUES (?, ?, ?, ?)", rows)
+
+    def record_readings(self, readings):
+        """Record normalised readings at their observation time, keyed by station id
+
+        The station's index (AQI, or PSI for Singapore regions) goes in the
+        'aqi' slot.
+        """
+        now = int(time.time())
+        samples = []
+        for reading in readings:
+            values = dict(reading.pollutants)
+            values['aqi'] = reading.value
+            samples.append((reading.station.id, reading.observed_at or now, values))
+        self.record_many(samples)
+
+    def query(self, station, start, end=None):
+        """Return ``[(ts, values_tuple), ...]`` for a station with start <= ts < end"""
+        end = end if end is not None else int(time.time()) + 1
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT ts, payload FROM samples WHERE station = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                (station, start, end)
+            ).fetchall()
+        return [(ts, SAMPLE.unpack(payload)) for ts, payload in rows]
+
+    def query_arrays(self, station, start, end=None):
+        """Return ``(ts, values)`` NumPy arrays for a station with start <= ts < end
+
+        ``values`` has one row per sample and one float32 column per FIELDS
+        entry, decoded straight from the fixed-width payloads.
+        """
+        # NumPy is only needed for trends, so it is not imported at startup
+        import numpy as np
+
+        end = end if end is not None else int(time.time()) + 1
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT ts, payload FROM samples WHERE station = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                (station, start, end)
+            ).fetchall()
+        ts = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        values = np.frombuffer(b''.join(row[1] for row in rows), dtype='<f4').reshape(-1, len(FIELDS))
+        return ts, values
+
+    def stations(self):
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT DISTINCT station FROM samples")]
+
+    def compact(self, now=None):
+        """Fold raw samples past ``raw_days`` into daily means and drop expired ones"""
+        now = now if now is not None else time.time()
+        raw_cutoff = int(now - self.raw_days * 86400) // DAILY * DAILY
+        expiry = int(now - self.retention_days * 86400)
+
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT station, ts, payload FROM samples WHERE resolution = ? AND ts < ?",
+                (RAW, raw_cutoff)
+            ).fetchall()
+        if rows:
+            days = {}
+            for station, ts, payload in rows:
+                days.setdefault((station, ts // DAILY * DAILY), []).append(SAMPLE.unpack(payload))
+            daily = []
+            for (station, day), samples in days.items():
+                means = {}
+                for i, field in enumerate(FIELDS):
+                    values = [s[i] for s in samples if not math.isnan(s[i])]
+                    means[field] = sum(values) / len(values) if values else None
+                daily.append((station, day, means))
+            with self.lock, self.conn:
+                self.conn.execute("DELETE FROM samples WHERE resolution = ? AND ts < ?", (RAW, raw_cutoff))
+                self.conn.executemany("INSERT OR IGNORE INTO samples VALUES (?, ?, ?, ?)", pack_rows(daily, DAILY))
+            logger.info(f"Compacted {len(rows)} raw samples into {len(daily)} daily means")
+
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM samples WHERE resolution IN (?, ?) AND ts < ?", (RAW, DAILY, expiry))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
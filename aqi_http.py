@@ -0,0 +1,160 @@
+import logging
+import time
+from urllib.parse import urlsplit
+
+import httpx
+
+from breaker import AdaptiveTimeout, CircuitBreaker
+from metrics import UPSTREAM_SECONDS
+
+try:
+    import brotli  # noqa: F401  (lets httpx decode "br" responses)
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    ACCEPT_ENCODING = "gzip, deflate"
+
+logger = logging.getLogger(__name__)
+
+# Loading the CA bundle takes tens of milliseconds, so every client shares one context
+_ssl_context = None
+
+
+def shared_ssl_context():
+    """Return the process-wide verifying SSL context, creating it on first use"""
+    global _ssl_context
+    if _ssl_context is None:
+        _ssl_context = httpx.create_ssl_context()
+    return _ssl_context
+
+
+def origin_of(url):
+    """Return the scheme://host[:port] part of a URL"""
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class UpstreamClient:
+    """Long-lived pooled HTTP client for a single upstream host
+
+    Connections are kept alive between requests, compressed responses are
+    accepted, and JSON bodies are revalidated with ETag/Last-Modified so an
+    unchanged resource costs a 304 instead of a full download. Requests go
+    through a circuit breaker and use a timeout adapted to the host's recent
+    latency.
+    """
+
+    def __init__(self, origin, timeout=10, max_connections=20, failure_threshold=5, reset_timeout=30):
+        self.origin = origin
+        self.breaker = CircuitBreaker(origin, failure_threshold, reset_timeout)
+        self.adaptive_timeout = AdaptiveTimeout(maximum=timeout)
+        self.client = httpx.AsyncClient(
+            verify=shared_ssl_context(),
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=60
+            ),
+            headers={
+                'Accept': 'application/json',
+                'Accept-Encoding': ACCEPT_ENCODING,
+                'User-Agent': 'JakartaAQIBot/1.0'
+            }
+        )
+        # url -> (etag, last_modified, parsed body) for conditional requests
+        self.validators = {}
+        self.requests = 0
+        self.not_modified = 0
+        self.bytes_received = 0
+        self.connections_opened = 0
+
+    async def get_json(self, url, params=None, timeout=None):
+        """GET ``url`` and return ``(status_code, parsed JSON or None)``
+
+        A 304 Not Modified answer is returned as 200 with the previously
+        parsed body. ``timeout`` caps the adaptive timeout. Timeouts, server
+        errors and answers far slower than the host's healthy latency count
+        as breaker failures, so a degraded host opens its circuit even below
+        the cap. A half-open probe gets the full maximum and closes the
+        circuit whenever it succeeds, so a host that settled at a slower but
+        healthy latency recovers, and its latency is learned. Raises
+        CircuitOpenError without making a request while the circuit is open.
+        """
+        probe = self.breaker.check()
+        limit = self.adaptive_timeout.maximum if probe else self.adaptive_timeout.current()
+        timeout = limit if timeout is None else min(timeout, limit)
+
+        key = str(httpx.URL(url, params=params))
+        headers = {}
+        cached = self.validators.get(key)
+        if cached is not None:
+            etag, last_modified, _ = cached
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+
+        started = time.perf_counter()
+        status = 'error'
+        try:
+            response = await self.client.get(
+                url,
+                params=params,
+                headers=headers,
+                timeout=timeout,
+                extensions={'trace': self.trace}
+            )
+            status = response.status_code
+        except httpx.HTTPError:
+            self.breaker.record_failure()
+            raise
+        except BaseException:
+            self.breaker.record_abandoned()
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            UPSTREAM_SECONDS.observe(elapsed, origin=self.origin, status=status)
+
+        # Server errors, throttling and slow answers count against the host;
+        # other answers show it is up
+        if response.status_code >= 500 or response.status_code == 429:
+            self.breaker.record_failure()
+        elif not probe and self.adaptive_timeout.is_slow(elapsed):
+            logger.warning(f"{self.origin} answered in {elapsed:.2f}s, "
+                           f"over {self.adaptive_timeout.slow_factor:g}x its usual latency")
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+            self.adaptive_timeout.observe(elapsed)
+        self.requests += 1
+        self.bytes_received += response.num_bytes_downloaded
+
+        if response.status_code == 304 and cached is not None:
+            self.not_modified += 1
+            return 200, cached[2]
+        if response.status_code != 200:
+            return response.status_code, None
+
+        data = response.json()
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if etag or last_modified:
+            self.validators[key] = (etag, last_modified, data)
+        return 200, data
+
+    async def trace(self, event_name, info):
+        if event_name == 'connection.connect_tcp.complete':
+            self.connections_opened += 1
+
+    def stats(self):
+        return {
+            'circuit': self.breaker.state,
+            'timeout': self.adaptive_timeout.current(),
+            'requests': self.requests,
+            'not_modified': self.not_modified,
+            'bytes_received': self.bytes_received,
+            'connections_opened': self.connections_opened,
+        }
+
+    async def aclose(self):
+        await self.client.aclose()
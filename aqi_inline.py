@@ -0,0 +1,43 @@
+import re
+
+# Longest query prefix worth indexing; longer queries are matched on this prefix
+MAX_PREFIX = 32
+
+NON_WORD = re.compile(r'[^0-9a-z]+')
+
+
+def normalize(text):
+    """Lower-case ``text`` and collapse punctuation and whitespace into single spaces"""
+    return NON_WORD.sub(' ', text.lower()).strip()
+
+
+class PrefixIndex:
+    """Precomputed prefix -> results map for inline queries
+
+    Every entry is indexed under all prefixes of each word-suffix of its
+    search terms, so "jak", "jakarta sel" and "selatan" all match "Jakarta
+    Selatan". A lookup is one dictionary access; results keep insertion
+    order, so entries added first (city summaries) rank first.
+    """
+
+    def __init__(self):
+        self.prefixes = {}
+        self.entries = []
+
+    def add(self, result, terms):
+        self.entries.append(result)
+        keys = set()
+        for term in terms:
+            words = normalize(term).split()
+            for start in range(len(words)):
+                suffix = " ".join(words[start:])[:MAX_PREFIX]
+                keys.update(suffix[:end] for end in range(1, len(suffix) + 1))
+        for key in keys:
+            self.prefixes.setdefault(key, []).append(result)
+
+    def search(self, query, limit=50):
+        """Results whose terms start with ``query``; every entry for an empty query"""
+        key = normalize(query)[:MAX_PREFIX]
+        if not key:
+            return self.entries[:limit]
+        return self.prefixes.get(key, [])[:limit]
@@ -0,0 +1,69 @@
+import statistics
+import time
+
+from aqi_sources import is_stale
+
+# Values outside this range are upstream glitches on both the AQI and PSI scales
+MIN_INDEX = 0
+MAX_INDEX = 999
+# Modified z-score above which a reading is an outlier (Iglewicz and Hoaglin)
+OUTLIER_THRESHOLD = 3.5
+# Fewer usable readings than this are too few to call any of them an outlier
+OUTLIER_MIN_SAMPLES = 4
+
+# Statuses whose values count towards averages
+USABLE = frozenset(['ok'])
+
+
+def dedupe(readings, duplicates):
+    """Yield the first reading per monitoring station uid
+
+    Station ids whose reading was dropped are added to ``duplicates``.
+    """
+    uids = set()
+    for reading in readings:
+        if reading.uid is not None:
+            if reading.uid in uids:
+                duplicates.add(reading.station.id)
+                continue
+            uids.add(reading.uid)
+        yield reading
+
+
+def validate(readings, stale_after, now=None):
+    """Yield readings with their status set from their value and age
+
+    'invalid' for a missing, non-numeric or out-of-range index, 'stale' past
+    the freshness window of ``stale_after`` seconds, otherwise 'ok'.
+    Readings already 'missing' pass through unchanged.
+    """
+    now = time.time() if now is None else now
+    for reading in readings:
+        if reading.status != 'missing':
+            value = reading.value
+            if not isinstance(value, (int, float)) or isinstance(value, bool) or not MIN_INDEX <= value <= MAX_INDEX:
+                reading.status = 'invalid'
+            elif is_stale(reading, stale_after, now):
+                reading.status = 'stale'
+            else:
+                reading.status = 'ok'
+        yield reading
+
+
+def reject_outliers(readings, threshold=OUTLIER_THRESHOLD, min_samples=OUTLIER_MIN_SAMPLES):
+    """Mark usable readings far from the median as 'outlier', returning the readings
+
+    Distance is the modified z-score 0.6745 * |x - median| / MAD. The MAD is
+    floored at 10% of the median (and 1) so that a tight cluster of a few
+    stations does not turn ordinary spatial variation into outliers.
+    """
+    values = [r.value for r in readings if r.status in USABLE]
+    if len(values) < min_samples:
+        return readings
+    median = statistics.median(values)
+    mad = statistics.median(abs(value - median) for value in values)
+    scale = max(mad, 0.1 * median, 1.0)
+    for reading in readings:
+        if reading.status in USABLE and 0.6745 * abs(reading.value - median) / scale > threshold:
+            reading.status = 'outlier'
+    return readings
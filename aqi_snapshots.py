@@ -0,0 +1,243 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from aqi_sources import Reading
+
+logger = logging.getLogger(__name__)
+
+# Keys under this prefix carry rendered view text rather than readings
+VIEW_PREFIX = 'view:'
+
+
+def encode_readings(readings):
+    """Serialise one fetch unit's normalised readings to JSON"""
+    return json.dumps([
+        {
+            'station': reading.station.id,
+            'city': reading.station.city.key,
+            'source_id': reading.station.source_id,
+            'name': reading.station.name,
+            'value': reading.value,
+            'pollutants': reading.pollutants,
+            'observed_at': reading.observed_at,
+            'observed_label': reading.observed_label,
+            'geo': reading.geo,
+            'uid': reading.uid,
+        }
+        for reading in readings
+    ], separators=(',', ':'))
+
+
+def decode_readings(payload, sources):
+    """Rebuild readings from ``encode_readings`` output against this process's registry
+
+    Stations found by another worker's bulk ingestion are registered on
+    first sight; stations of cities this registry does not know are skipped.
+    """
+    readings = []
+    for item in json.loads(payload):
+        station = sources.stations.get(item['station'])
+        if station is None:
+            city = sources.cities.get(item['city'])
+            if city is None:
+                continue
+            station = city.discover(item['station'], item['source_id'], item['name'], item['geo'])
+        readings.append(Reading(
+            station,
+            value=item['value'],
+            pollutants=item['pollutants'],
+            observed_at=item['observed_at'],
+            observed_label=item['observed_label'],
+            geo=tuple(item['geo']) if item['geo'] else None,
+            uid=item['uid']
+        ))
+    return readings
+
+
+class SqliteSnapshotStore:
+    """Latest readings per fetch unit in a SQLite file shared by workers on one host
+
+    Every publish bumps a store-wide version and stamps the rows it wrote
+    with it, so readers poll one integer and load only what changed. The
+    database runs in WAL mode, so readers never block the ingest worker.
+    Responders also queue subscription changes here for the ingest worker,
+    which owns the subscription store. Methods block, so the bot calls them
+    from worker threads (``asyncio.to_thread``); a lock serialises them on
+    the one connection.
+    """
+
+    def __init__(self, path="snapshots.db"):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=10, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS snapshots (
+                key TEXT PRIMARY KEY,
+                version INTEGER NOT NULL,
+                stored_at REAL NOT NULL,
+                payload TEXT NOT NULL
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS subscription_changes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id INTEGER NOT NULL,
+                threshold INTEGER
+            )
+        """)
+        self.conn.commit()
+
+    def version(self):
+        with self.lock:
+            return self.current_version()
+
+    def current_version(self):
+        return self.conn.execute("SELECT COALESCE(MAX(version), 0) FROM snapshots").fetchone()[0]
+
+    def publish(self, snapshots):
+        """Store ``{key: (stored_at, payload)}`` in one transaction, returning the new version"""
+        with self.lock, self.conn:
+            version = self.current_version() + 1
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO snapshots (key, version, stored_at, payload) VALUES (?, ?, ?, ?)",
+                [(key, version, stored_at, payload) for key, (stored_at, payload) in snapshots.items()]
+            )
+        return version
+
+    def load(self, since=0):
+        """Return ``(version, {key: (stored_at, payload)})`` for rows published after version ``since``"""
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT key, version, stored_at, payload FROM snapshots WHERE version > ?", (since,)
+            ).fetchall()
+        version = max((row[1] for row in rows), default=since)
+        return version, {key: (stored_at, payload) for key, _, stored_at, payload in rows}
+
+    def queue_subscription(self, chat_id, threshold):
+        """Queue a subscription change for the ingest worker; a threshold of None unsubscribes"""
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO subscription_changes (chat_id, threshold) VALUES (?, ?)", (chat_id, threshold)
+            )
+
+    def take_subscriptions(self):
+        """Remove and return the queued ``(chat_id, threshold)`` changes, oldest first"""
+        with self.lock, self.conn:
+            rows = self.conn.execute(
+                "SELECT id, chat_id, threshold FROM subscription_changes ORDER BY id"
+            ).fetchall()
+            if rows:
+                self.conn.execute("DELETE FROM subscription_changes WHERE id <= ?", (rows[-1][0],))
+        return [(chat_id, threshold) for _, chat_id, threshold in rows]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class RedisSnapshotStore:
+    """Latest readings per fetch unit in Redis, for workers on separate hosts or dynos
+
+    Payloads live in one hash next to a version counter that every publish
+    increments atomically with its writes; queued subscription changes are
+    a list beside them. Needs the optional ``redis``
+    package. Methods block on the network, so the bot calls them from
+    worker threads (``asyncio.to_thread``); the client is thread-safe.
+    """
+
+    def __init__(self, url, prefix="aqi:snapshots"):
+        try:
+            import redis
+        except ImportError:
+            raise RuntimeError("SNAPSHOT_BACKEND=redis://... needs the 'redis' package (pip install redis)")
+        self.client = redis.Redis.from_url(url)
+        self.hash_key = prefix
+        self.version_key = f"{prefix}:version"
+        self.subscriptions_key = f"{prefix}:subscriptions"
+
+    def version(self):
+        return int(self.client.get(self.version_key) or 0)
+
+    def publish(self, snapshots):
+        pipeline = self.client.pipeline(transaction=True)
+        pipeline.hset(self.hash_key, mapping={
+            key: json.dumps([stored_at, payload]) for key, (stored_at, payload) in snapshots.items()
+        })
+        pipeline.incr(self.version_key)
+        return pipeline.execute()[-1]
+
+    def load(self, since=0):
+        """Return ``(version, snapshots)``; every key is returned whenever the version moved"""
+        version = self.version()
+        if version <= since:
+            return since, {}
+        snapshots = {}
+        for key, value in self.client.hgetall(self.hash_key).items():
+            stored_at, payload = json.loads(value)
+            snapshots[key.decode()] = (stored_at, payload)
+        return version, snapshots
+
+    def queue_subscription(self, chat_id, threshold):
+        self.client.rpush(self.subscriptions_key, json.dumps([chat_id, threshold]))
+
+    def take_subscriptions(self):
+        pipeline = self.client.pipeline(transaction=True)
+        pipeline.lrange(self.subscriptions_key, 0, -1)
+        pipeline.delete(self.subscriptions_key)
+        return [tuple(json.loads(item)) for item in pipeline.execute()[0]]
+
+    def close(self):
+        self.client.close()
+
+
+def open_snapshot_store(url):
+    """Open the store named by a SNAPSHOT_BACKEND URL: ``sqlite:///path`` or ``redis://...``"""
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisSnapshotStore(url)
+    if url.startswith('sqlite:///'):
+        return SqliteSnapshotStore(url[len('sqlite:///'):])
+    raise ValueError(f"Unsupported SNAPSHOT_BACKEND {url!r} (expected sqlite:///path or redis://host)")
+
+
+class SnapshotPublisher:
+    """Tracks which cache entries have already been published and publishes the rest"""
+
+    def __init__(self, store):
+        self.store = store
+        # key -> stored_at of the entry last published
+        self.published = {}
+        # view name -> text last published
+        self.views = {}
+
+    async def publish(self, cache, keys):
+        """Publish every cached entry among ``keys`` that changed since the last call
+
+        Entries are encoded on the event loop; the store write runs in a
+        worker thread so it never stalls the loop.
+        """
+        snapshots = {}
+        for key in keys:
+            entry = cache.peek(key)
+            if entry is not None and self.published.get(key) != entry.stored_at:
+                snapshots[key] = (entry.stored_at, encode_readings(entry.value))
+        if not snapshots:
+            return 0
+        started = time.perf_counter()
+        version = await asyncio.to_thread(self.store.publish, snapshots)
+        for key, (stored_at, _) in snapshots.items():
+            self.published[key] = stored_at
+        logger.info(f"Published {len(snapshots)} snapshot(s) as version {version} "
+                    f"in {(time.perf_counter() - started) * 1000:.1f}ms")
+        return len(snapshots)
+
+    async def publish_view(self, name, text):
+        """Publish a view rendered from state only this worker has, if its text changed"""
+        if self.views.get(name) == text:
+            return False
+        await asyncio.to_thread(self.store.publish, {VIEW_PREFIX + name: (time.time(), text)})
+        self.views[name] = text
+        return True
@@ -0,0 +1,323 @@
+import json
+import time
+from datetime import datetime
+
+# Declarative registry of upstream providers and the cities/stations they
+# cover. Adding a city means adding an entry here (or to the JSON file named
+# by SOURCES_CONFIG), not writing a new fetcher.
+DEFAULT_SOURCES = {
+    'providers': {
+        'aqicn': {'type': 'aqicn', 'base_url': 'https://api.waqi.info', 'label': 'AQICN.org'},
+        'datagovsg': {'type': 'datagovsg', 'base_url': 'https://api.data.gov.sg/v1/environment/psi', 'label': 'Data.gov.sg'},
+    },
+    'cities': [
+        {
+            'key': 'jakarta', 'name': 'Jakarta', 'flag': '🇮🇩', 'provider': 'aqicn', 'scale': 'aqi',
+            # Headline is the average over stations; the report lists the first two
+            'summary': 'average', 'report_stations': 2,
+            # Reports ingest every station in this box (lat1, lon1, lat2, lon2) with
+            # one map-bounds request; the named feeds below back the details view
+            'bounds': [-6.40, 106.65, -6.08, 107.00],
+            'stations': [
+                {'id': 'jakarta'},
+                {'id': 'jakarta-selatan'},
+                {'id': 'jakarta-utara'},
+                {'id': 'jakarta-barat'},
+                {'id': 'jakarta-timur'},
+                {'id': 'jakarta-pusat'},
+            ],
+        },
+        {
+            'key': 'singapore', 'name': 'Singapore', 'flag': '🇸🇬', 'provider': 'datagovsg', 'scale': 'psi',
+            # Headline is the national reading; the report lists every region
+            'summary': 'sg-national',
+            'stations': [
+                {'id': 'sg-national', 'source_id': 'national', 'name': 'National'},
+                {'id': 'sg-north', 'source_id': 'north', 'name': 'North'},
+                {'id': 'sg-south', 'source_id': 'south', 'name': 'South'},
+                {'id': 'sg-east', 'source_id': 'east', 'name': 'East'},
+                {'id': 'sg-west', 'source_id': 'west', 'name': 'West'},
+                {'id': 'sg-central', 'source_id': 'central', 'name': 'Central'},
+            ],
+        },
+    ],
+}
+
+POLLUTANTS = ('pm25', 'pm10', 'no2', 'o3', 'co', 'so2')
+
+
+def to_number(value):
+    """Parse an upstream index/pollutant value, returning None for '-', 'N/A' and the like"""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return int(number) if number.is_integer() else number
+
+
+def parse_timestamp(value):
+    """Parse an ISO 8601 timestamp into epoch seconds, or None"""
+    try:
+        return int(datetime.fromisoformat(value).timestamp())
+    except (TypeError, ValueError):
+        return None
+
+
+class Station:
+    __slots__ = ('id', 'source_id', 'name', 'city', 'geo')
+
+    def __init__(self, id, city, source_id=None, name=None, geo=None):
+        self.id = id
+        self.city = city
+        self.source_id = source_id or id
+        self.name = name or id.title().replace('-', ' ')
+        # Optional (lat, lon); otherwise learned from the provider's readings
+        self.geo = tuple(geo) if geo else None
+
+
+class City:
+    __slots__ = ('key', 'name', 'flag', 'provider', 'scale', 'summary', 'report_stations', 'bounds',
+                 'stations', 'discovered', 'directory')
+
+    def __init__(self, key, name, flag, provider, scale, stations, summary='average', report_stations=None,
+                 bounds=None, directory=None):
+        self.key = key
+        self.name = name
+        self.flag = flag
+        self.provider = provider
+        self.scale = scale
+        self.summary = summary
+        self.report_stations = report_stations
+        self.bounds = tuple(bounds) if bounds else None
+        self.stations = [Station(city=self, **station) for station in stations]
+        # Stations found by bulk (map-bounds) ingestion, keyed by id
+        self.discovered = {}
+        # Shared id -> Station directory across every city
+        self.directory = directory if directory is not None else {}
+        self.directory.update((station.id, station) for station in self.stations)
+
+    def discover(self, id, source_id, name=None, geo=None):
+        """Return the station with ``id``, registering it on first sight"""
+        station = self.directory.get(id)
+        if station is None:
+            station = self.directory[id] = self.discovered[id] = Station(id, self, source_id, name, geo)
+        return station
+
+    def current_stations(self):
+        """Stations the report covers: those found by bulk ingestion when bounded, else the configured ones"""
+        return list(self.discovered.values()) if self.bounds else self.stations
+
+
+class Reading:
+    """Normalised reading for one station, shared by every renderer
+
+    ``value`` is the station's index on its city's scale (AQI or PSI) and
+    ``pollutants`` maps pollutant names to concentrations/sub-indices.
+    ``status`` is 'ok', 'stale', 'invalid', 'outlier' or 'missing'.
+    """
+    __slots__ = ('station', 'value', 'pollutants', 'observed_at', 'observed_label', 'geo', 'uid', 'status')
+
+    def __init__(self, station, value=None, pollutants=None, observed_at=None, observed_label=None,
+                 geo=None, uid=None, status='ok'):
+        self.station = station
+        self.value = value
+        self.pollutants = pollutants or {}
+        self.observed_at = observed_at
+        self.observed_label = observed_label
+        self.geo = geo
+        self.uid = uid
+        self.status = status
+
+    @classmethod
+    def missing(cls, station):
+        return cls(station, status='missing')
+
+
+class FetchUnit:
+    """One upstream request and the stations it answers for
+
+    Bulk units set ``city`` instead: their stations are only known once the
+    response arrives.
+    """
+    __slots__ = ('key', 'url', 'params', 'stations', 'city')
+
+    def __init__(self, key, url, params, stations, city=None):
+        self.key = key
+        self.url = url
+        self.params = params
+        self.stations = stations
+        self.city = city
+
+
+class AqicnProvider:
+    """AQICN: one map-bounds request per bounded city, or one feed request per station
+
+    Detail views always use the per-station feeds, which carry the
+    pollutant breakdown that map-bounds results lack.
+    """
+
+    def __init__(self, key, base_url, label, token=None):
+        self.key = key
+        self.base_url = base_url
+        self.label = label
+        self.token = token
+
+    def fetch_units(self, city, detail=False):
+        if city.bounds and not detail:
+            return [FetchUnit(
+                f'aqicn:bounds:{city.key}', f"{self.base_url}/map/bounds/",
+                {'latlng': ','.join(str(c) for c in city.bounds), 'token': self.token}, [], city
+            )]
+        return [
+            FetchUnit(f'aqicn:{station.source_id}', f"{self.base_url}/feed/{station.source_id}/",
+                      {'token': self.token}, [station])
+            for station in city.stations
+        ]
+
+    def parse(self, unit, payload):
+        if payload.get('status') != 'ok':
+            return None
+        if unit.city is not None:
+            return self.parse_bounds(unit, payload)
+        data = payload['data']
+        time_info = data.get('time') or {}
+        geo = (data.get('city') or {}).get('geo')
+        pollutants = {}
+        for pollutant, value in (data.get('iaqi') or {}).items():
+            number = to_number((value or {}).get('v')) if pollutant in POLLUTANTS else None
+            if number is not None:
+                pollutants[pollutant] = number
+        return [Reading(
+            unit.stations[0],
+            value=to_number(data.get('aqi')),
+            pollutants=pollutants,
+            observed_at=parse_timestamp(time_info.get('iso')),
+            observed_label=time_info.get('s'),
+            geo=(float(geo[0]), float(geo[1])) if geo and len(geo) == 2 else None,
+            uid=data.get('idx')
+        )]
+
+    def parse_bounds(self, unit, payload):
+        """One reading per station uid in a map-bounds response"""
+        readings = {}
+        for entry in payload.get('data') or []:
+            uid = entry.get('uid')
+            if uid is None or uid in readings:
+                continue
+            info = entry.get('station') or {}
+            geo = None
+            if entry.get('lat') is not None and entry.get('lon') is not None:
+                geo = (float(entry['lat']), float(entry['lon']))
+            # '@uid' is the station's own feed id, usable for a detail fetch
+            name = (info.get('name') or str(uid)).split(',')[0].strip()
+            station = unit.city.discover(f'aqicn-{uid}', f'@{uid}', name, geo)
+            readings[uid] = Reading(
+                station,
+                value=to_number(entry.get('aqi')),
+                observed_at=parse_timestamp(info.get('time')),
+                observed_label=info.get('time'),
+                geo=geo,
+                uid=uid
+            )
+        return list(readings.values())
+
+
+class DataGovSgProvider:
+    """data.gov.sg PSI: one request answers for every region"""
+
+    def __init__(self, key, base_url, label, token=None):
+        self.key = key
+        self.base_url = base_url
+        self.label = label
+
+    def fetch_units(self, city, detail=False):
+        return [FetchUnit('data.gov.sg:psi', self.base_url, None, city.stations)]
+
+    def parse(self, unit, payload):
+        items = payload.get('items') or []
+        if not items:
+            return None
+        latest = items[0]
+        readings = latest.get('readings', {})
+        psi_24h = readings.get('psi_twenty_four_hourly', {})
+        pm25_24h = readings.get('pm25_twenty_four_hourly', {})
+        locations = {
+            region.get('name'): region.get('label_location') or {}
+            for region in payload.get('region_metadata') or []
+        }
+        observed_at = parse_timestamp(latest.get('timestamp'))
+        results = []
+        for station in unit.stations:
+            if station.source_id not in psi_24h:
+                continue
+            location = locations.get(station.source_id, {})
+            geo = None
+            if 'latitude' in location and 'longitude' in location and (location['latitude'] or location['longitude']):
+                geo = (float(location['latitude']), float(location['longitude']))
+            pm25 = to_number(pm25_24h.get(station.source_id))
+            results.append(Reading(
+                station,
+                value=to_number(psi_24h.get(station.source_id)),
+                pollutants={'pm25': pm25} if pm25 is not None else {},
+                observed_at=observed_at,
+                observed_label=latest.get('timestamp'),
+                geo=geo
+            ))
+        return results
+
+
+PROVIDER_TYPES = {
+    'aqicn': AqicnProvider,
+    'datagovsg': DataGovSgProvider,
+}
+
+
+class SourceRegistry:
+    """Providers and cities built from a declarative sources config"""
+
+    def __init__(self, config, tokens=None):
+        tokens = tokens or {}
+        self.providers = {
+            key: PROVIDER_TYPES[spec['type']](key, spec['base_url'], spec['label'], tokens.get(key))
+            for key, spec in config['providers'].items()
+        }
+        # id -> Station for every city, including stations discovered at runtime
+        self.stations = {}
+        self.cities = {spec['key']: City(directory=self.stations, **spec) for spec in config['cities']}
+        if not self.cities:
+            raise ValueError("The sources config needs at least one city")
+        # The first city is the primary focus: it leads the report and drives /trend and alerts
+        self.primary = next(iter(self.cities.values()))
+
+    @classmethod
+    def load(cls, path=None, tokens=None):
+        """Load the registry from a JSON file, or the built-in defaults when ``path`` is empty"""
+        if path:
+            with open(path, encoding='utf-8') as f:
+                return cls(json.load(f), tokens)
+        return cls(DEFAULT_SOURCES, tokens)
+
+    def fetch_units(self, city, detail=False):
+        return self.providers[city.provider].fetch_units(city, detail)
+
+    def all_fetch_units(self, detail=False):
+        """Every distinct (provider, unit) behind the reports of all cities, for prefetching
+
+        With ``detail`` the units behind the detail views are included too.
+        """
+        units = {}
+        for city in self.cities.values():
+            provider = self.providers[city.provider]
+            for unit in provider.fetch_units(city) + (provider.fetch_units(city, detail=True) if detail else []):
+                units.setdefault(unit.key, (provider, unit))
+        return list(units.values())
+
+
+def is_stale(reading, window_seconds, now=None):
+    """Check whether a reading's observation time is older than ``window_seconds``"""
+    if reading.observed_at is None:
+        return False
+    now = time.time() if now is None else now
+    return now - reading.observed_at > window_seconds
@@ -0,0 +1,148 @@
+import numpy as np
+
+from aqi_history import FIELDS
+
+SPARK_CHARS = np.array(list("▁▂▃▄▅▆▇█"))
+HOUR = 3600
+DAY = 86400
+
+
+def rolling_mean(values, window):
+    """Trailing mean over ``window`` samples, ignoring NaN (NaN where the window is empty)"""
+    valid = ~np.isnan(values)
+    sums = np.cumsum(np.where(valid, values, 0.0), axis=0)
+    counts = np.cumsum(valid, axis=0)
+    sums[window:] = sums[window:] - sums[:-window]
+    counts[window:] = counts[window:] - counts[:-window]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def binned_mean(ts, values, start, width, bins):
+    """Mean of ``values`` in ``bins`` equal time buckets of ``width`` seconds from ``start``"""
+    index = ((ts - start) // width).astype(np.int64)
+    keep = (index >= 0) & (index < bins) & ~np.isnan(values)
+    sums = np.bincount(index[keep], weights=values[keep], minlength=bins)
+    counts = np.bincount(index[keep], minlength=bins)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def hour_of_day_sums(ts, groups, values, group_count, utc_offset):
+    """Per-group, per-column sums and counts of ``values`` by local hour of the day
+
+    ``values`` has one column per pollutant and ``groups`` gives each row's
+    group (station) index. One bincount over (group, column, hour) cells
+    returns two ``(group_count, columns, 24)`` arrays.
+    """
+    columns = values.shape[1]
+    hours = ((ts + utc_offset) // HOUR) % 24
+    cells = (groups[:, None] * columns + np.arange(columns)) * 24 + hours[:, None]
+    valid = ~np.isnan(values)
+    size = group_count * columns * 24
+    sums = np.bincount(cells[valid], weights=values[valid], minlength=size)
+    counts = np.bincount(cells[valid], minlength=size)
+    return sums.reshape(group_count, columns, 24), counts.reshape(group_count, columns, 24)
+
+
+def mean_of(sums, counts):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(counts > 0, sums / counts, np.nan)
+
+
+def peak_hours(profile):
+    """``(cleanest, worst)`` hour of an hour-of-day profile, or None when it is empty"""
+    if np.isnan(profile).all():
+        return None
+    return int(np.nanargmin(profile)), int(np.nanargmax(profile))
+
+
+def sparkline(values):
+    """Render values as a text sparkline; gaps (NaN) become spaces"""
+    valid = ~np.isnan(values)
+    if not valid.any():
+        return ""
+    low, high = np.nanmin(values), np.nanmax(values)
+    span = high - low if high > low else 1.0
+    levels = np.clip(((np.where(valid, values, low) - low) / span * 7).round().astype(int), 0, 7)
+    return "".join(np.where(valid, SPARK_CHARS[levels], " "))
+
+
+class SeriesTrend:
+    """Rolling statistics and the hour-of-day profile for one station/pollutant series"""
+    __slots__ = ('latest', 'mean', 'minimum', 'maximum', 'recent_mean', 'previous_mean', 'spark', 'profile')
+
+    def __init__(self, ts, values, now, days, points, profile):
+        valid = values[~np.isnan(values)]
+        self.latest = valid[-1] if valid.size else np.nan
+        self.mean = valid.mean() if valid.size else np.nan
+        self.minimum = valid.min() if valid.size else np.nan
+        self.maximum = valid.max() if valid.size else np.nan
+        # Rolling 24-sample (hourly data: 24h) mean now vs one day earlier
+        rolling = rolling_mean(values, 24)
+        recent_mask = ts >= now - DAY
+        previous_mask = (ts >= now - 2 * DAY) & ~recent_mask
+        self.recent_mean = rolling[recent_mask][-1] if recent_mask.any() else np.nan
+        self.previous_mean = rolling[previous_mask][-1] if previous_mask.any() else np.nan
+        start = now - days * DAY
+        self.spark = sparkline(binned_mean(ts, values, start, days * DAY // points, points))
+        # Mean for each local hour of the day (24 entries, NaN where unseen)
+        self.profile = profile
+
+    @property
+    def direction(self):
+        """↗ worse, ↘ better, → steady (within 5%), or '' when there is no history"""
+        if np.isnan(self.recent_mean) or np.isnan(self.previous_mean) or self.previous_mean == 0:
+            return ""
+        change = (self.recent_mean - self.previous_mean) / self.previous_mean
+        if change > 0.05:
+            return "↗"
+        if change < -0.05:
+            return "↘"
+        return "→"
+
+
+def build_trends(history, stations, now, days=7, points=14, pollutants=('aqi', 'pm25'), utc_offset=7 * HOUR):
+    """Compute per-station and city-wide trends from the history store
+
+    Returns ``(per_station, citywide)`` where ``per_station`` maps station ->
+    {pollutant: SeriesTrend} and ``citywide`` maps pollutant -> SeriesTrend
+    over all stations. Hour-of-day profiles for every station and pollutant
+    come from one bincount over all samples; the city-wide profiles pool
+    the stations' sums and counts.
+    """
+    start = now - days * DAY
+    columns = [FIELDS.index(p) for p in pollutants]
+    series = []
+    for station in stations:
+        ts, values = history.query_arrays(station, start, now + 1)
+        if ts.size:
+            series.append((station, ts, values[:, columns].astype(np.float64)))
+    if not series:
+        return {}, {}
+
+    ts = np.concatenate([station_ts for _, station_ts, _ in series])
+    values = np.concatenate([station_values for _, _, station_values in series])
+    groups = np.repeat(np.arange(len(series)), [station_ts.size for _, station_ts, _ in series])
+    sums, counts = hour_of_day_sums(ts, groups, values, len(series), utc_offset)
+    profiles = mean_of(sums, counts)
+    city_profiles = mean_of(sums.sum(axis=0), counts.sum(axis=0))
+
+    per_station = {
+        station: {
+            pollutant: SeriesTrend(station_ts, station_values[:, i], now, days, points, profiles[g, i])
+            for i, pollutant in enumerate(pollutants)
+        }
+        for g, (station, station_ts, station_values) in enumerate(series)
+    }
+
+    order = np.argsort(ts, kind='stable')
+    ts, values = ts[order], values[order]
+    # City-wide series: mean across stations per hour
+    hours = np.unique((ts - start) // HOUR)
+    hour_ts = start + hours * HOUR
+    citywide = {}
+    for i, pollutant in enumerate(pollutants):
+        hourly = binned_mean(ts, values[:, i], start, HOUR, days * 24 + 1)[hours]
+        citywide[pollutant] = SeriesTrend(hour_ts, hourly, now, days, points, city_profiles[i])
+    return per_station, citywide
@@ -0,0 +1,726 @@
+"""Benchmarks for the Jakarta AQI bot against local stub upstreams.
+
+Run with ``python benchmark.py``. No network access or real tokens are needed:
+the AQICN and data.gov.sg endpoints are replaced by the local stub server in
+``tests/stubs.py``, which answers after a configurable delay.
+
+``python benchmark.py load [--count N] [--concurrency N] [--upstream-delay S]
+[--error-rate F] [--api-delay S] [--fixtures DIR]`` replays synthetic /aqi
+commands and button presses through the real Application built by
+``JakartaAQIBot.build_application``, against the stub upstreams and a fake
+Bot API, and reports p50/p95/p99 latency and throughput.
+
+``python benchmark.py replay --url URL --secret SECRET [--updates FILE]``
+replays recorded (JSON lines) or synthetic updates into a bot running with
+BOT_MODE=webhook and reports webhook throughput.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+
+import httpx
+
+os.environ.setdefault("SUBSCRIPTIONS_DB", ":memory:")
+os.environ.setdefault("HISTORY_DB", ":memory:")
+
+from jakarta_air_bot import JakartaAQIBot
+from tests.stubs import (
+    MAP_BOUNDS_FEED, OBSERVED, STATIONS, FakeBot, FakeCallbackQuery, FakeInlineQuery, FakeUpdate, make_bot,
+    percentile, replay_load, start_stub_server, station_feed, synthetic_updates, time_aqi_commands
+)
+
+STUB_DELAY = float(os.getenv("BENCH_STUB_DELAY", "0.2"))
+CONCURRENCY = int(os.getenv("BENCH_CONCURRENCY", "20"))
+SUBSCRIBERS = int(os.getenv("BENCH_SUBSCRIBERS", "100"))
+
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+def load_fixtures(directory):
+    """Load recorded payloads from ``psi.json``, ``map_bounds.json`` and ``feed_<name>.json``"""
+    fixtures = {}
+    for filename in os.listdir(directory):
+        if not filename.endswith(".json"):
+            continue
+        name = filename[:-len(".json")]
+        if name == "map_bounds":
+            key = "map/bounds"
+        elif name.startswith("feed_"):
+            key = f"feed/{name[len('feed_'):]}"
+        else:
+            key = name
+        with open(os.path.join(directory, filename)) as f:
+            fixtures[key] = json.load(f)
+    return fixtures
+
+
+async def bench_concurrent_aqi():
+    """Show that concurrent /aqi commands do not block one another"""
+    server = start_stub_server(STUB_DELAY)
+    try:
+        bot = make_bot(server)
+        single = await time_aqi_commands(bot, 1)
+        bot.cache.entries.clear()
+        concurrent = await time_aqi_commands(bot, CONCURRENCY)
+        await bot.close()
+    finally:
+        server.shutdown()
+    print(f"/aqi x1: {single:.2f}s | /aqi x{CONCURRENCY} concurrent: {concurrent:.2f}s "
+          f"({concurrent / single:.1f}x a single call)")
+
+
+async def bench_cache_coalescing():
+    """Show that simultaneous cold requests share one upstream fetch per station"""
+    server = start_stub_server(STUB_DELAY)
+    try:
+        bot = make_bot(server)
+        cold = await time_aqi_commands(bot, CONCURRENCY)
+        warm = await time_aqi_commands(bot, CONCURRENCY)
+        await bot.close()
+    finally:
+        server.shutdown()
+    stats = bot.cache.stats()
+    print(f"cache: {CONCURRENCY} cold /aqi {cold:.2f}s, {CONCURRENCY} warm /aqi {warm:.3f}s | "
+          f"{stats['upstream_fetches']} upstream fetches, hit ratio {stats['hit_ratio']:.1%}")
+
+
+async def naive_report(bot):
+    """Fetch a report the way the bot used to: a fresh connection per request, no validators"""
+    for _, unit in bot.sources.all_fetch_units():
+        async with httpx.AsyncClient(headers={"Accept-Encoding": "identity"}) as client:
+            (await client.get(unit.url, params=unit.params)).json()
+
+
+async def bench_connection_reuse(reports=10):
+    """Compare connections and bytes per report for naive and pooled upstream clients"""
+    server = start_stub_server(delay=0.01)
+    try:
+        bot = make_bot(server)
+        for _ in range(reports):
+            await naive_report(bot)
+        naive = dict(server.counters)
+
+        server.reset_counters()
+        for _ in range(reports):
+            await bot.prefetch_all()
+        pooled = dict(server.counters)
+        await bot.close()
+    finally:
+        server.shutdown()
+    for label, counters in (("naive", naive), ("pooled", pooled)):
+        print(f"{label:>6}: {counters['connections'] / reports:.1f} connections and "
+              f"{counters['bytes_sent'] / reports:.0f} body bytes per report")
+
+
+async def bench_alert_fanout():
+    """Time a threshold alert fan-out to every subscriber at Telegram-safe rates"""
+    bot = JakartaAQIBot("bench-telegram-token", "bench-aqicn-token")
+    for chat_id in range(SUBSCRIBERS):
+        bot.subscriptions.subscribe(chat_id, 100)
+    fake_bot = FakeBot()
+    started = time.perf_counter()
+    sent = await bot.dispatcher.dispatch(fake_bot, 160, bot.format_alert_message)
+    elapsed = time.perf_counter() - started
+    peak = max(sum(1 for t, _ in fake_bot.sent if s <= t < s + 1) for s, _ in fake_bot.sent)
+    await bot.close()
+    print(f"alerts: {sent} subscribers notified in {elapsed:.2f}s, peak {peak} msg/s")
+
+
+async def bench_render_cache(iterations=2000):
+    """Compare the cost of rendering the report against serving it from the render cache"""
+    server = start_stub_server(delay=0.01)
+    try:
+        bot = make_bot(server)
+        report = await bot.fetch_cities()
+        started = time.perf_counter()
+        for _ in range(iterations):
+            bot.format_aqi_message(report)
+        render_us = (time.perf_counter() - started) / iterations * 1e6
+
+        version = bot.cache.version
+        build = lambda: bot.format_aqi_message(report)
+        started = time.perf_counter()
+        for _ in range(iterations):
+            bot.render('report', version, build)
+        cached_us = (time.perf_counter() - started) / iterations * 1e6
+
+        await bot.get_report_message()
+        started = time.perf_counter()
+        for _ in range(iterations):
+            await bot.get_report_message()
+        request_us = (time.perf_counter() - started) / iterations * 1e6
+        await bot.close()
+    finally:
+        server.shutdown()
+    print(f"render: {render_us:.1f}us to format a report, {cached_us:.2f}us on a render cache hit, "
+          f"{request_us:.1f}us per warm fetch+render")
+
+
+async def replay_webhook(url, secret, updates, concurrency=50):
+    """POST updates to a webhook endpoint and report latency and throughput"""
+    queue = asyncio.Queue()
+    for update in updates:
+        queue.put_nowait(update)
+    latencies = []
+    failures = 0
+
+    async def worker(client):
+        nonlocal failures
+        while not queue.empty():
+            update = queue.get_nowait()
+            started = time.perf_counter()
+            response = await client.post(url, json=update, headers={"X-Telegram-Bot-Api-Secret-Token": secret})
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                failures += 1
+
+    started = time.perf_counter()
+    async with httpx.AsyncClient(timeout=30) as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    print(f"replay: {len(updates)} updates in {elapsed:.2f}s ({len(updates) / elapsed:.0f} updates/s), "
+          f"{failures} rejected | p50 {percentile(latencies, 50) * 1000:.1f}ms "
+          f"p95 {percentile(latencies, 95) * 1000:.1f}ms p99 {percentile(latencies, 99) * 1000:.1f}ms")
+
+
+async def load_test(count=2000, concurrency=100, upstream_delay=STUB_DELAY, error_rate=0.0, api_delay=0.02,
+                    fixtures=None):
+    """Replay synthetic updates through the real Application handlers and report latency"""
+    results = await replay_load(count, concurrency, upstream_delay, error_rate, api_delay, fixtures)
+    calls = ", ".join(f"{method} {n}" for method, n in sorted(results["calls"].items()))
+    print(f"load: {count} updates at concurrency {concurrency} in {results['elapsed']:.2f}s "
+          f"({results['throughput']:.0f} updates/s), {results['errors']} handler errors | "
+          f"p50 {results['p50'] * 1000:.1f}ms p95 {results['p95'] * 1000:.1f}ms p99 {results['p99'] * 1000:.1f}ms")
+    print(f"      upstream {results['upstream_requests']} requests ({results['upstream_errors']} failed) | "
+          f"Bot API: {calls}")
+    return results
+
+
+def load_updates(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def bench_trend(days=30):
+    """Time /trend statistics over ``days`` of hourly history for every station"""
+    bot = JakartaAQIBot("bench-telegram-token", "bench-aqicn-token")
+    bot.trend_days = days
+    now = int(time.time()) // 3600 * 3600
+    # Discover the Jakarta stations the way a map-bounds refresh would
+    city = bot.sources.cities["jakarta"]
+    provider = bot.sources.providers["aqicn"]
+    provider.parse(provider.fetch_units(city)[0], MAP_BOUNDS_FEED)
+    stations = [station.id for station in city.current_stations()]
+    bot.history.record_many([
+        (station, now - hour * 3600, {"aqi": random.uniform(30, 180), "pm25": random.uniform(10, 90)})
+        for station in stations
+        for hour in range(days * 24)
+    ])
+    runs = 20
+    started = time.perf_counter()
+    for _ in range(runs):
+        message = bot.format_trend_message()
+    elapsed_ms = (time.perf_counter() - started) / runs * 1000
+    print(f"trend: {days} days x {len(stations)} stations in {elapsed_ms:.1f}ms "
+          f"({len(message)} chars)")
+
+
+async def bench_bulk_ingestion():
+    """Compare upstream requests and the Jakarta average for map-bounds and per-feed ingestion"""
+    server = start_stub_server(delay=0.01)
+    results = {}
+    try:
+        for mode in ("bounds", "feeds"):
+            bot = make_bot(server)
+            city = bot.sources.cities["jakarta"]
+            if mode == "feeds":
+                city.bounds = None
+            server.reset_counters()
+            readings = await bot.fetch_city("jakarta")
+            results[mode] = (server.counters["requests"], len(readings), bot.city_summary(city, readings))
+            await bot.close()
+    finally:
+        server.shutdown()
+
+    distinct = {uid: aqi for uid, aqi, *_ in STATIONS.values()}
+    expected = int(sum(distinct.values()) / len(distinct))
+    naive = int(sum(aqi for _, aqi, *_ in STATIONS.values()) / len(STATIONS))
+    assert results["bounds"][2] == results["feeds"][2] == expected
+    print(f"bulk: map-bounds {results['bounds'][0]} request(s) for {results['bounds'][1]} stations vs "
+          f"{results['feeds'][0]} feed requests | average AQI {expected} (undeduplicated feeds gave {naive})")
+
+
+async def bench_quality(samples=10000):
+    """Average a map-bounds answer with glitches in it, and time the quality pipeline"""
+    from aqi_quality import dedupe, reject_outliers, validate
+    from aqi_sources import Reading, Station
+
+    dirty = {"status": "ok", "data": MAP_BOUNDS_FEED["data"] + [
+        {"lat": -6.1545, "lon": 106.8456, "uid": 20001, "aqi": "480",
+         "station": {"name": "Kemayoran (sensor fault)", "time": OBSERVED.isoformat()}},
+        {"lat": -6.2000, "lon": 106.8200, "uid": 20002, "aqi": "1200",
+         "station": {"name": "Menteng (glitch)", "time": OBSERVED.isoformat()}},
+        {"lat": -6.2600, "lon": 106.8100, "uid": 20003, "aqi": "n/a",
+         "station": {"name": "Kebayoran", "time": OBSERVED.isoformat()}},
+        {"lat": -6.1300, "lon": 106.7500, "uid": 20004, "aqi": "140",
+         "station": {"name": "Cengkareng", "time": (OBSERVED - timedelta(hours=6)).isoformat()}},
+    ]}
+    server = start_stub_server(delay=0.01, fixtures={"map/bounds": dirty})
+    try:
+        bot = make_bot(server)
+        city = bot.sources.cities["jakarta"]
+        readings = await bot.fetch_city("jakarta")
+        await bot.close()
+    finally:
+        server.shutdown()
+    # What a plain average over every numeric value would have reported
+    naive = [r.value for r in readings if isinstance(r.value, (int, float))]
+    statuses = {}
+    for reading in readings:
+        statuses[reading.status] = statuses.get(reading.status, 0) + 1
+    summary = bot.city_summary(city, readings)
+    assert summary == 95 and statuses == {"ok": 5, "outlier": 1, "invalid": 3, "stale": 1}
+
+    rng = random.Random(3)
+    station = Station("bench", city)
+    now = time.time()
+    stream = [
+        Reading(station, value=rng.choice((rng.gauss(90, 15), 900, "-")) if i % 50 == 0 else rng.gauss(90, 15),
+                observed_at=now - rng.choice((600, 600, 600, 30000)), uid=i // 2)
+        for i in range(samples)
+    ]
+    started = time.perf_counter()
+    cleaned = reject_outliers(list(validate(dedupe(stream, set()), bot.stale_after_minutes * 60, now)))
+    per_reading_us = (time.perf_counter() - started) * 1e6 / samples
+    print(f"quality: Jakarta average {summary} from {statuses['ok']} ok readings "
+          f"({statuses['outlier']} outlier, {statuses['invalid']} invalid, {statuses['stale']} stale) "
+          f"vs {int(sum(naive) / len(naive))} unfiltered | pipeline {per_reading_us:.2f}us per reading "
+          f"over {len(cleaned)} deduplicated readings")
+
+
+async def bench_nearest(stations=5000, lookups=2000):
+    """Time nearest-station lookups through the spatial index against a linear scan"""
+    import math
+
+    from aqi_geo import StationIndex
+
+    rng = random.Random(42)
+    positions = {f"station-{i}": (rng.uniform(-11, 20), rng.uniform(95, 141)) for i in range(stations)}
+    index = StationIndex(positions)
+    started = time.perf_counter()
+    index.rebuild()
+    build_ms = (time.perf_counter() - started) * 1000
+    queries = [(rng.uniform(-11, 20), rng.uniform(95, 141)) for _ in range(lookups)]
+
+    def haversine(lat1, lon1, lat2, lon2):
+        dlat, dlon = math.radians(lat2 - lat1), math.radians(lon2 - lon1)
+        a = math.sin(dlat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlon / 2) ** 2
+        return 2 * 6371.0 * math.asin(math.sqrt(a))
+
+    started = time.perf_counter()
+    found = [index.nearest(lat, lon, k=3) for lat, lon in queries]
+    indexed_us = (time.perf_counter() - started) / lookups * 1e6
+    started = time.perf_counter()
+    scanned = [
+        sorted(positions, key=lambda key: haversine(lat, lon, *positions[key]))[:3]
+        for lat, lon in queries[:100]
+    ]
+    scan_us = (time.perf_counter() - started) / 100 * 1e6
+    assert all([key for key, _ in f] == s for f, s in zip(found, scanned))
+
+    # End to end: a location shared from central Singapore
+    server = start_stub_server(delay=0.01)
+    try:
+        bot = make_bot(server)
+        update = FakeUpdate(SimpleNamespace(latitude=1.3521, longitude=103.8198))
+        await bot.location_command(update, None)
+        await bot.close()
+    finally:
+        server.shutdown()
+    assert "Central" in update.message.replies[-1]
+    print(f"nearest: {stations} stations indexed in {build_ms:.1f}ms, {indexed_us:.1f}us per lookup "
+          f"vs {scan_us:.0f}us per linear scan")
+
+
+async def bench_metrics():
+    """Scrape /metrics after a few /aqi commands and show where the time went"""
+    from metrics import FORMAT_SECONDS, HANDLER_SECONDS, REGISTRY, UPSTREAM_SECONDS, MetricsServer
+
+    server = start_stub_server(STUB_DELAY)
+    try:
+        bot = make_bot(server)
+        bot.metrics_server = MetricsServer(REGISTRY, "127.0.0.1", 0)
+        await bot.startup()
+        port = bot.metrics_server.server.sockets[0].getsockname()[1]
+        bot.prefetch_task.cancel()
+        for _ in range(5):
+            await bot.aqi_command(FakeUpdate(), None)
+        async with httpx.AsyncClient() as client:
+            response = await client.get(f"http://127.0.0.1:{port}/metrics")
+        await bot.close()
+    finally:
+        server.shutdown()
+    assert response.status_code == 200 and "aqi_handler_seconds_bucket" in response.text
+
+    def mean_ms(histogram, **labels):
+        key = tuple(labels[name] for name in histogram.labelnames) if labels else None
+        totals = [(total, count) for k, (_, total, count) in histogram.values.items() if key in (None, k)]
+        return sum(t for t, _ in totals) / max(1, sum(c for _, c in totals)) * 1000
+
+    print(f"metrics: {len(response.content)} bytes scraped | mean aqi_command "
+          f"{mean_ms(HANDLER_SECONDS, handler='aqi_command'):.1f}ms, "
+          f"upstream request {mean_ms(UPSTREAM_SECONDS):.1f}ms, format {mean_ms(FORMAT_SECONDS):.3f}ms")
+
+
+async def bench_degraded_upstream():
+    """Show /aqi failing fast to the cached snapshot once an upstream stops answering"""
+    server = start_stub_server(delay=0.05)
+    try:
+        bot = make_bot(server)
+        # Learn the host's normal latency, then let every cached entry expire
+        for _ in range(6):
+            await bot.prefetch_all()
+        upstream = next(iter(bot.upstreams.values()))
+        learned_timeout = upstream.adaptive_timeout.current()
+        for entry in bot.cache.entries.values():
+            entry.fetched_at -= bot.cache.ttl + bot.cache.stale_ttl
+
+        # Degraded but still under the timeout cap
+        server.delay = 5
+        timings = []
+        update = FakeUpdate()
+        while upstream.breaker.state != "open" and len(timings) < 10:
+            started = time.perf_counter()
+            await bot.aqi_command(update, None)
+            timings.append(time.perf_counter() - started)
+        assert upstream.breaker.state == "open"
+        started = time.perf_counter()
+        await bot.aqi_command(update, None)
+        open_ms = (time.perf_counter() - started) * 1000
+        await bot.close()
+    finally:
+        server.delay = 0
+        server.shutdown()
+    assert "Data as of" in update.message.replies[-1]
+    print(f"degraded: adaptive timeout {learned_timeout:.1f}s (cap {bot.station_timeout:.0f}s), "
+          f"{len(timings)} /aqi at {max(timings):.1f}s until the circuit opened, then {open_ms:.1f}ms "
+          f"from the cached snapshot")
+
+
+async def bench_inline(queries=5000):
+    """Answer keystroke-by-keystroke inline queries and check none reaches an upstream"""
+
+    server = start_stub_server(delay=0.01)
+    try:
+        bot = make_bot(server)
+        await bot.fetch_cities()
+        started = time.perf_counter()
+        bot.build_inline_index()
+        build_ms = (time.perf_counter() - started) * 1000
+        server.reset_counters()
+
+        typed = [word[:end] for word in ("jakarta", "singapore", "jakarta south", "central", "timur")
+                 for end in range(1, len(word) + 1)]
+        updates = [SimpleNamespace(inline_query=FakeInlineQuery(typed[i % len(typed)])) for i in range(queries)]
+        started = time.perf_counter()
+        for update in updates:
+            await bot.inline_query(update, None)
+        per_query_us = (time.perf_counter() - started) / queries * 1e6
+        await bot.close()
+    finally:
+        server.shutdown()
+    assert server.counters["requests"] == 0
+    answer = next(u.inline_query for u in updates if u.inline_query.query == "singapore")
+    assert answer.results[0].id == "city:singapore"
+    print(f"inline: index built in {build_ms:.1f}ms, {per_query_us:.1f}us per query, "
+          f"0 upstream requests for {queries} queries, cache_time {answer.cache_time}s")
+
+
+async def bench_button_spam(taps=30):
+    """Hammer the Refresh button from one user and count Bot API and upstream calls"""
+    server = start_stub_server(delay=0.1)
+    try:
+        bot = make_bot(server)
+        message = SimpleNamespace(chat=SimpleNamespace(id=42), message_id=7)
+        log = []
+
+        def press():
+            update = SimpleNamespace(callback_query=FakeCallbackQuery("check_aqi", 42, message, log))
+            return bot.button_callback(update, None)
+
+        # A burst of taps while the first answer is still loading, then steady tapping on warm data
+        await asyncio.gather(*(press() for _ in range(taps)))
+        for _ in range(taps):
+            await press()
+            await asyncio.sleep(0.05)
+        await bot.close()
+    finally:
+        server.shutdown()
+    edits = sum(1 for kind, _ in log if kind == "edit")
+    limited = sum(1 for kind, text in log if kind == "answer" and text)
+    print(f"buttons: {2 * taps} Refresh taps -> {edits} edits (unthrottled: {4 * taps}), {limited} rate-limited, "
+          f"{server.counters['requests']} upstream requests")
+
+
+def button_data(markup, label):
+    """callback_data of the first button whose label contains ``label``"""
+    return next(b.callback_data for row in markup.inline_keyboard for b in row if label in b.text)
+
+
+async def bench_callbacks(stations=60, decodes=100000):
+    """Page through a large city, drill into a station and time callback routing"""
+    import copy
+
+    from aqi_callbacks import MAX_BYTES
+    from aqi_sources import DEFAULT_SOURCES, SourceRegistry
+    from ratelimit import KeyedRateLimiter
+
+    config = copy.deepcopy(DEFAULT_SOURCES)
+    # One station id too long to carry inline, to exercise the server-side state
+    ids = [f"greater-jakarta-{i:02d}" for i in range(stations - 1)] + ["greater-jakarta-" + "x" * 60]
+    config["cities"].append({
+        "key": "greater-jakarta", "name": "Greater Jakarta", "flag": "🏙", "provider": "aqicn", "scale": "aqi",
+        "stations": [{"id": station_id, "name": f"Station {i}"} for i, station_id in enumerate(ids)],
+    })
+    fixtures = {}
+    for i, station_id in enumerate(ids):
+        feed = station_feed("jakarta")
+        feed["data"] = dict(feed["data"], idx=100000 + i, aqi=50 + i)
+        fixtures[f"feed/{station_id}"] = feed
+
+    server = start_stub_server(delay=0.01, fixtures=fixtures)
+    try:
+        bot = make_bot(server)
+        bot.sources = SourceRegistry(config, tokens={"aqicn": "bench-aqicn-token"})
+        host, port = server.server_address
+        bot.sources.providers["aqicn"].base_url = f"http://{host}:{port}"
+        bot.sources.providers["datagovsg"].base_url = f"http://{host}:{port}/psi"
+        bot.user_limiter = bot.chat_limiter = KeyedRateLimiter(1e6, 1e6)
+        message = SimpleNamespace(chat=SimpleNamespace(id=42), message_id=7)
+        log = []
+
+        async def press(data):
+            query = FakeCallbackQuery(data, 42, message, log)
+            await bot.button_callback(SimpleNamespace(callback_query=query), None)
+            return query
+
+        query = await press(bot.callbacks.encode("d", "greater-jakarta", 0))
+        pages, longest, callback_bytes = 1, len(log[-1][1]), []
+        while True:
+            callback_bytes += [len(b.callback_data.encode()) for row in query.reply_markup.inline_keyboard for b in row]
+            if not any("Next" in b.text for row in query.reply_markup.inline_keyboard for b in row):
+                break
+            query = await press(button_data(query.reply_markup, "Next"))
+            pages += 1
+            longest = max(longest, len(log[-1][1]))
+        query = await press(button_data(query.reply_markup, f"Station {stations - 1}"))
+        assert f"Station {stations - 1}" in log[-1][1] and bot.callbacks.states
+        query = await press(button_data(query.reply_markup, "Back"))
+        assert f"Page {pages}/{pages}" in log[-1][1]
+
+        await press("back_to_menu")
+        assert log[-1][1].startswith("\n🌟")
+        await press("v0|r")
+        assert ("answer", "⌛ This button has expired.") in log
+
+        bot.details_page_size = stations
+        unpaginated = len(bot.format_city_details("greater-jakarta", await bot.fetch_city("greater-jakarta", True)))
+        data = ["v1|r", "v1|d|jakarta|1", "v1|s|jakarta-selatan", button_data(query.reply_markup, "Refresh"), "check_aqi"]
+        started = time.perf_counter()
+        for i in range(decodes):
+            view, args = bot.callbacks.decode(data[i % len(data)])
+            handler, arity = bot.views[view]
+        route_us = (time.perf_counter() - started) * 1e6 / decodes
+        await bot.close()
+    finally:
+        server.shutdown()
+    assert max(callback_bytes) <= MAX_BYTES and longest < 4096 < unpaginated
+    print(f"callbacks: {stations} stations in {pages} pages of at most {longest} chars (unpaginated {unpaginated}), "
+          f"callback_data at most {max(callback_bytes)} bytes, {len(bot.callbacks.states)} kept server-side | "
+          f"decode+route {route_us:.2f}us")
+
+
+async def bench_shared_snapshots(responders=2, commands=200):
+    """One ingest worker publishes to a SQLite snapshot store; responders answer from it"""
+    from aqi_snapshots import SnapshotPublisher, SqliteSnapshotStore
+
+    server = start_stub_server(delay=0.05)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "snapshots.db")
+        try:
+            ingest = make_bot(server)
+            ingest.role = "ingest"
+            ingest.snapshots = SqliteSnapshotStore(path)
+            ingest.publisher = SnapshotPublisher(ingest.snapshots)
+            failed = await ingest.prefetch_all()
+            ingest_requests = server.counters["requests"]
+            expected, _ = await ingest.get_details_view("jakarta")
+
+            server.reset_counters()
+            workers = []
+            for _ in range(responders):
+                bot = make_bot(server)
+                bot.role = "responder"
+                bot.snapshots = SqliteSnapshotStore(path)
+                workers.append(bot)
+            started = time.perf_counter()
+            loaded = [await bot.sync_snapshots() for bot in workers]
+            sync_ms = (time.perf_counter() - started) * 1000 / responders
+
+            started = time.perf_counter()
+            for bot in workers:
+                await time_aqi_commands(bot, commands)
+            elapsed = time.perf_counter() - started
+            assert all([(await bot.get_details_view("jakarta"))[0] == expected for bot in workers])
+            await ingest.close()
+            for bot in workers:
+                await bot.close()
+        finally:
+            server.shutdown()
+    assert failed == 0 and server.counters["requests"] == 0
+    print(f"snapshots: ingest made {ingest_requests} upstream requests and published {len(loaded[0])} units | "
+          f"{responders} responders synced in {sync_ms:.1f}ms each, answered {responders * commands} /aqi "
+          f"in {elapsed:.2f}s with {server.counters['requests']} upstream requests")
+
+
+# Runs in a fresh interpreter so the import cost is measured cold
+FIRST_RESPONSE_SCRIPT = """
+import sys, time
+started = time.perf_counter()
+import jakarta_air_bot
+imported = time.perf_counter() - started
+import benchmark
+benchmark.first_response(float(sys.argv[1]), imported, sys.argv[2])
+"""
+
+
+def first_response(spawned_at, imported, upstream):
+    """Boot a bot like ``run`` does and answer one /aqi, printing the timings as JSON"""
+    async def boot():
+        host, port = upstream.rsplit(":", 1)
+        bot = make_bot(SimpleNamespace(server_address=(host, int(port))))
+        bot.build_application()
+        await bot.startup(None)
+        update = FakeUpdate()
+        await bot.aqi_command(update, None)
+        elapsed = time.time() - spawned_at
+        await bot.close()
+        return elapsed, update.message.replies[-1]
+
+    elapsed, reply = asyncio.run(boot())
+    print(json.dumps({
+        "import": imported,
+        "first_response": elapsed,
+        "numpy_loaded": "numpy" in sys.modules,
+        "as_of": "Data as of" in reply,
+    }))
+
+
+def time_first_response(server, env, runs):
+    """Median timings of ``runs`` cold bot processes against the stub server"""
+    host, port = server.server_address
+    results = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", FIRST_RESPONSE_SCRIPT, repr(time.time()), f"{host}:{port}"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), env=env, capture_output=True, text=True, check=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return {
+        key: statistics.median(r[key] for r in results) if key in ("import", "first_response") else results[0][key]
+        for key in results[0]
+    }
+
+
+async def bench_startup(runs=3):
+    """Time-to-first-response of a fresh process, cold and with a restored snapshot"""
+    from aqi_snapshots import SnapshotPublisher, SqliteSnapshotStore
+
+    server = start_stub_server(STUB_DELAY)
+    env = dict(os.environ, SUBSCRIPTIONS_DB=":memory:", HISTORY_DB=":memory:", PREFETCH_ENABLED="0")
+    env.pop("SNAPSHOT_BACKEND", None)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "snapshots.db")
+        try:
+            cold = time_first_response(server, env, runs)
+
+            # A previous run's published readings, an hour old
+            bot = make_bot(server)
+            bot.snapshots = SqliteSnapshotStore(path)
+            bot.publisher = SnapshotPublisher(bot.snapshots)
+            await bot.prefetch_all()
+            with bot.snapshots.conn:
+                bot.snapshots.conn.execute("UPDATE snapshots SET stored_at = stored_at - 3600")
+            await bot.close()
+
+            server.reset_counters()
+            restored = time_first_response(server, dict(env, SNAPSHOT_BACKEND=f"sqlite:///{path}"), runs)
+        finally:
+            server.shutdown()
+    assert restored["as_of"] and not cold["as_of"] and not cold["numpy_loaded"]
+    print(f"startup: import {cold['import'] * 1000:.0f}ms (numpy deferred) | first /aqi "
+          f"{cold['first_response'] * 1000:.0f}ms after spawn cold vs {restored['first_response'] * 1000:.0f}ms "
+          f"from a restored snapshot (labelled as of its capture time)")
+
+
+async def run_benchmarks():
+    await bench_concurrent_aqi()
+    await bench_cache_coalescing()
+    await bench_connection_reuse()
+    await bench_alert_fanout()
+    await bench_render_cache()
+    bench_trend()
+    await bench_bulk_ingestion()
+    await bench_quality()
+    await bench_nearest()
+    await bench_metrics()
+    await bench_degraded_upstream()
+    await bench_inline()
+    await bench_button_spam()
+    await bench_callbacks()
+    await bench_shared_snapshots()
+    await bench_startup()
+    await load_test(count=1000, concurrency=20)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command")
+    replay = subparsers.add_parser("replay", help="replay updates into a running webhook")
+    replay.add_argument("--url", required=True, help="webhook URL, e.g. http://127.0.0.1:8443/telegram")
+    replay.add_argument("--secret", required=True, help="the bot's WEBHOOK_SECRET")
+    replay.add_argument("--updates", help="JSON lines file of recorded updates (default: synthetic)")
+    replay.add_argument("--count", type=int, default=1000, help="number of synthetic updates")
+    replay.add_argument("--concurrency", type=int, default=50)
+    load = subparsers.add_parser("load", help="replay updates through the Application against local stubs")
+    load.add_argument("--count", type=int, default=5000, help="number of synthetic updates")
+    load.add_argument("--concurrency", type=int, default=100)
+    load.add_argument("--upstream-delay", type=float, default=STUB_DELAY, help="stub upstream latency (seconds)")
+    load.add_argument("--error-rate", type=float, default=0.0, help="share of upstream requests answered 503")
+    load.add_argument("--api-delay", type=float, default=0.02, help="fake Bot API latency (seconds)")
+    load.add_argument("--fixtures", help="directory of recorded upstream payloads")
+    args = parser.parse_args()
+
+    if args.command == "load":
+        fixtures = load_fixtures(args.fixtures) if args.fixtures else None
+        asyncio.run(load_test(args.count, args.concurrency, args.upstream_delay, args.error_rate,
+                              args.api_delay, fixtures))
+    elif args.command == "replay":
+        updates = load_updates(args.updates) if args.updates else synthetic_updates(args.count)
+        asyncio.run(replay_webhook(args.url, args.secret, updates, args.concurrency))
+    else:
+        asyncio.run(run_benchmarks())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import logging
+import time
+from collections import deque
+
+from metrics import CIRCUIT_TRANSITIONS
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+# Numeric encoding for the state gauge
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of making a request while a host's circuit is open"""
+
+    def __init__(self, name, retry_in):
+        super().__init__(f"circuit for {name} is open, retrying in {retry_in:.0f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """Closed/open/half-open circuit breaker for one upstream host
+
+    After ``failure_threshold`` consecutive failures the circuit opens and
+    requests fail immediately. Once ``reset_timeout`` seconds have passed a
+    single probe request is let through (half-open): success closes the
+    circuit, failure opens it again.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+
+    def transition(self, state):
+        if state == self.state:
+            return
+        logger.warning(f"Circuit for {self.name}: {self.state} -> {state}")
+        CIRCUIT_TRANSITIONS.inc(origin=self.name, state=state)
+        self.state = state
+
+    def check(self):
+        """Raise CircuitOpenError unless a request may be made now; True if it is the half-open probe"""
+        if self.state == CLOSED:
+            return False
+        retry_in = self.opened_at + self.reset_timeout - time.monotonic()
+        if self.state == OPEN and retry_in <= 0:
+            self.transition(HALF_OPEN)
+        if self.state == HALF_OPEN and not self.probe_in_flight:
+            self.probe_in_flight = True
+            return True
+        raise CircuitOpenError(self.name, max(0.0, retry_in))
+
+    def record_success(self):
+        self.failures = 0
+        self.probe_in_flight = False
+        self.transition(CLOSED)
+
+    def record_abandoned(self):
+        """The request was cancelled before it finished; let another probe through"""
+        self.probe_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.probe_in_flight = False
+        if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self.transition(OPEN)
+
+
+class AdaptiveTimeout:
+    """Request timeout derived from recent healthy latencies
+
+    The timeout is ``multiplier`` times the 95th percentile of the last
+    ``window`` latencies, clamped to ``[minimum, maximum]``. Until
+    ``min_samples`` latencies have been seen the maximum is used. Calls
+    that answer more than ``slow_factor`` times that percentile (and over
+    ``slow_floor`` seconds) are slow: a degraded host, not a new baseline.
+    """
+
+    def __init__(self, maximum, minimum=1.0, multiplier=3.0, window=100, min_samples=10,
+                 slow_factor=2.0, slow_floor=0.5):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.multiplier = multiplier
+        self.min_samples = min_samples
+        self.slow_factor = slow_factor
+        self.slow_floor = slow_floor
+        self.latencies = deque(maxlen=window)
+
+    def observe(self, seconds):
+        self.latencies.append(seconds)
+
+    def p95(self):
+        """95th percentile of the observed latencies, or None until there are enough"""
+        if len(self.latencies) < self.min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def current(self):
+        p95 = self.p95()
+        if p95 is None:
+            return self.maximum
+        return min(self.maximum, max(self.minimum, p95 * self.multiplier))
+
+    def is_slow(self, seconds):
+        """Whether a call that answered in ``seconds`` was far slower than the host usually is"""
+        p95 = self.p95()
+        return p95 is not None and seconds > max(self.slow_floor, p95 * self.slow_factor)
@@ -1,551 +1,1496 @@
-    async def button_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle button callbacks"""
-        query = update.callback_query
-        await query.answer()
-        
-        if query.data == 'check_aqi':
-            await query.edit_message_text("🔄 Fetching regional air quality data...")
-            
-            aqi_data = self.fetch_jakarta_aqi()
-            sg_psi_data = self.fetch_singapore_psi()
-            message = self.format_aqi_message(aqi_data, sg_psi_data)
-            
-            keyboard = [
-                [InlineKeyboardButton("🔄 Refresh", callback_data='check_aqi')],
-                [InlineKeyboardButton("📊 Detailed Jakarta", callback_data='detailed_aqi')],
-                [InlineKeyboardButton("🇸🇬 Singapore Details", callback_data='sg_details')]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await query.edit_message_text(message, reply_markup=reply_markup, parse_mode='Markdown')
-        
-        elif query.data == 'about_aqi':
-            about_text = """
-📊 **About Air Quality Indices**
-
-**AQI vs PSI - What's the difference?**
-
-Both indices measure air quality but use different scales:
-
-🇮🇩 **AQI (Air Quality Index):**
-Used by Jakarta and most countries worldwide
-• More granular scale (6 categories)
-• Includes "Unhealthy for Sensitive Groups"
-• Range: 0-500+
-
-🇸🇬 **PSI (Pollutant Standards Index):**
-Used by Singapore and some Asian countries
-• Simpler scale (5 categories)
-• More conservative thresholds
-• Range: 0-500+
-
-**Health Impact Scale:**
-🟢 **Good (0-50):** Minimal impact
-🟡 **Moderate (51-100):** Acceptable
-🟠 **Unhealthy (101-150/200):** Sensitive groups affected
-🔴 **Very Unhealthy (151-200/201-300):** Everyone affected
-⚫ **Hazardous (301+):** Emergency conditions
-
-**Main Pollutants:**
-• PM2.5: Fine particles (most dangerous)
-• PM10: Coarse particles
-• Ozone (O3): Ground-level ozone
-• NO2: Traffic pollution
-• SO2: Industrial pollution
-
-Both systems update hourly from official monitoring stations.
-            """
-            
-            keyboard = [
-                [InlineKeyboardButton("🔙 Back to Menu", callback_data='back_to_menu')],
-                [InlineKeyboardButton("🌍 Check Air Quality", callback_data='check_aqi')]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await query.edit_message_text(about_text, reply_markup=reply_markup, parse_mode='Markdown')
-        
-        elif query.data == 'sg_details':
-            await query.edit_message_text("🔄 Fetching detailed Singapore PSI data...")
-            
-            sg_psi_data = self.fetch_singapore_psi()
-            if sg_psi_data:
-                detailed_message = "🇸🇬 **Detailed Singapore PSI Report**\n\n"
-                
-                readings = sg_psi_data.get('readings', {})
-                timestamp = sg_psi_data.get('timestamp', 'N/A')
-                
-                detailed_message += f"⏰ **Last Updated:** {timestamp}\n\n"
-                
-                # 24-hour PSI readings
-                psi_24h = readings.get('psi_twenty_four_hourly', {})
-                if psi_24h:
-                    detailed_message += "📊 **24-Hour PSI Readings:**\n"
-                    detailed_message += f"🇸🇬 National: {psi_24h.get('national', 'N/A')}\n"
-                    
-                    regions = ['north', 'south', 'east', 'west', 'central']
-                    for region in regions:
-                        if region in psi_24h:
-                            psi_val = psi_24h[region]
-                            if psi_val != 'N/A':
-                                level, _ = self.get_psi_level(int(psi_val))
-                                detailed_message += f"📍 {region.title()}: {psi_val} ({level})\n"
-                    
-                    detailed_message += "\n"
-                
-                # PM2.5 readings
-                pm25_24h = readings.get('pm25_twenty_four_hourly', {})
-                if pm25_24h:
-                    detailed_message += "🧪 **PM2.5 Concentrations (µg/m³):**\n"
-                    detailed_message += f"🇸🇬 National: {pm25_24h.get('national', 'N/A')}\n"
-                    
-                    regions = ['north', 'south', 'east', 'west', 'central']
-                    for region in regions:
-                        if region in pm25_24h:
-                            pm25_val = pm25_24h[region]
-                            if pm25_val != 'N/A':
-                                detailed_message += f"📍 {region.title()}: {pm25_val}\n"
-                
-                # Health advisory
-                national_psi = psi_24h.get('national', 'N/A')
-                if national_psi != 'N/A':
-                    level, description = self.get_psi_level(int(national_psi))
-                    detailed_message += f"\n🏥 **Health Advisory:**\n"
-                    detailed_message += f"Status: {level}\n"
-                    detailed_message += f"Recommendation: {description}\n"
-                
-            else:
-                detailed_message = "❌ Unable to fetch detailed Singapore PSI data."
-            
-            keyboarimport requests
-import json
-import logging
-from datetime import datetime
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
-import asyncio
-import os
-
-# Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
-logger = logging.getLogger(__name__)
-
-class JakartaAQIBot:
-    def __init__(self, telegram_token, aqicn_token):
-        self.telegram_token = telegram_token
-        self.aqicn_token = aqicn_token
-        self.base_url = "https://api.waqi.info"
-        self.sg_psi_url = "https://api.data.gov.sg/v1/environment/psi"
-        
-    def get_psi_level(self, psi_value):
-        """Convert PSI value to health level description (Singapore system)"""
-        if psi_value <= 50:
-            return "Good 🟢", "Normal activities"
-        elif psi_value <= 100:
-            return "Moderate 🟡", "Normal activities for most people"
-        elif psi_value <= 200:
-            return "Unhealthy 🟠", "Reduce prolonged outdoor activities"
-        elif psi_value <= 300:
-            return "Very Unhealthy 🔴", "Avoid prolonged outdoor activities"
-        else:
-            return "Hazardous ⚫", "Avoid outdoor activities"
-    
-    def get_aqi_level(self, aqi_value):
-        """Convert AQI value to health level description"""
-        if aqi_value <= 50:
-            return "Good 🟢", "Air quality is considered satisfactory"
-        elif aqi_value <= 100:
-            return "Moderate 🟡", "Air quality is acceptable for most people"
-        elif aqi_value <= 150:
-            return "Unhealthy for Sensitive Groups 🟠", "Sensitive individuals may experience health issues"
-        elif aqi_value <= 200:
-            return "Unhealthy 🔴", "Everyone may experience health issues"
-        elif aqi_value <= 300:
-            return "Very Unhealthy 🟣", "Health warnings of emergency conditions"
-        else:
-            return "Hazardous ⚫", "Health alert: everyone may experience serious health effects"
-    
-    def fetch_singapore_psi(self):
-        """Fetch Singapore PSI data from Singapore government API"""
-        try:
-            response = requests.get(self.sg_psi_url, timeout=10)
-            
-            if response.status_code == 200:
-                data = response.json()
-                if 'items' in data and len(data['items']) > 0:
-                    latest_data = data['items'][0]
-                    return {
-                        'timestamp': latest_data['timestamp'],
-                        'readings': latest_data['readings']
-                    }
-            
-            return None
-            
-        except Exception as e:
-            logger.error(f"Error fetching Singapore PSI data: {str(e)}")
-            return None
-    
-    def fetch_jakarta_aqi(self):
-        """Fetch Jakarta air quality data from AQICN API"""
-        try:
-            # Try multiple Jakarta station IDs for better coverage
-            stations = [
-                "jakarta",
-                "jakarta-selatan", 
-                "jakarta-utara",
-                "jakarta-barat",
-                "jakarta-timur",
-                "jakarta-pusat"
-            ]
-            
-            results = []
-            for station in stations:
-                url = f"{self.base_url}/feed/{station}/?token={self.aqicn_token}"
-                response = requests.get(url, timeout=10)
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    if data.get('status') == 'ok':
-                        results.append({
-                            'station': station,
-                            'data': data['data']
-                        })
-            
-            return results
-            
-        except Exception as e:
-            logger.error(f"Error fetching AQI data: {str(e)}")
-            return None
-    
-    def format_aqi_message(self, aqi_data, sg_psi_data):
-        """Format AQI data and Singapore PSI into a readable message"""
-        message = "🌍 **Regional Air Quality Report**\n"
-        message += f"📅 Updated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n\n"
-        
-        # Jakarta AQI Section
-        message += "🇮🇩 **JAKARTA (AQI)**\n"
-        message += "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
-        
-        if not aqi_data:
-            message += "❌ Unable to fetch Jakarta air quality data.\n\n"
-        else:
-            # Show average AQI for Jakarta
-            valid_aqi = [int(d['data']['aqi']) for d in aqi_data if d['data'].get('aqi') != 'N/A']
-            if valid_aqi:
-                avg_aqi = sum(valid_aqi) / len(valid_aqi)
-                level, description = self.get_aqi_level(int(avg_aqi))
-                
-                message += f"📊 **Average AQI: {int(avg_aqi)}**\n"
-                message += f"🏥 Status: {level}\n"
-                message += f"ℹ️ {description}\n\n"
-                
-                # Show top 2 stations
-                for station_data in aqi_data[:2]:
-                    station = station_data['station']
-                    data = station_data['data']
-                    
-                    aqi_value = data.get('aqi', 'N/A')
-                    if aqi_value != 'N/A':
-                        level, _ = self.get_aqi_level(int(aqi_value))
-                        message += f"📍 {station.title().replace('-', ' ')}: {aqi_value} {level.split()[0]}\n"
-        
-        # Singapore PSI Section
-        message += "\n🇸🇬 **SINGAPORE (PSI)**\n"
-        message += "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
-        
-        if not sg_psi_data:
-            message += "❌ Unable to fetch Singapore PSI data.\n\n"
-        else:
-            readings = sg_psi_data.get('readings', {})
-            psi_24h = readings.get('psi_twenty_four_hourly', {})
-            
-            if psi_24h:
-                # Get national average
-                national_psi = psi_24h.get('national', 'N/A')
-                if national_psi != 'N/A':
-                    level, description = self.get_psi_level(int(national_psi))
-                    message += f"📊 **National PSI: {national_psi}**\n"
-                    message += f"🏥 Status: {level}\n"
-                    message += f"ℹ️ {description}\n\n"
-                
-                # Show regional breakdown
-                regions = ['north', 'south', 'east', 'west', 'central']
-                for region in regions:
-                    if region in psi_24h and psi_24h[region] != 'N/A':
-                        psi_val = psi_24h[region]
-                        level, _ = self.get_psi_level(int(psi_val))
-                        message += f"📍 {region.title()}: {psi_val} {level.split()[0]}\n"
-        
-        # Comparison Section
-        message += "\n📈 **COMPARISON**\n"
-        message += "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
-        
-        # Try to compare if both data are available
-        if aqi_data and sg_psi_data:
-            valid_aqi = [int(d['data']['aqi']) for d in aqi_data if d['data'].get('aqi') != 'N/A']
-            readings = sg_psi_data.get('readings', {})
-            psi_24h = readings.get('psi_twenty_four_hourly', {})
-            national_psi = psi_24h.get('national', 'N/A')
-            
-            if valid_aqi and national_psi != 'N/A':
-                avg_aqi = sum(valid_aqi) / len(valid_aqi)
-                
-                if avg_aqi < national_psi:
-                    message += f"🟢 Jakarta air quality is currently better than Singapore\n"
-                    message += f"   Jakarta AQI: {int(avg_aqi)} | Singapore PSI: {national_psi}\n"
-                elif avg_aqi > national_psi:
-                    message += f"🔴 Singapore air quality is currently better than Jakarta\n"
-                    message += f"   Jakarta AQI: {int(avg_aqi)} | Singapore PSI: {national_psi}\n"
-                else:
-                    message += f"🟡 Both cities have similar air quality levels\n"
-                    message += f"   Jakarta AQI: {int(avg_aqi)} | Singapore PSI: {national_psi}\n"
-        
-        # Health Recommendations
-        message += "\n💡 **HEALTH RECOMMENDATIONS**\n"
-        message += "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
-        
-        # Base recommendations on Jakarta AQI (primary focus)
-        if aqi_data:
-            valid_aqi = [int(d['data']['aqi']) for d in aqi_data if d['data'].get('aqi') != 'N/A']
-            if valid_aqi:
-                avg_aqi = sum(valid_aqi) / len(valid_aqi)
-                
-                if avg_aqi <= 50:
-                    message += "• Perfect for outdoor activities\n"
-                    message += "• All age groups can enjoy outdoor exercise\n"
-                elif avg_aqi <= 100:
-                    message += "• Safe for most outdoor activities\n"
-                    message += "• Sensitive individuals should monitor symptoms\n"
-                elif avg_aqi <= 150:
-                    message += "• Limit prolonged outdoor activities\n"
-                    message += "• Sensitive groups should reduce outdoor exercise\n"
-                elif avg_aqi <= 200:
-                    message += "• Avoid outdoor activities\n"
-                    message += "• Everyone should limit outdoor exposure\n"
-                else:
-                    message += "• Stay indoors, use air purifiers\n"
-                    message += "• Wear N95 masks if going outside\n"
-        
-        message += "\n🔄 Data sources: AQICN.org (Jakarta) | Data.gov.sg (Singapore)"
-        
-        return message
-    
-    async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle /start command"""
-        welcome_message = """
-🌟 **Welcome to Regional Air Quality Bot!**
-
-This bot provides real-time air quality information for Jakarta (AQI) and Singapore (PSI) using official data sources.
-
-**Available Commands:**
-• /aqi - Get current air quality comparison
-• /help - Show this help message
-• /subscribe - Get notifications (coming soon)
-
-**Features:**
-✅ Real-time Jakarta AQI data
-✅ Real-time Singapore PSI data
-✅ Regional comparison
-✅ Health recommendations
-✅ Pollutant breakdown
-
-Click the button below to check current air quality!
-        """
-        
-        keyboard = [
-            [InlineKeyboardButton("🌍 Check Air Quality", callback_data='check_aqi')],
-            [InlineKeyboardButton("ℹ️ About AQI & PSI", callback_data='about_aqi')]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.message.reply_text(welcome_message, reply_markup=reply_markup, parse_mode='Markdown')
-    
-    async def aqi_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle /aqi command"""
-        await update.message.reply_text("🔄 Fetching regional air quality data...")
-        
-        # Fetch both Jakarta AQI and Singapore PSI
-        aqi_data = self.fetch_jakarta_aqi()
-        sg_psi_data = self.fetch_singapore_psi()
-        
-        message = self.format_aqi_message(aqi_data, sg_psi_data)
-        
-        keyboard = [
-            [InlineKeyboardButton("🔄 Refresh", callback_data='check_aqi')],
-            [InlineKeyboardButton("📊 Detailed Jakarta", callback_data='detailed_aqi')],
-            [InlineKeyboardButton("🇸🇬 Singapore Details", callback_data='sg_details')]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.message.reply_text(message, reply_markup=reply_markup, parse_mode='Markdown')
-    
-    async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle /help command"""
-        help_text = """
-🆘 **Regional Air Quality Bot Help**
-
-**Commands:**
-• `/start` - Welcome message and main menu
-• `/air` - Get current air quality comparison
-• `/help` - Show this help message
-
-**Understanding AQI vs PSI:**
-
-🇮🇩 **AQI (Air Quality Index) - Jakarta:**
-• 0-50: Good 🟢
-• 51-100: Moderate 🟡
-• 101-150: Unhealthy for Sensitive Groups 🟠
-• 151-200: Unhealthy 🔴
-• 201-300: Very Unhealthy 🟣
-• 301+: Hazardous ⚫
-
-🇸🇬 **PSI (Pollutant Standards Index) - Singapore:**
-• 0-50: Good 🟢
-• 51-100: Moderate 🟡
-• 101-200: Unhealthy 🟠
-• 201-300: Very Unhealthy 🔴
-• 301+: Hazardous ⚫
-
-**Pollutants Monitored:**
-• PM2.5 & PM10: Particulate matter
-• NO2: Nitrogen dioxide
-• O3: Ozone
-• CO: Carbon monoxide
-• SO2: Sulfur dioxide
-
-**Data Sources:** 
-• Jakarta: AQICN.org
-• Singapore: Data.gov.sg
-
-**Developer:** @your_username
-
-For issues or suggestions, contact the developer.
-        """
-        
-        await update.message.reply_text(help_text, parse_mode='Markdown')
-    
-    async def button_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle button callbacks"""
-        query = update.callback_query
-        await query.answer()
-        
-        if query.data == 'check_aqi':
-            await query.edit_message_text("🔄 Fetching Jakarta air quality data...")
-            
-            aqi_data = self.fetch_jakarta_aqi()
-            message = self.format_aqi_message(aqi_data)
-            
-            keyboard = [
-                [InlineKeyboardButton("🔄 Refresh", callback_data='check_aqi')],
-                [InlineKeyboardButton("📊 Detailed View", callback_data='detailed_aqi')]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await query.edit_message_text(message, reply_markup=reply_markup, parse_mode='Markdown')
-        
-        elif query.data == 'about_aqi':
-            about_text = """
-📊 **About Air Quality Index (AQI)**
-
-AQI is a standardized way to communicate air quality to the public. It considers multiple pollutants and converts them into a single number.
-
-**Health Impact Scale:**
-🟢 **Good (0-50):** Minimal impact
-🟡 **Moderate (51-100):** Acceptable
-🟠 **Unhealthy for Sensitive (101-150):** Sensitive groups affected
-🔴 **Unhealthy (151-200):** Everyone affected
-🟣 **Very Unhealthy (201-300):** Health warnings
-⚫ **Hazardous (301+):** Emergency conditions
-
-**Main Pollutants:**
-• PM2.5: Fine particles (most dangerous)
-• PM10: Coarse particles
-• Ozone (O3): Ground-level ozone
-• NO2: Traffic pollution
-• SO2: Industrial pollution
-
-Data is updated hourly from official monitoring stations.
-            """
-            
-            keyboard = [
-                [InlineKeyboardButton("🔙 Back to Menu", callback_data='back_to_menu')],
-                [InlineKeyboardButton("🌍 Check Air Quality", callback_data='check_aqi')]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await query.edit_message_text(about_text, reply_markup=reply_markup, parse_mode='Markdown')
-        
-        elif query.data == 'detailed_aqi':
-            await query.edit_message_text("🔄 Fetching detailed air quality data...")
-            
-            aqi_data = self.fetch_jakarta_aqi()
-            if aqi_data:
-                detailed_message = "📊 **Detailed Jakarta Air Quality Report**\n\n"
-                
-                for station_data in aqi_data:
-                    station = station_data['station']
-                    data = station_data['data']
-                    
-                    detailed_message += f"📍 **{station.title().replace('-', ' ')}**\n"
-                    detailed_message += f"🔢 AQI: {data.get('aqi', 'N/A')}\n"
-                    
-                    if 'iaqi' in data:
-                        detailed_message += "🧪 **Pollutant Details:**\n"
-                        for pollutant, value in data['iaqi'].items():
-                            if pollutant in ['pm25', 'pm10', 'no2', 'o3', 'co', 'so2']:
-                                detailed_message += f"  • {pollutant.upper()}: {value['v']}\n"
-                    
-                    if 'time' in data:
-                        detailed_message += f"⏰ Last Updated: {data['time']['s']}\n"
-                    
-                    detailed_message += "\n"
-            else:
-                detailed_message = "❌ Unable to fetch detailed data."
-            
-            keyboard = [
-                [InlineKeyboardButton("🔄 Refresh", callback_data='detailed_aqi')],
-                [InlineKeyboardButton("🔙 Back", callback_data='check_aqi')]
-            ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
-            await query.edit_message_text(detailed_message, reply_markup=reply_markup, parse_mode='Markdown')
-    
-    def run(self):
-        """Run the bot"""
-        application = Application.builder().token(self.telegram_token).build()
-        
-        # Add handlers
-        application.add_handler(CommandHandler("start", self.start_command))
-        application.add_handler(CommandHandler("aqi", self.aqi_command))
-        application.add_handler(CommandHandler("help", self.help_command))
-        application.add_handler(CallbackQueryHandler(self.button_callback))
-        
-        # Start the bot
-        print("🤖 Jakarta Air Quality Bot starting...")
-        application.run_polling(allowed_updates=Update.ALL_TYPES)
-
-if __name__ == "__main__":
-    # Configuration
-    TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "YOUR_TELEGRAM_BOT_TOKEN")
-    AQICN_API_TOKEN = os.getenv("AQICN_API_TOKEN", "YOUR_AQICN_API_TOKEN")
-    
-    # Validate tokens
-    if TELEGRAM_BOT_TOKEN == "YOUR_TELEGRAM_BOT_TOKEN":
-        print("❌ Please set your Telegram bot token!")
-        print("1. Message @BotFather on Telegram")
-        print("2. Create a new bot with /newbot")
-        print("3. Set TELEGRAM_BOT_TOKEN environment variable")
-        exit(1)
-    
-    if AQICN_API_TOKEN == "YOUR_AQICN_API_TOKEN":
-        print("❌ Please set your AQICN API token!")
-        print("1. Visit https://aqicn.org/data-platform/token/")
-        print("2. Request a free API token")
-        print("3. Set AQICN_API_TOKEN environment variable")
-        exit(1)
-    
-    # Create and run bot
-    bot = JakartaAQIBot(TELEGRAM_BOT_TOKEN, AQICN_API_TOKEN)
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from telegram import (
+    Update, InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultArticle, InputTextMessageContent
+)
+from telegram.ext import (
+    Application, CommandHandler, CallbackQueryHandler, ContextTypes, InlineQueryHandler, MessageHandler, filters
+)
+import asyncio
+import httpx
+import os
+import random
+import time
+
+from aqi_cache import ReadingCache
+from aqi_callbacks import ABOUT, DETAILS, MENU, REPORT, STATION, TREND, CallbackCodec, encode_inline
+from aqi_geo import StationIndex
+from aqi_inline import PrefixIndex
+from aqi_quality import USABLE, dedupe, reject_outliers, validate
+from aqi_snapshots import VIEW_PREFIX, SnapshotPublisher, decode_readings, open_snapshot_store
+from aqi_history import HistoryStore
+from aqi_http import UpstreamClient, origin_of
+from breaker import STATE_VALUES, CircuitOpenError
+from aqi_sources import Reading, SourceRegistry
+from metrics import FORMAT_SECONDS, HANDLER_SECONDS, REGISTRY, InstrumentedRequest, MetricsServer, timed
+from ratelimit import KeyedRateLimiter
+from subscriptions import DEFAULT_THRESHOLD, NotificationDispatcher, SubscriptionStore
+from telegram.error import BadRequest
+
+# Configure logging
+logging.basicConfig(
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    level=logging.INFO
+)
+logger = logging.getLogger(__name__)
+
+DIVIDER = "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
+
+# Only the update types the handlers below actually consume
+ALLOWED_UPDATES = [Update.MESSAGE, Update.CALLBACK_QUERY, Update.INLINE_QUERY]
+
+# Keyboards are immutable, so they are built once and shared by every message;
+# the report keyboard follows the configured cities and is built with the bot,
+# per-city detail and station keyboards with their view
+MAIN_MENU_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🌍 Check Air Quality", callback_data=encode_inline(REPORT))],
+    [InlineKeyboardButton("ℹ️ About AQI & PSI", callback_data=encode_inline(ABOUT))]
+])
+TREND_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔄 Refresh", callback_data=encode_inline(TREND))],
+    [InlineKeyboardButton("🔙 Back", callback_data=encode_inline(REPORT))]
+])
+ABOUT_KEYBOARD = InlineKeyboardMarkup([
+    [InlineKeyboardButton("🔙 Back to Menu", callback_data=encode_inline(MENU))],
+    [InlineKeyboardButton("🌍 Check Air Quality", callback_data=encode_inline(REPORT))]
+])
+
+WELCOME_TEXT = """
+🌟 **Welcome to Regional Air Quality Bot!**
+
+This bot provides real-time air quality information for Jakarta (AQI) and Singapore (PSI) using official data sources.
+
+**Available Commands:**
+• /aqi - Get current air quality comparison
+• /trend - Is it getting better or worse?
+• /help - Show this help message
+• /subscribe [AQI] - Get alerts when Jakarta AQI crosses a threshold
+• /unsubscribe - Stop alerts
+• 📍 Share your location - Nearest station readings
+
+**Features:**
+✅ Real-time Jakarta AQI data
+✅ Real-time Singapore PSI data
+✅ Regional comparison
+✅ Health recommendations
+✅ Pollutant breakdown
+
+Click the button below to check current air quality!
+"""
+
+ABOUT_TEXT = """
+📊 **About Air Quality Indices**
+
+**AQI vs PSI - What's the difference?**
+
+Both indices measure air quality but use different scales:
+
+🇮🇩 **AQI (Air Quality Index):**
+Used by Jakarta and most countries worldwide
+• More granular scale (6 categories)
+• Includes "Unhealthy for Sensitive Groups"
+• Range: 0-500+
+
+🇸🇬 **PSI (Pollutant Standards Index):**
+Used by Singapore and some Asian countries
+• Simpler scale (5 categories)
+• More conservative thresholds
+• Range: 0-500+
+
+**Health Impact Scale:**
+🟢 **Good (0-50):** Minimal impact
+🟡 **Moderate (51-100):** Acceptable
+🟠 **Unhealthy (101-150/200):** Sensitive groups affected
+🔴 **Very Unhealthy (151-200/201-300):** Everyone affected
+⚫ **Hazardous (301+):** Emergency conditions
+
+**Main Pollutants:**
+• PM2.5: Fine particles (most dangerous)
+• PM10: Coarse particles
+• Ozone (O3): Ground-level ozone
+• NO2: Traffic pollution
+• SO2: Industrial pollution
+
+Both systems update hourly from official monitoring stations.
+"""
+
+class JakartaAQIBot:
+    def __init__(self, telegram_token, aqicn_token):
+        self.telegram_token = telegram_token
+        self.aqicn_token = aqicn_token
+        # Bot API server, e.g. a self-hosted telegram-bot-api or a local fake for load tests
+        self.telegram_api_url = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+        self.request_timeout = 10
+        # Per-host circuit breaker: open after BREAKER_FAILURES consecutive
+        # failures, probe again after BREAKER_RESET_SECONDS
+        self.breaker_failures = int(os.getenv("BREAKER_FAILURES", "5"))
+        self.breaker_reset = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+        # One pooled client per upstream host, keyed by origin
+        self.upstreams = {}
+        
+        # Providers, cities and stations, from SOURCES_CONFIG or the built-in defaults
+        self.sources = SourceRegistry.load(os.getenv("SOURCES_CONFIG"), tokens={'aqicn': aqicn_token})
+        # Spatial index for shared locations, seeded from configured coordinates
+        # and kept up to date from the geo position in every reading
+        self.report_keyboard = self.build_report_keyboard()
+        self.station_index = StationIndex({
+            station.id: station.geo for station in self.sources.stations.values()
+            if station.geo and self.reported_station(station)
+        })
+        self.nearest_count = int(os.getenv("NEAREST_STATIONS", "3"))
+        # Per-station timeout cap (requests adapt below it to recent latency)
+        # and overall deadline for a regional report (seconds)
+        self.station_timeout = float(os.getenv("STATION_TIMEOUT", "6"))
+        self.report_deadline = float(os.getenv("REPORT_DEADLINE", "8"))
+        # Station readings older than this are labelled stale and left out of averages
+        self.stale_after_minutes = int(os.getenv("STALE_AFTER_MINUTES", "180"))
+        # Modified z-score past which a station is left out of its city's average
+        self.outlier_threshold = float(os.getenv("OUTLIER_THRESHOLD", "3.5"))
+        
+        # Deployment role. 'all' fetches and answers in one process. With a shared
+        # SNAPSHOT_BACKEND, one 'ingest' worker fetches, publishes snapshots and
+        # sends alerts, and any number of 'responder' workers answer updates
+        # from the published snapshots without calling upstream
+        self.role = os.getenv("BOT_ROLE", "all")
+        
+        # Both upstreams publish hourly, so readings are shared between users
+        self.cache = ReadingCache(
+            ttl=int(os.getenv("CACHE_TTL", "900")),
+            stale_ttl=int(os.getenv("CACHE_STALE_TTL", "3600"))
+        )
+        # Rendered message text for the current cache version
+        self.rendered = {}
+        self.rendered_version = None
+        # Button presses: per-user and per-chat token buckets, identical presses
+        # already being handled are dropped, and edits that would not change
+        # a message (tracked by content digest for recent messages) are skipped.
+        # All of this is per process. Taps on one chat reach any of the
+        # RESPONDER_WORKERS responders, so each enforces its share of the
+        # limits, a duplicate tap on another worker costs one no-op edit, and
+        # responders always edit since another worker may have changed the message
+        workers = int(os.getenv("RESPONDER_WORKERS", "1")) if self.role == 'responder' else 1
+        self.user_limiter = KeyedRateLimiter(
+            float(os.getenv("CALLBACK_USER_RATE", "0.5")) / workers,
+            max(1, int(os.getenv("CALLBACK_USER_BURST", "3")) // workers)
+        )
+        self.chat_limiter = KeyedRateLimiter(
+            float(os.getenv("CALLBACK_CHAT_RATE", "1")) / workers,
+            max(1, int(os.getenv("CALLBACK_CHAT_BURST", "5")) // workers)
+        )
+        self.callbacks_inflight = set()
+        self.message_digests = OrderedDict()
+        self.message_digest_limit = 10000
+        # callback_data too long to carry inline is kept in a bounded LRU;
+        # another responder could not decode those tokens, so responders
+        # leave out buttons that do not fit inline
+        self.callbacks = CallbackCodec(
+            0 if self.role == 'responder' else int(os.getenv("CALLBACK_STATES", "10000"))
+        )
+        # Button views by code, with the number of arguments each takes
+        self.views = {
+            MENU: (self.show_menu, 0),
+            ABOUT: (self.show_about, 0),
+            REPORT: (self.show_report, 0),
+            TREND: (self.show_trend, 0),
+            DETAILS: (self.show_details, 2),
+            STATION: (self.show_station, 1),
+        }
+        # Stations per page of a city's detail view
+        self.details_page_size = int(os.getenv("DETAILS_PAGE_SIZE", "5"))
+        
+        # Inline-mode answers, rebuilt from cached readings when the cache version changes
+        self.inline_index = PrefixIndex()
+        self.inline_version = None
+        self.inline_fresh_until = 0.0
+        # Background prefetch: runs every PREFETCH_INTERVAL_MINUTES starting
+        # PREFETCH_OFFSET_MINUTES past the hour, when upstreams have published
+        self.prefetch_enabled = os.getenv("PREFETCH_ENABLED", "1") != "0"
+        self.prefetch_interval = int(os.getenv("PREFETCH_INTERVAL_MINUTES", "15")) * 60
+        self.prefetch_offset = int(os.getenv("PREFETCH_OFFSET_MINUTES", "5")) * 60
+        self.prefetch_backoff_base = 30
+        self.prefetch_task = None
+        # Alert fan-out runs beside the prefetch loop so it never delays the next refresh
+        self.notify_task = None
+        
+        snapshot_backend = os.getenv("SNAPSHOT_BACKEND")
+        self.snapshots = open_snapshot_store(snapshot_backend) if snapshot_backend else None
+        self.publisher = SnapshotPublisher(self.snapshots) if self.snapshots is not None else None
+        self.snapshot_version = 0
+        self.snapshot_poll = float(os.getenv("SNAPSHOT_POLL_SECONDS", "5"))
+        self.snapshot_task = None
+        # Entries restored from the snapshot store at boot, shown "as of" until refreshed
+        self.restored = {}
+        # Views published by the ingest worker from state responders do not
+        # have (/trend needs the history store), by name
+        self.shared_views = {}
+        
+        # Window shown by /trend
+        self.trend_days = int(os.getenv("TREND_DAYS", "7"))
+        
+        # Every upstream reading is appended to the local time-series store
+        # (the ingest worker's; responders show the trend it publishes).
+        # Readings are buffered and written in one transaction per prefetch
+        self.history = HistoryStore(
+            os.getenv("HISTORY_DB", "history.db"),
+            raw_days=int(os.getenv("HISTORY_RAW_DAYS", "30")),
+            retention_days=int(os.getenv("HISTORY_RETENTION_DAYS", "365"))
+        )
+        self.history_pending = []
+        
+        # AQI alert subscriptions, evaluated after every prefetch. Only the
+        # ingest worker reads this store; responders queue changes to it
+        # through the snapshot backend
+        self.subscriptions = SubscriptionStore(os.getenv("SUBSCRIPTIONS_DB", "subscriptions.db"))
+        self.dispatcher = NotificationDispatcher(self.subscriptions)
+        self.application = None
+        
+        # Optional Prometheus endpoint on METRICS_HOST:METRICS_PORT/metrics
+        metrics_port = os.getenv("METRICS_PORT")
+        self.metrics_server = (
+            MetricsServer(REGISTRY, os.getenv("METRICS_HOST", "127.0.0.1"), int(metrics_port))
+            if metrics_port else None
+        )
+        REGISTRY.callback(
+            'aqi_cache_lookups', "Reading cache lookups by result",
+            lambda: {(result,): self.cache.stats()[result] for result in ('hits', 'stale_hits', 'misses', 'coalesced')},
+            ('result',), kind='counter'
+        )
+        REGISTRY.callback(
+            'aqi_upstream_circuit_state', "Upstream circuit breaker state (0 closed, 1 half-open, 2 open)",
+            lambda: {(origin,): STATE_VALUES[u.breaker.state] for origin, u in self.upstreams.items()},
+            ('origin',)
+        )
+        REGISTRY.callback(
+            'aqi_upstream_timeout_seconds', "Current adaptive upstream request timeout",
+            lambda: {(origin,): u.adaptive_timeout.current() for origin, u in self.upstreams.items()},
+            ('origin',)
+        )
+        REGISTRY.callback(
+            'aqi_cache_hit_ratio', "Share of reading cache lookups served without waiting on upstream",
+            lambda: {(): self.cache.stats()['hit_ratio']}
+        )
+        
+        # Chats allowed to see operator commands such as /stats
+        self.operator_chat_ids = {
+            int(chat_id) for chat_id in os.getenv("OPERATOR_CHAT_IDS", "").split(",") if chat_id.strip()
+        }
+    
+    def build_report_keyboard(self):
+        """Refresh, then details of the primary city beside its trend, then details of every other city"""
+        primary = self.sources.primary
+        rows = [
+            [InlineKeyboardButton("🔄 Refresh", callback_data=encode_inline(REPORT))],
+            [InlineKeyboardButton(f"📊 Detailed {primary.name}", callback_data=encode_inline(DETAILS, primary.key, 0)),
+             InlineKeyboardButton("📈 Trend", callback_data=encode_inline(TREND))]
+        ]
+        others = [
+            InlineKeyboardButton(f"{city.flag} {city.name} Details", callback_data=data)
+            for city in self.sources.cities.values() if city is not primary
+            for data in [encode_inline(DETAILS, city.key, 0)] if data is not None
+        ]
+        rows.extend(others[i:i + 2] for i in range(0, len(others), 2))
+        return InlineKeyboardMarkup(rows)
+    
+    def reported_station(self, station):
+        """Whether reports cover ``station``: bounded cities report their discovered stations only"""
+        return not station.city.bounds or station.id in station.city.discovered
+    
+    def index_readings(self, readings):
+        """Learn station positions from readings of stations the reports cover
+        
+        A bounded city's configured feeds are the same monitors as its
+        discovered stations under other ids; indexing both would list one
+        monitor several times.
+        """
+        self.station_index.update(r for r in readings if self.reported_station(r.station))
+    
+    def get_upstream(self, url):
+        """Return the pooled client for the host serving ``url``, creating it on first use"""
+        origin = origin_of(url)
+        upstream = self.upstreams.get(origin)
+        if upstream is None:
+            upstream = UpstreamClient(
+                origin, timeout=self.request_timeout,
+                failure_threshold=self.breaker_failures, reset_timeout=self.breaker_reset
+            )
+            self.upstreams[origin] = upstream
+        return upstream
+    
+    async def close(self, application=None):
+        """Stop the prefetch job and metrics endpoint and close the upstream clients (post_shutdown hook)"""
+        if self.metrics_server is not None:
+            await self.metrics_server.stop()
+        if self.prefetch_task is not None:
+            self.prefetch_task.cancel()
+            try:
+                await self.prefetch_task
+            except asyncio.CancelledError:
+                pass
+            self.prefetch_task = None
+        if self.notify_task is not None:
+            self.notify_task.cancel()
+            try:
+                await self.notify_task
+            except asyncio.CancelledError:
+                pass
+            self.notify_task = None
+        if self.snapshot_task is not None:
+            self.snapshot_task.cancel()
+            try:
+                await self.snapshot_task
+            except asyncio.CancelledError:
+                pass
+            self.snapshot_task = None
+        if self.snapshots is not None:
+            self.snapshots.close()
+        self.subscriptions.close()
+        try:
+            await self.flush_history()
+        except Exception as e:
+            logger.error(f"Recording history failed: {str(e)}")
+        self.history.close()
+        upstreams, self.upstreams = self.upstreams, {}
+        for upstream in upstreams.values():
+            await upstream.aclose()
+        
+    def get_psi_level(self, psi_value):
+        """Convert PSI value to health level description (Singapore system)"""
+        if psi_value <= 50:
+            return "Good 🟢", "Normal activities"
+        elif psi_value <= 100:
+            return "Moderate 🟡", "Normal activities for most people"
+        elif psi_value <= 200:
+            return "Unhealthy 🟠", "Reduce prolonged outdoor activities"
+        elif psi_value <= 300:
+            return "Very Unhealthy 🔴", "Avoid prolonged outdoor activities"
+        else:
+            return "Hazardous ⚫", "Avoid outdoor activities"
+    
+    def get_aqi_level(self, aqi_value):
+        """Convert AQI value to health level description"""
+        if aqi_value <= 50:
+            return "Good 🟢", "Air quality is considered satisfactory"
+        elif aqi_value <= 100:
+            return "Moderate 🟡", "Air quality is acceptable for most people"
+        elif aqi_value <= 150:
+            return "Unhealthy for Sensitive Groups 🟠", "Sensitive individuals may experience health issues"
+        elif aqi_value <= 200:
+            return "Unhealthy 🔴", "Everyone may experience health issues"
+        elif aqi_value <= 300:
+            return "Very Unhealthy 🟣", "Health warnings of emergency conditions"
+        else:
+            return "Hazardous ⚫", "Health alert: everyone may experience serious health effects"
+    
+    def get_level(self, scale, value):
+        """Health level description for a value on a city's scale ('aqi' or 'psi')"""
+        return self.get_psi_level(value) if scale == 'psi' else self.get_aqi_level(value)
+    
+    async def fetch_unit(self, provider, unit):
+        """Fetch the readings behind one upstream request, served from the shared cache when fresh
+        
+        If the upstream fails, or its circuit is open, the last cached snapshot
+        is returned however old it is, so a degraded host gives a fast answer
+        from older data instead of a slow missing one. Responders never call
+        upstream: they serve whatever the ingest worker last published.
+        """
+        if self.role == 'responder':
+            entry = self.cache.peek(unit.key)
+            return entry.value if entry is not None else None
+        readings = await self.cache.get(unit.key, lambda: self.request_unit(provider, unit))
+        if readings is None:
+            entry = self.cache.peek(unit.key)
+            if entry is not None:
+                readings = entry.value
+        return readings
+    
+    def snapshot_time(self, city, detail=False):
+        """Wall time of the oldest data behind a city if any is past the cache TTL or restored at boot, else None"""
+        oldest = None
+        for unit in self.sources.fetch_units(city, detail):
+            entry = self.cache.peek(unit.key)
+            if entry is not None and (entry.age() >= self.cache.ttl or self.restored.get(unit.key) is entry):
+                oldest = entry.stored_at if oldest is None else min(oldest, entry.stored_at)
+        return oldest
+    
+    async def request_unit(self, provider, unit):
+        """Request one upstream unit and normalise it into readings, or None"""
+        try:
+            status, payload = await self.get_upstream(unit.url).get_json(
+                unit.url, params=unit.params, timeout=self.station_timeout
+            )
+            if status != 200:
+                return None
+            readings = provider.parse(unit, payload)
+        except CircuitOpenError:
+            # Failing fast; the breaker logs its own state changes
+            return None
+        except httpx.TimeoutException:
+            logger.error(f"Timed out fetching {unit.key} from {provider.label}")
+            return None
+        except Exception as e:
+            logger.error(f"Error fetching {unit.key} from {provider.label}: {str(e)}")
+            return None
+        
+        if readings:
+            self.history_pending.extend(readings)
+            self.index_readings(readings)
+        return readings or None
+    
+    async def fetch_city(self, city_key, detail=False):
+        """Fetch every station of a city concurrently
+        
+        Returns one Reading per station with a status of 'ok', 'stale',
+        'invalid', 'outlier' or 'missing': configured stations in registry
+        order, then any found by bulk ingestion. Requests that fail or miss
+        the report deadline leave their stations as 'missing'. Station feeds
+        that resolve to the same monitoring station (same uid) are counted
+        once. ``detail`` asks the provider for per-station feeds instead of
+        its bulk request.
+        """
+        city = self.sources.cities[city_key]
+        units = self.sources.fetch_units(city, detail)
+        provider = self.sources.providers[city.provider]
+        
+        # Fast path: units fresh in the cache are served (and counted) here,
+        # only the rest need tasks
+        fresh = {unit.key: self.cache.get_fresh(unit.key) for unit in units}
+        tasks = {
+            unit.key: asyncio.create_task(self.fetch_unit(provider, unit))
+            for unit in units if fresh[unit.key] is None
+        }
+        done = set()
+        if tasks:
+            done, pending = await asyncio.wait(tasks.values(), timeout=self.report_deadline)
+            for task in pending:
+                task.cancel()
+        
+        results = []
+        for unit in units:
+            if fresh[unit.key] is not None:
+                results.append(fresh[unit.key])
+                continue
+            task = tasks[unit.key]
+            if task not in done:
+                logger.warning(f"{unit.key} missed the {self.report_deadline}s deadline")
+                continue
+            try:
+                results.append(task.result())
+            except Exception as e:
+                logger.error(f"Error fetching {unit.key}: {str(e)}")
+        
+        return self.assemble_city(units, results)
+    
+    def cached_city(self, city_key):
+        """A city's readings from whatever is cached, however old, without fetching"""
+        units = self.sources.fetch_units(self.sources.cities[city_key])
+        results = []
+        for unit in units:
+            entry = self.cache.peek(unit.key)
+            results.append(entry.value if entry is not None else None)
+        return self.assemble_city(units, results)
+    
+    def assemble_city(self, units, results):
+        """Run per-unit results through the quality pipeline into one Reading per station
+        
+        Readings are deduplicated by station uid, validated and checked
+        against the freshness window, and usable values far from the city's
+        median are marked as outliers. Each reading ends with a status of
+        'ok', 'stale', 'invalid', 'outlier' or 'missing'; only 'ok' values
+        count towards averages.
+        """
+        duplicates = set()
+        by_station = {
+            reading.station.id: reading
+            for reading in dedupe((reading for readings in results for reading in readings or ()), duplicates)
+        }
+        
+        city_readings = []
+        for station in (station for unit in units for station in unit.stations):
+            if station.id not in duplicates:
+                city_readings.append(by_station.pop(station.id, None) or Reading.missing(station))
+        city_readings.extend(by_station.values())
+        return reject_outliers(list(validate(city_readings, self.stale_after_minutes * 60)),
+                               threshold=self.outlier_threshold)
+    
+    async def fetch_cities(self, city_keys=None):
+        """Fetch several cities concurrently, returning {city_key: readings}"""
+        city_keys = list(city_keys or self.sources.cities)
+        results = await asyncio.gather(*(self.fetch_city(key) for key in city_keys))
+        return dict(zip(city_keys, results))
+    
+    async def prefetch_all(self):
+        """Refresh every upstream unit in the cache, returning the failure count
+        
+        An ingest worker refreshes the detail-view units too, since responders
+        never fetch them, and with a snapshot backend every changed unit is
+        published for responder workers, along with the ingest worker's trend.
+        Readings fetched since the last prefetch, for users too, are recorded
+        to history in one transaction.
+        """
+        units = self.sources.all_fetch_units(detail=self.role == 'ingest')
+        refreshes = [
+            self.cache.refresh(unit.key, lambda provider=provider, unit=unit: self.request_unit(provider, unit))
+            for provider, unit in units
+        ]
+        results = await asyncio.gather(*refreshes, return_exceptions=True)
+        try:
+            await self.flush_history()
+        except Exception as e:
+            logger.error(f"Recording history failed: {str(e)}")
+        if self.publisher is not None:
+            try:
+                await self.publisher.publish(self.cache, [unit.key for _, unit in units])
+                if self.role == 'ingest':
+                    await self.publisher.publish_view('trend', self.format_trend_message())
+            except Exception as e:
+                logger.error(f"Publishing snapshots failed: {str(e)}")
+        return sum(1 for result in results if result is None or isinstance(result, Exception))
+    
+    async def flush_history(self):
+        """Write the readings fetched since the last flush to the history store in a worker thread"""
+        readings, self.history_pending = self.history_pending, []
+        if readings:
+            await asyncio.to_thread(self.history.record_readings, readings)
+    
+    def seconds_until_next_prefetch(self, now=None):
+        """Seconds until the next prefetch slot aligned to the upstream publish times"""
+        now = time.time() if now is None else now
+        elapsed = (now - self.prefetch_offset) % self.prefetch_interval
+        return self.prefetch_interval - elapsed
+    
+    async def prefetch_loop(self):
+        """Keep readings warm, backing off with jitter while upstreams are failing"""
+        failures_in_row = 0
+        while True:
+            try:
+                failed = await self.prefetch_all()
+            except Exception as e:
+                logger.error(f"Prefetch failed: {str(e)}")
+                failed = 1
+            
+            if failed:
+                failures_in_row += 1
+                backoff = min(self.prefetch_interval, self.prefetch_backoff_base * 2 ** (failures_in_row - 1))
+                delay = random.uniform(backoff / 2, backoff)
+                logger.warning(f"Prefetch had {failed} failed source(s), retrying in {delay:.0f}s")
+            else:
+                failures_in_row = 0
+                delay = self.seconds_until_next_prefetch()
+            
+            try:
+                await asyncio.to_thread(self.history.compact)
+            except Exception as e:
+                logger.error(f"History compaction failed: {str(e)}")
+            
+            if self.notify_task is None or self.notify_task.done():
+                self.notify_task = asyncio.create_task(self.notify_subscribers())
+            else:
+                logger.warning("Previous alert fan-out still running, skipping this evaluation")
+            await asyncio.sleep(delay)
+    
+    async def apply_subscription_changes(self):
+        """Apply the subscription changes responders queued in the snapshot backend"""
+        if self.snapshots is None or self.role == 'responder':
+            return 0
+        changes = await asyncio.to_thread(self.snapshots.take_subscriptions)
+        for chat_id, threshold in changes:
+            if threshold is None:
+                self.subscriptions.unsubscribe(chat_id)
+            else:
+                self.subscriptions.subscribe(chat_id, threshold)
+        return len(changes)
+    
+    async def notify_subscribers(self):
+        """Evaluate all subscriptions against the shared cached reading and send alerts"""
+        try:
+            await self.apply_subscription_changes()
+            if self.application is None:
+                return
+            city = self.sources.primary
+            avg_aqi = self.city_summary(city, await self.fetch_city(city.key))
+            if avg_aqi is None:
+                return
+            await self.dispatcher.dispatch(self.application.bot, avg_aqi, self.format_alert_message)
+        except Exception as e:
+            logger.error(f"Subscriber notification failed: {str(e)}")
+    
+    async def start_prefetch(self, application=None):
+        """Start the background prefetch job"""
+        self.application = application
+        if self.prefetch_enabled and self.prefetch_task is None:
+            self.prefetch_task = asyncio.create_task(self.prefetch_loop())
+    
+    async def sync_snapshots(self):
+        """Load snapshots published since the last sync into the cache, returning the keys that changed
+        
+        The store is read in a worker thread; decoding and cache updates
+        stay on the event loop.
+        """
+        version, snapshots = await asyncio.to_thread(self.snapshots.load, self.snapshot_version)
+        changed = []
+        for key, (stored_at, payload) in snapshots.items():
+            if key.startswith(VIEW_PREFIX):
+                self.shared_views[key[len(VIEW_PREFIX):]] = payload
+                continue
+            readings = decode_readings(payload, self.sources)
+            if self.cache.put(key, readings, stored_at):
+                self.index_readings(readings)
+                changed.append(key)
+        self.snapshot_version = version
+        return changed
+    
+    async def restore_snapshots(self):
+        """Seed an empty cache from the last published snapshots so answers need not wait on a cold fetch"""
+        try:
+            keys = await self.sync_snapshots()
+        except Exception as e:
+            logger.error(f"Could not restore snapshots: {str(e)}")
+            return
+        self.restored = {key: self.cache.peek(key) for key in keys}
+        if keys:
+            oldest = min(entry.stored_at for entry in self.restored.values())
+            logger.info(f"Restored {len(keys)} snapshot(s), oldest from {datetime.fromtimestamp(oldest):%Y-%m-%d %H:%M}")
+    
+    async def snapshot_sync_loop(self):
+        """Keep a responder's cache in step with the shared snapshot store"""
+        while True:
+            await asyncio.sleep(self.snapshot_poll)
+            try:
+                await self.sync_snapshots()
+            except Exception as e:
+                logger.error(f"Snapshot sync failed: {str(e)}")
+    
+    async def startup(self, application=None):
+        """Start background jobs and the metrics endpoint (used as the Application post_init hook)
+        
+        Responders load the published snapshots and follow the store instead
+        of prefetching. Other roles restore the last snapshots before the
+        first prefetch, so the first users get those readings immediately.
+        """
+        if self.role == 'responder':
+            self.application = application
+            await self.sync_snapshots()
+            if self.snapshot_task is None:
+                self.snapshot_task = asyncio.create_task(self.snapshot_sync_loop())
+        else:
+            if self.snapshots is not None and not self.cache.entries:
+                await self.restore_snapshots()
+            await self.start_prefetch(application)
+        if self.metrics_server is not None and self.metrics_server.server is None:
+            await self.metrics_server.start()
+    
+    def city_summary(self, city, readings):
+        """Headline value for a city from its 'ok' readings: their average or its summary station, or None"""
+        if city.summary == 'average':
+            values = [r.value for r in readings if r.status in USABLE]
+            return int(sum(values) / len(values)) if values else None
+        for reading in readings:
+            if reading.station.id == city.summary:
+                return reading.value if reading.status in USABLE else None
+        return None
+    
+    def headline(self, city):
+        """What a city's headline value is: its average or its summary station's name"""
+        return "Average" if city.summary == 'average' else self.sources.stations[city.summary].name
+    
+    def format_alert_message(self, avg_aqi, threshold, above):
+        """Format a subscription alert for a threshold crossing of the primary city's headline"""
+        city = self.sources.primary
+        level, description = self.get_level(city.scale, avg_aqi)
+        value = f"{self.headline(city)} {city.scale.upper()}"
+        if above:
+            message = f"🚨 **{city.name} Air Quality Alert**\n\n"
+            message += f"📊 {value} is now **{avg_aqi}**, above your threshold of {threshold}.\n"
+        else:
+            message = f"✅ **{city.name} Air Quality Update**\n\n"
+            message += f"📊 {value} is back down to **{avg_aqi}**, below your threshold of {threshold}.\n"
+        message += f"🏥 Status: {level}\n"
+        message += f"ℹ️ {description}\n\n"
+        message += "Use /aqi for the full report or /unsubscribe to stop alerts."
+        return message
+    
+    def format_station_labels(self, readings):
+        """Summarise which stations are stale, rejected or missing"""
+        labels = ""
+        for status, label in (('stale', "⚠️ Stale"), ('outlier', "🚫 Outlier"), ('invalid', "❓ Invalid"),
+                              ('missing', "❌ No data")):
+            names = [r.station.name for r in readings if r.status == status]
+            if names:
+                labels += f"{label}: {', '.join(names)}\n"
+        return labels
+    
+    def format_as_of(self, as_of):
+        """Label for data served from an older snapshot"""
+        return f"🕒 Data as of {datetime.fromtimestamp(as_of).strftime('%H:%M')} (live data unavailable)\n"
+    
+    def format_city_section(self, city, readings, summary, as_of=None):
+        """Format one city's block of the regional report"""
+        scale = city.scale.upper()
+        parts = [f"{city.flag} **{city.name.upper()} ({scale})**\n", DIVIDER]
+        
+        if all(r.status == 'missing' for r in readings):
+            parts.append(f"❌ Unable to fetch {city.name} {scale} data.\n\n")
+            return parts
+        
+        if as_of is not None:
+            parts.append(self.format_as_of(as_of))
+        
+        if summary is not None:
+            level, description = self.get_level(city.scale, summary)
+            headline = self.headline(city)
+            parts.append(f"📊 **{headline} {scale}: {summary}**\n🏥 Status: {level}\nℹ️ {description}\n\n")
+        
+        listed = [r for r in readings if r.station.id != city.summary and r.status in ('ok', 'stale')]
+        for reading in listed[:city.report_stations]:
+            level, _ = self.get_level(city.scale, reading.value)
+            parts.append(f"📍 {reading.station.name}: {reading.value} {level.split()[0]}\n")
+        
+        parts.append(self.format_station_labels(readings))
+        return parts
+    
+    @timed(FORMAT_SECONDS, view='report')
+    def format_aqi_message(self, report, updated_at=None, as_of=None):
+        """Format every city's readings into the regional report
+        
+        ``report`` maps city keys to their readings and ``as_of`` maps city
+        keys to the time of an older snapshot being served. Per-snapshot
+        aggregates (city headlines) are computed once and the text is
+        assembled in a single pass.
+        """
+        as_of = as_of or {}
+        cities = [self.sources.cities[key] for key in report]
+        summaries = [self.city_summary(city, report[city.key]) for city in cities]
+        updated = datetime.fromtimestamp(updated_at) if updated_at else datetime.now()
+        
+        parts = [
+            "🌍 **Regional Air Quality Report**\n",
+            f"📅 Updated: {updated.strftime('%Y-%m-%d %H:%M:%S')}\n\n"
+        ]
+        for index, (city, summary) in enumerate(zip(cities, summaries)):
+            if index:
+                parts.append("\n")
+            parts.extend(self.format_city_section(city, report[city.key], summary, as_of.get(city.key)))
+        
+        # Comparison Section (the first two cities)
+        parts.append("\n📈 **COMPARISON**\n")
+        parts.append(DIVIDER)
+        
+        if len(cities) >= 2 and summaries[0] is not None and summaries[1] is not None:
+            first, second = cities[0], cities[1]
+            if summaries[0] < summaries[1]:
+                parts.append(f"🟢 {first.name} air quality is currently better than {second.name}\n")
+            elif summaries[0] > summaries[1]:
+                parts.append(f"🔴 {second.name} air quality is currently better than {first.name}\n")
+            else:
+                parts.append("🟡 Both cities have similar air quality levels\n")
+            parts.append(f"   {first.name} {first.scale.upper()}: {summaries[0]} | "
+                         f"{second.name} {second.scale.upper()}: {summaries[1]}\n")
+        
+        # Health Recommendations (based on the first city, the primary focus)
+        parts.append("\n💡 **HEALTH RECOMMENDATIONS**\n")
+        parts.append(DIVIDER)
+        
+        if cities and summaries[0] is not None and cities[0].scale == 'aqi':
+            parts.append(self.get_health_recommendations(summaries[0]))
+        
+        sources = " | ".join(f"{self.sources.providers[city.provider].label} ({city.name})" for city in cities)
+        parts.append(f"\n🔄 Data sources: {sources}")
+        
+        return "".join(parts)
+    
+    def get_health_recommendations(self, avg_aqi):
+        """Health recommendations for a Jakarta average AQI"""
+        if avg_aqi <= 50:
+            return "• Perfect for outdoor activities\n• All age groups can enjoy outdoor exercise\n"
+        elif avg_aqi <= 100:
+            return "• Safe for most outdoor activities\n• Sensitive individuals should monitor symptoms\n"
+        elif avg_aqi <= 150:
+            return "• Limit prolonged outdoor activities\n• Sensitive groups should reduce outdoor exercise\n"
+        elif avg_aqi <= 200:
+            return "• Avoid outdoor activities\n• Everyone should limit outdoor exposure\n"
+        else:
+            return "• Stay indoors, use air purifiers\n• Wear N95 masks if going outside\n"
+    
+    def page_count(self, readings):
+        return max(1, -(-len(readings) // self.details_page_size))
+    
+    def format_station_block(self, city, reading):
+        """Format one station's reading with its pollutant breakdown"""
+        scale = city.scale.upper()
+        parts = [f"📍 **{reading.station.name}**\n"]
+        if reading.status == 'missing':
+            parts.append("❌ No response from this station\n\n")
+            return parts
+        
+        if reading.status == 'invalid':
+            parts.append(f"🔢 {scale}: N/A\n❓ No valid reading from this station\n")
+        else:
+            level, _ = self.get_level(city.scale, reading.value)
+            parts.append(f"🔢 {scale}: {reading.value} ({level})\n")
+        if reading.status == 'stale':
+            parts.append("⚠️ Stale reading, not counted in the average\n")
+        elif reading.status == 'outlier':
+            parts.append("🚫 Far from the other stations, not counted in the average\n")
+        
+        if reading.pollutants:
+            parts.append("🧪 **Pollutant Details:**\n")
+            for pollutant, value in reading.pollutants.items():
+                parts.append(f"  • {pollutant.upper()}: {value}\n")
+        
+        if reading.observed_label:
+            parts.append(f"⏰ Last Updated: {reading.observed_label}\n")
+        
+        parts.append("\n")
+        return parts
+    
+    @timed(FORMAT_SECONDS, view='details')
+    def format_city_details(self, city_key, readings, as_of=None, page=0):
+        """Format one page of the per-station report for a city with pollutant breakdowns"""
+        city = self.sources.cities[city_key]
+        scale = city.scale.upper()
+        if all(r.status == 'missing' for r in readings):
+            return f"❌ Unable to fetch detailed {city.name} {scale} data."
+        
+        parts = [f"{city.flag} **Detailed {city.name} {scale} Report**\n"]
+        pages = self.page_count(readings)
+        if pages > 1:
+            parts.append(f"📄 Page {page + 1}/{pages}\n")
+        if as_of is not None:
+            parts.append(self.format_as_of(as_of))
+        parts.append("\n")
+        start = page * self.details_page_size
+        for reading in readings[start:start + self.details_page_size]:
+            parts.extend(self.format_station_block(city, reading))
+        
+        # Health advisory (city-wide, on every page)
+        summary = self.city_summary(city, readings)
+        if summary is not None:
+            level, description = self.get_level(city.scale, summary)
+            parts.append(f"🏥 **Health Advisory:**\nStatus: {level}\nRecommendation: {description}\n")
+        return "".join(parts)
+    
+    @timed(FORMAT_SECONDS, view='nearest')
+    def format_nearest_message(self, nearest, readings):
+        """Format readings for the stations closest to a shared location
+        
+        ``nearest`` is a list of ``(station_id, distance_km)`` pairs and
+        ``readings`` maps station ids to their current Reading.
+        """
+        if not nearest:
+            return "📭 No monitoring stations with known coordinates yet. Try /aqi for the regional report."
+        
+        parts = ["📍 **Air Quality Near You**\n\n"]
+        for station_id, km in nearest:
+            station = self.sources.stations[station_id]
+            scale = station.city.scale.upper()
+            parts.append(f"{station.city.flag} **{station.name}** ({km:.1f} km)\n")
+            reading = readings.get(station_id)
+            if reading is None or reading.status in ('missing', 'invalid'):
+                parts.append(f"❌ No current {scale} reading\n\n")
+                continue
+            level, _ = self.get_level(station.city.scale, reading.value)
+            parts.append(f"🔢 {scale}: {reading.value} ({level})\n")
+            if reading.status == 'stale':
+                parts.append("⚠️ Stale reading\n")
+            elif reading.status == 'outlier':
+                parts.append("🚫 Far from nearby stations, treat with caution\n")
+            if reading.observed_label:
+                parts.append(f"⏰ Last Updated: {reading.observed_label}\n")
+            parts.append("\n")
+        
+        # Advice follows the closest station with a usable reading
+        for station_id, _ in nearest:
+            reading = readings.get(station_id)
+            if reading is not None and reading.status in USABLE:
+                _, description = self.get_level(reading.station.city.scale, reading.value)
+                parts.append(f"🏥 **Health Advisory:** {description}\n")
+                break
+        return "".join(parts)
+    
+    @timed(FORMAT_SECONDS, view='inline')
+    def build_inline_index(self):
+        """Rebuild the inline-mode results from cached readings (never fetches)"""
+        index = PrefixIndex()
+        oldest = None
+        for city in self.sources.cities.values():
+            readings = self.cached_city(city.key)
+            scale = city.scale.upper()
+            summary = self.city_summary(city, readings)
+            if summary is not None:
+                level, description = self.get_level(city.scale, summary)
+                headline = self.headline(city)
+                index.add(InlineQueryResultArticle(
+                    id=f"city:{city.key}",
+                    title=f"{city.flag} {city.name}: {scale} {summary}",
+                    description=f"{headline} · {level}",
+                    input_message_content=InputTextMessageContent(
+                        f"{city.flag} {city.name} air quality\n"
+                        f"📊 {headline} {scale}: {summary} ({level})\n"
+                        f"ℹ️ {description}"
+                    )
+                ), [city.name, city.key])
+            
+            for reading in readings:
+                if reading.status not in ('ok', 'stale') or reading.station.id == city.summary:
+                    continue
+                level, _ = self.get_level(city.scale, reading.value)
+                updated = f"\n⏰ {reading.observed_label}" if reading.observed_label else ""
+                index.add(InlineQueryResultArticle(
+                    id=f"station:{reading.station.id}",
+                    title=f"📍 {reading.station.name}: {scale} {reading.value}",
+                    description=f"{city.name} · {level}",
+                    input_message_content=InputTextMessageContent(
+                        f"📍 {reading.station.name}, {city.name}\n"
+                        f"🔢 {scale}: {reading.value} ({level}){updated}"
+                    )
+                ), [reading.station.name, f"{city.name} {reading.station.name}"])
+            
+            for unit in self.sources.fetch_units(city):
+                entry = self.cache.peek(unit.key)
+                if entry is not None:
+                    oldest = entry.fetched_at if oldest is None else min(oldest, entry.fetched_at)
+        
+        self.inline_index = index
+        # Answers stay valid until the oldest reading behind them leaves the cache TTL
+        self.inline_fresh_until = oldest + self.cache.ttl if oldest is not None else 0.0
+    
+    @timed(FORMAT_SECONDS, view='trend')
+    def format_trend_message(self):
+        """Format rolling headline/PM2.5 trends for the primary city's stations from recorded history"""
+        # Deferred with NumPy behind it, which the other views never need
+        from aqi_trend import build_trends, peak_hours, sparkline
+        
+        now = int(time.time())
+        city = self.sources.primary
+        scale = city.scale.upper()
+        stations = city.current_stations()
+        per_station, citywide = build_trends(
+            self.history, [station.id for station in stations], now, days=self.trend_days
+        )
+        if not per_station:
+            return "📭 Not enough history yet. Trends appear once a few hours of readings have been recorded."
+        
+        def fmt(value):
+            return "N/A" if value != value else f"{value:.0f}"
+        
+        parts = [f"📈 **{city.name} Air Quality Trend ({self.trend_days} days)**\n\n"]
+        labels = (('aqi', scale), ('pm25', "PM2.5"))
+        for pollutant, label in labels:
+            trend = citywide.get(pollutant)
+            if trend is None or trend.latest != trend.latest:
+                continue
+            parts.append(f"🏙 **City-wide {label}:** {trend.spark} now {fmt(trend.latest)} {trend.direction}\n")
+            parts.append(f"   24h avg {fmt(trend.recent_mean)} (previous 24h {fmt(trend.previous_mean)}) | "
+                         f"min {fmt(trend.minimum)} / max {fmt(trend.maximum)}\n")
+        
+        parts.append(f"\n📍 **By station ({scale})**\n")
+        for station in stations:
+            trend = per_station.get(station.id, {}).get('aqi')
+            if trend is None or trend.latest != trend.latest:
+                continue
+            peaks = peak_hours(trend.profile)
+            worst = f", worst ~{peaks[1]:02d}:00" if peaks else ""
+            parts.append(f"{station.name}: {trend.spark} {fmt(trend.latest)} {trend.direction} "
+                         f"({fmt(trend.minimum)}-{fmt(trend.maximum)}{worst})\n")
+        
+        typical = [(label, citywide[pollutant].profile) for pollutant, label in labels
+                   if pollutant in citywide and peak_hours(citywide[pollutant].profile)]
+        if typical:
+            parts.append("\n🕐 **Typical day (by hour, UTC+7)**\n")
+        for label, profile in typical:
+            best, worst = peak_hours(profile)
+            parts.append(f"{label}: {sparkline(profile)} cleanest ~{best:02d}:00, worst ~{worst:02d}:00\n")
+        
+        parts.append("\n↗ worse · ↘ better · → steady vs the previous 24h")
+        return "".join(parts)
+    
+    def trend_text(self):
+        """The /trend text: rendered from local history, or as published by the ingest worker on responders"""
+        if self.role == 'responder':
+            return self.shared_views.get('trend') or (
+                "📭 No trend published yet. Trends appear once the ingest worker has recorded a few hours of readings.")
+        return self.render('trend', self.cache.version, self.format_trend_message)
+    
+    def render(self, view, version, build):
+        """Return the text for ``view`` at data ``version``, building it only once
+        
+        Every user sees the same content for a data snapshot, so rendered text
+        is reused until the cache publishes a new version.
+        """
+        if version != self.rendered_version:
+            self.rendered = {}
+            self.rendered_version = version
+        text = self.rendered.get(view)
+        if text is None:
+            text = self.rendered[view] = build()
+        return text
+    
+    async def get_report_message(self):
+        """Fetch every configured city and return the (cached) regional report"""
+        version = self.cache.version
+        report = await self.fetch_cities()
+        as_of = {key: self.snapshot_time(self.sources.cities[key]) for key in report}
+        as_of = {key: ts for key, ts in as_of.items() if ts is not None}
+        # Stale/missing labels can change without new data, so they are part of the key
+        statuses = tuple(r.status for readings in report.values() for r in readings)
+        return self.render(
+            ('report', statuses, tuple(sorted(as_of.items()))), version,
+            lambda: self.format_aqi_message(report, self.cache.updated_at, as_of)
+        )
+    
+    def buttons(self, *specs):
+        """Buttons for ``(label, view, *args)`` specs, leaving out any whose callback_data cannot be encoded"""
+        buttons = []
+        for label, view, *args in specs:
+            data = self.callbacks.encode(view, *args)
+            if data is not None:
+                buttons.append(InlineKeyboardButton(label, callback_data=data))
+        return buttons
+    
+    def details_keyboard(self, city_key, readings, page):
+        """Drill-down buttons for the stations on a details page, page navigation, refresh and back"""
+        start = page * self.details_page_size
+        stations = self.buttons(*(
+            (f"📍 {r.station.name}", STATION, r.station.id)
+            for r in readings[start:start + self.details_page_size] if r.status != 'missing'
+        ))
+        rows = [stations[i:i + 2] for i in range(0, len(stations), 2)]
+        navigation = []
+        if page > 0:
+            navigation.append(("◀️ Previous", DETAILS, city_key, page - 1))
+        if page + 1 < self.page_count(readings):
+            navigation.append(("Next ▶️", DETAILS, city_key, page + 1))
+        rows.append(self.buttons(*navigation))
+        rows.append(self.buttons(("🔄 Refresh", DETAILS, city_key, page)))
+        rows.append([InlineKeyboardButton("🔙 Back", callback_data=encode_inline(REPORT))])
+        return InlineKeyboardMarkup([row for row in rows if row])
+    
+    async def get_details_view(self, city_key, page=0):
+        """Fetch one city and return the (cached) text and keyboard of one page of its details"""
+        version = self.cache.version
+        readings = await self.fetch_city(city_key, detail=True)
+        as_of = self.snapshot_time(self.sources.cities[city_key], detail=True)
+        page = min(page, self.page_count(readings) - 1)
+        statuses = tuple(r.status for r in readings)
+        return self.render(
+            ('details', city_key, statuses, as_of, page), version,
+            lambda: (self.format_city_details(city_key, readings, as_of, page),
+                     self.details_keyboard(city_key, readings, page))
+        )
+    
+    async def get_station_view(self, station):
+        """Fetch a station's city and return the text and keyboard of that station's details"""
+        city = station.city
+        # Stations found by bulk ingestion have no detail feed of their own
+        detail = any(s.id == station.id for s in city.stations)
+        readings = await self.fetch_city(city.key, detail=detail)
+        index = next((i for i, r in enumerate(readings) if r.station.id == station.id), None)
+        reading = readings[index] if index is not None else Reading.missing(station)
+        as_of = self.snapshot_time(city, detail=detail)
+        
+        parts = [f"{city.flag} **{city.name}**\n"]
+        if as_of is not None:
+            parts.append(self.format_as_of(as_of))
+        parts.append("\n")
+        parts.extend(self.format_station_block(city, reading))
+        if reading.status in USABLE:
+            _, description = self.get_level(city.scale, reading.value)
+            parts.append(f"🏥 **Health Advisory:** {description}\n")
+        
+        page = index // self.details_page_size if index is not None and detail else 0
+        rows = [
+            self.buttons(("🔄 Refresh", STATION, station.id)),
+            self.buttons(("🔙 Back", DETAILS, city.key, page)) or self.buttons(("🔙 Back", REPORT))
+        ]
+        keyboard = InlineKeyboardMarkup([row for row in rows if row])
+        return "".join(parts), keyboard
+    
+    @timed(HANDLER_SECONDS, handler='start_command')
+    async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /start command"""
+        await update.message.reply_text(WELCOME_TEXT, reply_markup=MAIN_MENU_KEYBOARD, parse_mode='Markdown')
+    
+    @timed(HANDLER_SECONDS, handler='aqi_command')
+    async def aqi_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /aqi command"""
+        await update.message.reply_text("🔄 Fetching regional air quality data...")
+        
+        message = await self.get_report_message()
+        await update.message.reply_text(message, reply_markup=self.report_keyboard, parse_mode='Markdown')
+    
+    @timed(HANDLER_SECONDS, handler='location_command')
+    async def location_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle a shared location: report the nearest stations"""
+        location = update.message.location
+        await update.message.reply_text("🔄 Finding the nearest monitoring stations...")
+        
+        report = await self.fetch_cities()
+        readings = {r.station.id: r for city_readings in report.values() for r in city_readings}
+        # Keep the closest distinct monitors the report has a reading for; feeds
+        # resolving to the same monitor (same uid) are counted once
+        nearest = []
+        uids = set()
+        for station_id, km in self.station_index.nearest(location.latitude, location.longitude, k=self.nearest_count * 3):
+            reading = readings.get(station_id)
+            if reading is None or (reading.uid is not None and reading.uid in uids):
+                continue
+            uids.add(reading.uid)
+            nearest.append((station_id, km))
+            if len(nearest) == self.nearest_count:
+                break
+        message = self.format_nearest_message(nearest, readings)
+        await update.message.reply_text(message, reply_markup=self.report_keyboard, parse_mode='Markdown')
+    
+    @timed(HANDLER_SECONDS, handler='inline_query')
+    async def inline_query(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Answer inline queries from the precomputed index; never fetches upstream"""
+        if self.inline_version != self.cache.version:
+            self.build_inline_index()
+            self.inline_version = self.cache.version
+        
+        results = self.inline_index.search(update.inline_query.query)
+        # Let Telegram cache the answer for as long as the data behind it is fresh
+        cache_time = int(max(10, min(self.cache.ttl, self.inline_fresh_until - time.monotonic())))
+        await update.inline_query.answer(results, cache_time=cache_time)
+    
+    @timed(HANDLER_SECONDS, handler='trend_command')
+    async def trend_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /trend command"""
+        await update.message.reply_text(self.trend_text(), reply_markup=TREND_KEYBOARD, parse_mode='Markdown')
+    
+    @timed(HANDLER_SECONDS, handler='subscribe_command')
+    async def subscribe_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /subscribe [threshold] command"""
+        threshold = DEFAULT_THRESHOLD
+        if context.args:
+            try:
+                threshold = int(context.args[0])
+            except ValueError:
+                threshold = 0
+            if not 1 <= threshold <= 500:
+                await update.message.reply_text("❌ Please give a threshold between 1 and 500, e.g. `/subscribe 150`", parse_mode='Markdown')
+                return
+        
+        if self.role == 'responder':
+            await asyncio.to_thread(self.snapshots.queue_subscription, update.effective_chat.id, threshold)
+        else:
+            self.subscriptions.subscribe(update.effective_chat.id, threshold)
+        city = self.sources.primary
+        level, _ = self.get_level(city.scale, threshold)
+        value = f"{self.headline(city).lower()} {city.scale.upper()}"
+        await update.message.reply_text(
+            f"🔔 **Subscribed!**\n\nYou'll get an alert when {city.name}'s {value} rises above **{threshold}** ({level}) "
+            "and again when it drops back below.\n\nUse /unsubscribe to stop alerts.",
+            parse_mode='Markdown'
+        )
+    
+    @timed(HANDLER_SECONDS, handler='unsubscribe_command')
+    async def unsubscribe_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /unsubscribe command"""
+        if self.role == 'responder':
+            # Only the ingest worker knows whether the chat was subscribed
+            await asyncio.to_thread(self.snapshots.queue_subscription, update.effective_chat.id, None)
+            await update.message.reply_text("🔕 Air quality alerts are off for this chat.")
+        elif self.subscriptions.unsubscribe(update.effective_chat.id):
+            await update.message.reply_text("🔕 You have been unsubscribed from air quality alerts.")
+        else:
+            await update.message.reply_text("ℹ️ You are not subscribed. Use /subscribe to get alerts.")
+    
+    @timed(HANDLER_SECONDS, handler='stats_command')
+    async def stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /stats command (operators only)"""
+        if update.effective_chat.id not in self.operator_chat_ids:
+            return
+        
+        stats = self.cache.stats()
+        stats_text = "📈 **Cache Statistics**\n\n"
+        stats_text += f"🗂 Entries: {stats['entries']}\n"
+        stats_text += f"✅ Hits: {stats['hits']}\n"
+        stats_text += f"♻️ Stale hits: {stats['stale_hits']}\n"
+        stats_text += f"❌ Misses: {stats['misses']}\n"
+        stats_text += f"🔗 Coalesced: {stats['coalesced']}\n"
+        stats_text += f"🌐 Upstream fetches: {stats['upstream_fetches']} ({stats['upstream_errors']} failed)\n"
+        stats_text += f"🎯 Hit ratio: {stats['hit_ratio']:.1%}\n"
+        if self.role != 'responder':
+            stats_text += f"🔔 Subscribers: {self.subscriptions.count()}\n"
+        if self.snapshots is not None:
+            version = self.snapshot_version or await asyncio.to_thread(self.snapshots.version)
+            stats_text += f"🧩 Role: {self.role}, snapshot version {version}\n"
+        for origin, upstream in self.upstreams.items():
+            stats_text += f"🔌 {origin}: {upstream.breaker.state.replace('_', '-')}, timeout {upstream.adaptive_timeout.current():.1f}s\n"
+        
+        await update.message.reply_text(stats_text, parse_mode='Markdown')
+    
+    @timed(HANDLER_SECONDS, handler='help_command')
+    async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /help command"""
+        help_text = """
+🆘 **Regional Air Quality Bot Help**
+
+**Commands:**
+• `/start` - Welcome message and main menu
+• `/air` - Get current air quality comparison
+• `/trend` - Jakarta AQI and PM2.5 trends over the past week
+• `/help` - Show this help message
+• `/subscribe [AQI]` - Alert me when Jakarta average AQI crosses a threshold (default 150)
+• `/unsubscribe` - Stop air quality alerts
+• 📍 Share your location - Readings from the nearest stations
+• In any chat, type the bot's @username followed by a city or station name to share its current reading
+
+**Understanding AQI vs PSI:**
+
+🇮🇩 **AQI (Air Quality Index) - Jakarta:**
+• 0-50: Good 🟢
+• 51-100: Moderate 🟡
+• 101-150: Unhealthy for Sensitive Groups 🟠
+• 151-200: Unhealthy 🔴
+• 201-300: Very Unhealthy 🟣
+• 301+: Hazardous ⚫
+
+🇸🇬 **PSI (Pollutant Standards Index) - Singapore:**
+• 0-50: Good 🟢
+• 51-100: Moderate 🟡
+• 101-200: Unhealthy 🟠
+• 201-300: Very Unhealthy 🔴
+• 301+: Hazardous ⚫
+
+**Pollutants Monitored:**
+• PM2.5 & PM10: Particulate matter
+• NO2: Nitrogen dioxide
+• O3: Ozone
+• CO: Carbon monoxide
+• SO2: Sulfur dioxide
+
+**Data Sources:** 
+• Jakarta: AQICN.org
+• Singapore: Data.gov.sg
+
+**Developer:** @your_username
+
+For issues or suggestions, contact the developer.
+        """
+        
+        await update.message.reply_text(help_text, parse_mode='Markdown')
+    
+    def needs_wait(self, city_keys, detail=False):
+        """Whether answering for these cities would wait on an upstream (nothing servable is cached)"""
+        if self.role == 'responder':
+            return False
+        servable = self.cache.ttl + self.cache.stale_ttl
+        for key in city_keys:
+            for unit in self.sources.fetch_units(self.sources.cities[key], detail):
+                entry = self.cache.peek(unit.key)
+                if entry is None or entry.age() >= servable:
+                    return True
+        return False
+    
+    async def edit_view(self, query, text, reply_markup=None, parse_mode='Markdown'):
+        """Edit the callback's message unless it already shows exactly this content
+        
+        Responders cannot know what other workers did to a message, so they
+        always edit and rely on Telegram rejecting no-op edits.
+        """
+        key = (query.message.chat.id, query.message.message_id) if query.message else query.inline_message_id
+        markup = reply_markup.to_json() if reply_markup is not None else ""
+        digest = hashlib.blake2b(f"{text}\0{markup}".encode(), digest_size=16).digest()
+        if self.role != 'responder' and self.message_digests.get(key) == digest:
+            return False
+        
+        try:
+            await query.edit_message_text(text, reply_markup=reply_markup, parse_mode=parse_mode)
+        except BadRequest as e:
+            # Sent before this process saw the message; Telegram rejects no-op edits
+            if "not modified" not in str(e).lower():
+                raise
+        self.message_digests[key] = digest
+        self.message_digests.move_to_end(key)
+        if len(self.message_digests) > self.message_digest_limit:
+            self.message_digests.popitem(last=False)
+        return True
+    
+    @timed(HANDLER_SECONDS, handler='button_callback')
+    async def button_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle button callbacks by routing them through the view table"""
+        query = update.callback_query
+        chat_id = query.message.chat.id if query.message else None
+        
+        if not self.user_limiter.try_acquire(query.from_user.id) or (
+                chat_id is not None and not self.chat_limiter.try_acquire(chat_id)):
+            await query.answer("⏳ Too many taps, please wait a moment.")
+            return
+        
+        decoded = self.callbacks.decode(query.data)
+        view = self.views.get(decoded[0]) if decoded is not None else None
+        if view is None or len(decoded[1]) != view[1]:
+            # From an older version of the bot, or its state has been evicted
+            await query.answer("⌛ This button has expired.")
+            await self.show_menu(query)
+            return
+        handler, _ = view
+        
+        # The same button on the same message is already being answered
+        inflight_key = (chat_id, query.message.message_id if query.message else query.inline_message_id, query.data)
+        if inflight_key in self.callbacks_inflight:
+            await query.answer()
+            return
+        self.callbacks_inflight.add(inflight_key)
+        try:
+            await query.answer()
+            await handler(query, *decoded[1])
+        finally:
+            self.callbacks_inflight.discard(inflight_key)
+    
+    async def show_menu(self, query):
+        await self.edit_view(query, WELCOME_TEXT, MAIN_MENU_KEYBOARD)
+    
+    async def show_about(self, query):
+        await self.edit_view(query, ABOUT_TEXT, ABOUT_KEYBOARD)
+    
+    async def show_report(self, query):
+        if self.needs_wait(self.sources.cities):
+            await self.edit_view(query, "🔄 Fetching regional air quality data...")
+        
+        message = await self.get_report_message()
+        await self.edit_view(query, message, self.report_keyboard)
+    
+    async def show_trend(self, query):
+        await self.edit_view(query, self.trend_text(), TREND_KEYBOARD)
+    
+    async def show_details(self, query, city_key, page):
+        city = self.sources.cities.get(city_key)
+        if city is None or not page.isdigit():
+            await self.show_menu(query)
+            return
+        if self.needs_wait([city_key], detail=True):
+            await self.edit_view(query, f"🔄 Fetching detailed {city.name} air quality data...")
+        
+        text, keyboard = await self.get_details_view(city_key, int(page))
+        await self.edit_view(query, text, keyboard)
+    
+    async def show_station(self, query, station_id):
+        station = self.sources.stations.get(station_id)
+        if station is None:
+            await self.show_menu(query)
+            return
+        text, keyboard = await self.get_station_view(station)
+        await self.edit_view(query, text, keyboard)
+    
+    def build_application(self):
+        """Build the Application with every handler registered"""
+        application = (
+            Application.builder()
+            .token(self.telegram_token)
+            .base_url(f"{self.telegram_api_url.rstrip('/')}/bot")
+            .request(InstrumentedRequest(connection_pool_size=256))
+            .get_updates_request(InstrumentedRequest())
+            .post_init(self.startup)
+            .post_shutdown(self.close)
+            .build()
+        )
+        
+        # Add handlers
+        application.add_handler(CommandHandler("start", self.start_command))
+        application.add_handler(CommandHandler("aqi", self.aqi_command))
+        application.add_handler(CommandHandler("help", self.help_command))
+        application.add_handler(CommandHandler("trend", self.trend_command))
+        application.add_handler(CommandHandler("subscribe", self.subscribe_command))
+        application.add_handler(CommandHandler("unsubscribe", self.unsubscribe_command))
+        application.add_handler(CommandHandler("stats", self.stats_command))
+        application.add_handler(MessageHandler(filters.LOCATION, self.location_command))
+        application.add_handler(InlineQueryHandler(self.inline_query))
+        application.add_handler(CallbackQueryHandler(self.button_callback))
+        return application
+    
+    async def run_ingest(self):
+        """Fetch, publish snapshots and send alerts without receiving updates (BOT_ROLE=ingest)"""
+        application = self.build_application()
+        async with application:
+            try:
+                await self.startup(application)
+                await asyncio.Event().wait()
+            finally:
+                await self.close()
+    
+    def run(self):
+        """Run the bot with long polling, or as a webhook server when BOT_MODE=webhook
+        
+        An ingest worker receives no updates and runs only the background jobs.
+        Responders must use webhooks: Telegram serves getUpdates to one
+        poller at a time.
+        """
+        print(f"🤖 Jakarta Air Quality Bot starting ({self.role})...")
+        if self.role == 'ingest':
+            try:
+                asyncio.run(self.run_ingest())
+            except KeyboardInterrupt:
+                pass
+            return
+        
+        application = self.build_application()
+        
+        # Start the bot
+        if self.role == 'responder' and os.getenv("BOT_MODE", "polling") != "webhook":
+            raise RuntimeError("Responder workers need BOT_MODE=webhook")
+        if os.getenv("BOT_MODE", "polling") == "webhook":
+            # Served behind a reverse proxy (e.g. the Heroku router) that terminates TLS
+            url_path = os.getenv("WEBHOOK_PATH", "telegram")
+            application.run_webhook(
+                listen=os.getenv("WEBHOOK_LISTEN", "0.0.0.0"),
+                port=int(os.getenv("PORT", "8443")),
+                url_path=url_path,
+                webhook_url=f"{os.getenv('WEBHOOK_URL').rstrip('/')}/{url_path}",
+                secret_token=os.getenv("WEBHOOK_SECRET"),
+                allowed_updates=ALLOWED_UPDATES
+            )
+        else:
+            application.run_polling(allowed_updates=ALLOWED_UPDATES)
+
+if __name__ == "__main__":
+    # Configuration
+    TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "YOUR_TELEGRAM_BOT_TOKEN")
+    AQICN_API_TOKEN = os.getenv("AQICN_API_TOKEN", "YOUR_AQICN_API_TOKEN")
+    
+    # Validate tokens
+    if TELEGRAM_BOT_TOKEN == "YOUR_TELEGRAM_BOT_TOKEN":
+        print("❌ Please set your Telegram bot token!")
+        print("1. Message @BotFather on Telegram")
+        print("2. Create a new bot with /newbot")
+        print("3. Set TELEGRAM_BOT_TOKEN environment variable")
+        exit(1)
+    
+    if AQICN_API_TOKEN == "YOUR_AQICN_API_TOKEN":
+        print("❌ Please set your AQICN API token!")
+        print("1. Visit https://aqicn.org/data-platform/token/")
+        print("2. Request a free API token")
+        print("3. Set AQICN_API_TOKEN environment variable")
+        exit(1)
+    
+    if os.getenv("BOT_MODE", "polling") == "webhook" and not (os.getenv("WEBHOOK_URL") and os.getenv("WEBHOOK_SECRET")):
+        print("❌ Webhook mode needs WEBHOOK_URL and WEBHOOK_SECRET!")
+        print("1. Set WEBHOOK_URL to the public HTTPS address of this app")
+        print("2. Set WEBHOOK_SECRET to a random string (A-Z, a-z, 0-9, _ and -)")
+        exit(1)
+    
+    if os.getenv("BOT_ROLE", "all") not in ("all", "ingest", "responder"):
+        print("❌ BOT_ROLE must be all, ingest or responder!")
+        exit(1)
+    
+    if os.getenv("BOT_ROLE", "all") != "all" and not os.getenv("SNAPSHOT_BACKEND"):
+        print("❌ Ingest and responder workers need a shared SNAPSHOT_BACKEND!")
+        print("1. On one host: SNAPSHOT_BACKEND=sqlite:///snapshots.db")
+        print("2. Across hosts or dynos: SNAPSHOT_BACKEND=redis://host:6379/0 (pip install redis)")
+        exit(1)
+    
+    if os.getenv("BOT_ROLE", "all") == "responder" and os.getenv("BOT_MODE", "polling") != "webhook":
+        print("❌ Responder workers need BOT_MODE=webhook!")
+        print("1. Telegram hands updates to only one poller at a time")
+        print("2. Point the webhook at a load balancer in front of the responders")
+        print("3. Set RESPONDER_WORKERS to their number so button rate limits stay bot-wide")
+        exit(1)
+    
+    # Create and run bot
+    bot = JakartaAQIBot(TELEGRAM_BOT_TOKEN, AQICN_API_TOKEN)
     bot.run()
\ No newline at end of file
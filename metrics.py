@@ -0,0 +1,249 @@
+import asyncio
+import functools
+import inspect
+import logging
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+import httpx
+from telegram.request import HTTPXRequest
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from render-cache hits up to upstream timeouts
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+    kind = 'counter'
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def samples(self):
+        for key, value in self.values.items():
+            yield self.name + "_total", format_labels(self.labelnames, key), value
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+        # label values -> [per-bucket counts, sum, count]
+        self.values = {}
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        series = self.values.get(key)
+        if series is None:
+            series = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time spent in the ``with`` block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        for key, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield self.name + "_bucket", format_labels(self.labelnames, key, ('le', format_value(bound))), cumulative
+            labels = format_labels(self.labelnames, key)
+            yield self.name + "_sum", labels, total
+            yield self.name + "_count", labels, count
+
+
+class CallbackMetric:
+    """Gauge or counter read from a callback at scrape time
+
+    The callback returns ``{label values tuple: value}``, which lets existing
+    in-process counters (such as the reading cache's) be exported as-is.
+    """
+
+    def __init__(self, name, help, callback, labelnames=(), kind='gauge'):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+        self.kind = kind
+
+    def samples(self):
+        name = self.name + "_total" if self.kind == 'counter' else self.name
+        for key, value in self.callback().items():
+            yield name, format_labels(self.labelnames, key), value
+
+
+class Registry:
+    """Named metrics rendered in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def callback(self, name, help, callback, labelnames=(), kind='gauge'):
+        return self.register(CallbackMetric(name, help, callback, labelnames, kind))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                for name, labels, value in metric.samples():
+                    lines.append(f"{name}{labels} {format_value(value)}")
+            except Exception as e:
+                logger.error(f"Could not collect metric {metric.name}: {str(e)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+UPSTREAM_SECONDS = REGISTRY.histogram(
+    'aqi_upstream_request_seconds', "Upstream API request latency by origin and HTTP status", ('origin', 'status')
+)
+HANDLER_SECONDS = REGISTRY.histogram(
+    'aqi_handler_seconds', "Telegram update handler latency", ('handler',)
+)
+FORMAT_SECONDS = REGISTRY.histogram(
+    'aqi_format_seconds', "Time spent formatting message text", ('view',)
+)
+TELEGRAM_SECONDS = REGISTRY.histogram(
+    'aqi_telegram_request_seconds', "Bot API request latency by method", ('method',)
+)
+TELEGRAM_RATE_LIMITED = REGISTRY.counter(
+    'aqi_telegram_rate_limited', "Bot API requests answered with 429 Too Many Requests", ('method',)
+)
+CIRCUIT_TRANSITIONS = REGISTRY.counter(
+    'aqi_upstream_circuit_transitions', "Upstream circuit breaker state changes by new state", ('origin', 'state')
+)
+
+
+def timed(histogram, **labels):
+    """Decorator observing the latency of a function or coroutine function"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                with histogram.time(**labels):
+                    return await func(*args, **kwargs)
+        else:
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with histogram.time(**labels):
+                    return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class InstrumentedRequest(HTTPXRequest):
+    """Bot API transport that records per-method latency and 429 answers
+
+    Its client reuses the upstream clients' SSL context instead of loading
+    the CA bundle again.
+    """
+
+    def _build_client(self):
+        # Imported here: aqi_http imports this module
+        from aqi_http import shared_ssl_context
+        return httpx.AsyncClient(verify=shared_ssl_context(), **self._client_kwargs)
+
+    async def do_request(self, url, method, *args, **kwargs):
+        api_method = url.rsplit('/', 1)[-1]
+        started = time.perf_counter()
+        try:
+            code, payload = await super().do_request(url, method, *args, **kwargs)
+        finally:
+            TELEGRAM_SECONDS.observe(time.perf_counter() - started, method=api_method)
+        if code == 429:
+            TELEGRAM_RATE_LIMITED.inc(method=api_method)
+        return code, payload
+
+
+class MetricsServer:
+    """Minimal local HTTP endpoint serving ``GET /metrics``"""
+
+    def __init__(self, registry, host="127.0.0.1", port=9090):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def handle(self, reader, writer):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+            # Drain the headers; the request has no body
+            while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request_line.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+                status, body = "200 OK", self.registry.render().encode()
+            else:
+                status, body = "404 Not Found", b"Not Found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
@@ -0,0 +1,58 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+
+class TokenBucket:
+    """Token bucket allowing ``rate`` operations per second with bursts up to ``capacity``"""
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, tokens=1):
+        """Take ``tokens`` if available right now, returning whether it succeeded"""
+        self.refill()
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+    async def acquire(self, tokens=1):
+        """Wait until ``tokens`` are available and take them"""
+        while not self.try_acquire(tokens):
+            await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+
+class KeyedRateLimiter:
+    """One token bucket per key (user, chat, ...), created on first use
+
+    Buckets are kept in least-recently-used order; past ``max_keys`` the
+    least recently used one is dropped. A key idle that long has usually
+    refilled anyway, and a dropped key just starts again with a full bucket.
+    """
+
+    def __init__(self, rate, capacity=None, max_keys=10000):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+
+    def try_acquire(self, key, tokens=1):
+        """Take ``tokens`` from ``key``'s bucket if available right now"""
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(self.rate, self.capacity)
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+        return bucket.try_acquire(tokens)
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import sqlite3
+import time
+
+from telegram.error import Forbidden, RetryAfter, TelegramError
+
+from ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLD = 150
+
+
+class SubscriptionStore:
+    """SQLite-backed store of per-chat AQI alert subscriptions
+
+    Each row remembers whether the chat was last notified above its
+    threshold, so alerts fire on crossings only and survive restarts.
+    """
+
+    def __init__(self, path="subscriptions.db"):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS subscriptions (
+                chat_id INTEGER PRIMARY KEY,
+                threshold INTEGER NOT NULL,
+                above INTEGER NOT NULL DEFAULT 0,
+                created_at INTEGER NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def subscribe(self, chat_id, threshold=DEFAULT_THRESHOLD):
+        self.conn.execute(
+            "INSERT INTO subscriptions (chat_id, threshold, above, created_at) VALUES (?, ?, 0, ?) "
+            "ON CONFLICT(chat_id) DO UPDATE SET threshold = excluded.threshold, above = 0",
+            (chat_id, threshold, int(time.time()))
+        )
+        self.conn.commit()
+
+    def unsubscribe(self, chat_id):
+        """Remove a subscription, returning whether one existed"""
+        cursor = self.conn.execute("DELETE FROM subscriptions WHERE chat_id = ?", (chat_id,))
+        self.conn.commit()
+        return cursor.rowcount > 0
+
+    def remove_many(self, chat_ids):
+        self.conn.executemany("DELETE FROM subscriptions WHERE chat_id = ?", [(c,) for c in chat_ids])
+        self.conn.commit()
+
+    def get(self, chat_id):
+        """Return ``(threshold, above)`` for a chat, or None if not subscribed"""
+        return self.conn.execute(
+            "SELECT threshold, above FROM subscriptions WHERE chat_id = ?", (chat_id,)
+        ).fetchone()
+
+    def all(self):
+        """Return every ``(chat_id, threshold, above)`` row"""
+        return self.conn.execute("SELECT chat_id, threshold, above FROM subscriptions").fetchall()
+
+    def set_above(self, updates):
+        """Persist crossing state from ``(above, chat_id)`` pairs in one transaction"""
+        self.conn.executemany("UPDATE subscriptions SET above = ? WHERE chat_id = ?", updates)
+        self.conn.commit()
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM subscriptions").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+class NotificationDispatcher:
+    """Evaluates every subscription against one shared reading and fans out alerts
+
+    Messages go out in batches paced by a global token bucket (Telegram allows
+    roughly 30 messages per second per bot) and a per-chat bucket (about one
+    message per second per chat). A 429 RetryAfter pauses the whole fan-out
+    before the message is retried once; chats that blocked the bot are
+    unsubscribed, and chats that could not be reached otherwise keep their
+    previous state so the crossing is alerted again on the next evaluation.
+    """
+
+    def __init__(self, store, global_rate=25, per_chat_rate=1, batch_size=25):
+        self.store = store
+        self.global_bucket = TokenBucket(global_rate, capacity=1)
+        self.per_chat_rate = per_chat_rate
+        self.chat_buckets = {}
+        self.batch_size = batch_size
+        self.paused_until = 0.0
+
+    def evaluate(self, avg_aqi):
+        """Return ``(chat_id, threshold, above)`` for every subscription whose state flips"""
+        changes = []
+        for chat_id, threshold, above in self.store.all():
+            now_above = avg_aqi >= threshold
+            if now_above != bool(above):
+                changes.append((chat_id, threshold, now_above))
+        return changes
+
+    async def dispatch(self, bot, avg_aqi, format_alert):
+        """Notify every chat whose threshold was crossed; returns the number of messages sent
+
+        ``format_alert(avg_aqi, threshold, above)`` renders the message text.
+        """
+        changes = self.evaluate(avg_aqi)
+        if not changes:
+            return 0
+
+        # Record the new state first so a crash mid fan-out never repeats alerts
+        self.store.set_above([(int(above), chat_id) for chat_id, _, above in changes])
+
+        rendered = {}
+        sent = 0
+        blocked = []
+        failed = []
+        for start in range(0, len(changes), self.batch_size):
+            batch = changes[start:start + self.batch_size]
+            jobs = []
+            for chat_id, threshold, above in batch:
+                key = (threshold, above)
+                if key not in rendered:
+                    rendered[key] = format_alert(avg_aqi, threshold, above)
+                jobs.append(self.send(bot, chat_id, rendered[key], blocked, failed))
+            results = await asyncio.gather(*jobs)
+            sent += sum(results)
+
+        if blocked:
+            self.store.remove_many(blocked)
+            logger.info(f"Removed {len(blocked)} subscription(s) for chats that blocked the bot")
+        if failed:
+            previous = {chat_id: int(not above) for chat_id, _, above in changes}
+            self.store.set_above([(previous[chat_id], chat_id) for chat_id in failed])
+        self.prune_chat_buckets()
+        logger.info(f"Sent {sent}/{len(changes)} AQI alert(s) for average AQI {avg_aqi}")
+        return sent
+
+    async def send(self, bot, chat_id, text, blocked, failed):
+        chat_bucket = self.chat_buckets.get(chat_id)
+        if chat_bucket is None:
+            chat_bucket = self.chat_buckets[chat_id] = TokenBucket(self.per_chat_rate, capacity=1)
+        await chat_bucket.acquire()
+
+        for attempt in range(2):
+            await self.wait_if_paused()
+            await self.global_bucket.acquire()
+            try:
+                await bot.send_message(chat_id, text, parse_mode='Markdown')
+                return True
+            except RetryAfter as e:
+                self.paused_until = max(self.paused_until, time.monotonic() + e.retry_after)
+                logger.warning(f"Telegram rate limit hit, pausing alerts for {e.retry_after}s")
+            except Forbidden:
+                blocked.append(chat_id)
+                return False
+            except TelegramError as e:
+                logger.error(f"Could not alert chat {chat_id}: {str(e)}")
+                failed.append(chat_id)
+                return False
+        failed.append(chat_id)
+        return False
+
+    async def wait_if_paused(self):
+        delay = self.paused_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def prune_chat_buckets(self):
+        # Buckets that have fully refilled carry no state worth keeping
+        for chat_id in [c for c, b in self.chat_buckets.items() if b.try_acquire(0) and b.tokens >= b.capacity]:
+            del self.chat_buckets[chat_id]
@@ -0,0 +1,20 @@
+import pytest
+
+from tests.stubs import start_stub_server
+
+
+@pytest.fixture(autouse=True)
+def isolated_env(monkeypatch):
+    """Keep bots created by tests on in-memory stores, whatever the shell environment says"""
+    monkeypatch.setenv("SUBSCRIPTIONS_DB", ":memory:")
+    monkeypatch.setenv("HISTORY_DB", ":memory:")
+    for name in ("SNAPSHOT_BACKEND", "BOT_ROLE", "SOURCES_CONFIG", "METRICS_PORT"):
+        monkeypatch.delenv(name, raising=False)
+
+
+@pytest.fixture
+def stub():
+    """Local AQICN/data.gov.sg stub answering after 10ms"""
+    server = start_stub_server(delay=0.01)
+    yield server
+    server.shutdown()
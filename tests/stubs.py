@@ -0,0 +1,466 @@
+"""Local stand-ins for the bot's network edges, shared by the tests and benchmark.py
+
+A stub server answers like api.waqi.info and api.data.gov.sg from recorded
+payloads, with configurable latency and error rate; a fake Bot API answers
+like api.telegram.org; and small fakes stand in for Telegram updates.
+"""
+import asyncio
+import gzip
+import hashlib
+import json
+import multiprocessing
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs
+
+import httpx
+
+from jakarta_air_bot import JakartaAQIBot
+
+# Fixture observations are from the current hour (Jakarta time), so the
+# freshness window treats them as live
+OBSERVED = datetime.now(timezone(timedelta(hours=7))).replace(minute=0, second=0, microsecond=0)
+
+# Recorded monitoring stations behind the bot's feed names: (uid, aqi, lat, lon, name).
+# As upstream, "jakarta" and "jakarta-pusat" resolve to the same station.
+STATIONS = {
+    "jakarta": (8294, 87, -6.1822, 106.8344, "Jakarta Central (US Consulate), Indonesia"),
+    "jakarta-pusat": (8294, 87, -6.1822, 106.8344, "Jakarta Central (US Consulate), Indonesia"),
+    "jakarta-selatan": (8295, 112, -6.2364, 106.7936, "Jakarta South (US Consulate), Indonesia"),
+    "jakarta-utara": (13656, 95, -6.1214, 106.8867, "Jakarta Utara, Indonesia"),
+    "jakarta-barat": (13657, 78, -6.1683, 106.7589, "Jakarta Barat, Indonesia"),
+    "jakarta-timur": (13658, 104, -6.2250, 106.9004, "Jakarta Timur, Indonesia"),
+}
+
+
+def station_feed(name):
+    """AQICN /feed/{name}/ payload for a recorded station"""
+    uid, aqi, lat, lon, city = STATIONS.get(name, STATIONS["jakarta"])
+    return {
+        "status": "ok",
+        "data": {
+            "aqi": aqi,
+            "idx": uid,
+            "city": {"name": city, "geo": [lat, lon]},
+            "iaqi": {"pm25": {"v": aqi}, "pm10": {"v": 41}, "no2": {"v": 12.4}, "o3": {"v": 8.1}},
+            "time": {"s": OBSERVED.strftime("%Y-%m-%d %H:%M:%S"), "iso": OBSERVED.isoformat(),
+                     "v": int(OBSERVED.timestamp())},
+        },
+    }
+
+
+# AQICN /map/bounds/ answer for the Jakarta box: every station once, plus the
+# duplicate and the offline ("-") entries real responses contain
+MAP_BOUNDS_FEED = {
+    "status": "ok",
+    "data": [
+        {"lat": lat, "lon": lon, "uid": uid, "aqi": str(aqi),
+         "station": {"name": city, "time": OBSERVED.isoformat()}}
+        for uid, aqi, lat, lon, city in dict((v[0], v) for v in STATIONS.values()).values()
+    ] + [
+        {"lat": -6.1822, "lon": 106.8344, "uid": 8294, "aqi": "87",
+         "station": {"name": "Jakarta Central (US Consulate), Indonesia", "time": OBSERVED.isoformat()}},
+        {"lat": -6.3751, "lon": 106.8209, "uid": 14412, "aqi": "-",
+         "station": {"name": "Depok, Indonesia", "time": (OBSERVED - timedelta(hours=36)).isoformat()}},
+    ],
+}
+
+PSI_FEED = {
+    "items": [{
+        "timestamp": OBSERVED.astimezone(timezone(timedelta(hours=8))).isoformat(),
+        "readings": {
+            "psi_twenty_four_hourly": {"national": 54, "north": 50, "south": 54, "east": 48, "west": 53, "central": 51},
+            "pm25_twenty_four_hourly": {"national": 17, "north": 15, "south": 17, "east": 14, "west": 16, "central": 15},
+        },
+    }],
+    "region_metadata": [
+        {"name": "national", "label_location": {"latitude": 0, "longitude": 0}},
+        {"name": "north", "label_location": {"latitude": 1.41803, "longitude": 103.82}},
+        {"name": "south", "label_location": {"latitude": 1.29587, "longitude": 103.82}},
+        {"name": "east", "label_location": {"latitude": 1.35735, "longitude": 103.94}},
+        {"name": "west", "label_location": {"latitude": 1.35735, "longitude": 103.7}},
+        {"name": "central", "label_location": {"latitude": 1.35735, "longitude": 103.82}},
+    ],
+}
+
+
+class StubUpstreamHandler(BaseHTTPRequestHandler):
+    """Answers AQICN feed and data.gov.sg PSI requests with canned payloads
+
+    Speaks HTTP/1.1 keep-alive, gzip-encodes bodies when asked and honours
+    If-None-Match, like the real upstreams.
+    """
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; without TCP_NODELAY every
+    # keep-alive response would wait out the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.count("connections")
+
+    def do_GET(self):
+        time.sleep(self.server.delay)
+        self.server.count("requests")
+        if self.server.should_fail():
+            self.server.count("errors")
+            self.send_response(503)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        body = json.dumps(self.server.payload(self.path.split("?")[0])).encode()
+        etag = '"%s"' % hashlib.sha1(body).hexdigest()
+
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", etag)
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body)
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.count("bytes_sent", len(body))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    """Stub upstream with configurable latency, error rate and payloads
+
+    ``fixtures`` maps stub paths to recorded payloads ("psi", "map/bounds",
+    "feed/<name>") and overrides the built-in ones.
+    """
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, *args, delay=0.2, error_rate=0.0, fixtures=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.delay = delay
+        self.error_rate = error_rate
+        self.fixtures = fixtures or {}
+        self.random = random.Random(7)
+        self.lock = threading.Lock()
+        self.counters = {"connections": 0, "requests": 0, "errors": 0, "bytes_sent": 0}
+
+    def payload(self, path):
+        key = path.strip("/")
+        if key in self.fixtures:
+            return self.fixtures[key]
+        if key.startswith("psi"):
+            return PSI_FEED
+        if key.startswith("map/bounds"):
+            return MAP_BOUNDS_FEED
+        return station_feed(key.split("/")[-1])
+
+    def should_fail(self):
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def reset_counters(self):
+        with self.lock:
+            self.counters = dict.fromkeys(self.counters, 0)
+
+
+def start_stub_server(delay=0.2, error_rate=0.0, fixtures=None):
+    """Start the stub upstream server in a daemon thread and return it"""
+    server = StubServer(("127.0.0.1", 0), StubUpstreamHandler, delay=delay, error_rate=error_rate, fixtures=fixtures)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class FakeBotAPIHandler(BaseHTTPRequestHandler):
+    """Answers Bot API calls (``POST /bot<token>/<method>``) like api.telegram.org would
+
+    ``GET /calls`` returns the number of calls per method.
+    """
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        with self.server.lock:
+            body = json.dumps(self.server.calls).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        time.sleep(self.server.delay)
+        method = self.path.rstrip("/").rsplit("/", 1)[-1]
+        length = int(self.headers.get("Content-Length", "0"))
+        params = {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode()).items()}
+        self.server.count(method)
+
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "AQI Bot", "username": "bench_aqi_bot"}
+        elif method in ("sendMessage", "editMessageText"):
+            chat_id = int(params.get("chat_id", 0))
+            result = {
+                "message_id": int(params.get("message_id", 1)),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": params.get("text", ""),
+            }
+        else:
+            result = True
+        body = json.dumps({"ok": True, "result": result}).encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeBotAPIServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, *args, delay=0.0, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def count(self, method):
+        with self.lock:
+            self.calls[method] = self.calls.get(method, 0) + 1
+
+
+def serve_fake_bot_api(delay, addresses):
+    server = FakeBotAPIServer(("127.0.0.1", 0), FakeBotAPIHandler, delay=delay)
+    addresses.put(server.server_address)
+    server.serve_forever()
+
+
+def start_fake_bot_api(delay=0.0):
+    """Start the fake Bot API in its own process, so it does not compete with the bot for the GIL
+
+    Returns ``(process, base URL)``.
+    """
+    addresses = multiprocessing.Queue()
+    process = multiprocessing.Process(target=serve_fake_bot_api, args=(delay, addresses), daemon=True)
+    process.start()
+    host, port = addresses.get(timeout=10)
+    return process, f"http://{host}:{port}"
+
+
+def make_bot(server):
+    """Create a bot whose upstream URLs point at the stub server"""
+    bot = JakartaAQIBot("bench-telegram-token", "bench-aqicn-token")
+    host, port = server.server_address
+    bot.sources.providers["aqicn"].base_url = f"http://{host}:{port}"
+    bot.sources.providers["datagovsg"].base_url = f"http://{host}:{port}/psi"
+    return bot
+
+
+class FakeMessage:
+    """Stand-in for telegram.Message that records replies"""
+
+    def __init__(self):
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+
+class FakeUpdate:
+    """Stand-in for telegram.Update carrying a single message"""
+
+    def __init__(self, location=None):
+        self.message = FakeMessage()
+        self.message.location = location
+
+
+async def time_aqi_commands(bot, count):
+    """Run ``count`` concurrent /aqi commands and return the elapsed seconds"""
+    updates = [FakeUpdate() for _ in range(count)]
+    started = time.perf_counter()
+    await asyncio.gather(*(bot.aqi_command(update, None) for update in updates))
+    elapsed = time.perf_counter() - started
+    assert all(len(update.message.replies) == 2 for update in updates)
+    return elapsed
+
+
+class FakeBot:
+    """Stand-in for telegram.Bot that records sent messages"""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((time.perf_counter(), chat_id))
+
+
+class FakeInlineQuery:
+    """Stand-in for telegram.InlineQuery that records the answer"""
+
+    def __init__(self, query):
+        self.query = query
+        self.results = None
+        self.cache_time = None
+
+    async def answer(self, results, cache_time=None, **kwargs):
+        self.results = results
+        self.cache_time = cache_time
+
+
+class FakeCallbackQuery:
+    """Stand-in for telegram.CallbackQuery on a shared message that records answers and edits"""
+
+    def __init__(self, data, user_id, message, log):
+        self.data = data
+        self.from_user = SimpleNamespace(id=user_id)
+        self.message = message
+        self.inline_message_id = None
+        self.log = log
+        self.reply_markup = None
+
+    async def answer(self, text=None, **kwargs):
+        self.log.append(("answer", text))
+
+    async def edit_message_text(self, text, **kwargs):
+        await asyncio.sleep(0.005)
+        self.log.append(("edit", text))
+        self.reply_markup = kwargs.get("reply_markup")
+
+
+def make_message_update(update_id, chat_id, text):
+    """Build a Bot API Update dict for a text message"""
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Bench"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}] if text.startswith("/") else [],
+        },
+    }
+
+
+def make_callback_update(update_id, chat_id, data):
+    """Build a Bot API Update dict for an inline keyboard button press"""
+    user = {"id": chat_id, "is_bot": False, "first_name": "Bench"}
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": user,
+            "chat_instance": str(chat_id),
+            "data": data,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "from": {"id": 1, "is_bot": True, "first_name": "AQI Bot"},
+                "text": "report",
+            },
+        },
+    }
+
+
+CALLBACK_DATA = ("check_aqi", "detailed_aqi", "sg_details", "about_aqi")
+
+
+def synthetic_updates(count):
+    """A mix of /aqi commands and button presses from many chats"""
+    updates = []
+    for update_id in range(1, count + 1):
+        chat_id = 1000 + update_id % 500
+        if update_id % 3 == 0:
+            updates.append(make_message_update(update_id, chat_id, "/aqi"))
+        else:
+            data = CALLBACK_DATA[update_id % len(CALLBACK_DATA)]
+            updates.append(make_callback_update(update_id, chat_id, data))
+    return updates
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def replay_load(count, concurrency, upstream_delay=0.2, error_rate=0.0, api_delay=0.02, fixtures=None):
+    """Replay synthetic updates through the real Application handlers against the stubs
+
+    Updates go through ``Application.process_update``, so handler lookup,
+    filters and callbacks are exactly those of the running bot; only the
+    network edges (upstreams and the Bot API) are local stubs. Returns the
+    latency percentiles (seconds), throughput, handler error count and the
+    calls each stub received.
+    """
+    from telegram import Update
+
+    upstream = start_stub_server(upstream_delay, error_rate, fixtures)
+    bot_api, bot_api_url = start_fake_bot_api(api_delay)
+    errors = 0
+
+    async def count_error(update, context):
+        nonlocal errors
+        errors += 1
+
+    try:
+        bot = make_bot(upstream)
+        bot.telegram_api_url = bot_api_url
+        application = bot.build_application()
+        application.add_error_handler(count_error)
+        await application.initialize()
+
+        queue = asyncio.Queue()
+        for data in synthetic_updates(count):
+            queue.put_nowait(Update.de_json(data, application.bot))
+        latencies = []
+
+        async def worker():
+            while not queue.empty():
+                update = queue.get_nowait()
+                started = time.perf_counter()
+                await application.process_update(update)
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        await application.shutdown()
+        await bot.close()
+        async with httpx.AsyncClient() as client:
+            calls = (await client.get(f"{bot_api_url}/calls")).json()
+    finally:
+        upstream.shutdown()
+        bot_api.terminate()
+
+    return {
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "elapsed": elapsed,
+        "throughput": count / elapsed,
+        "errors": errors,
+        "upstream_requests": upstream.counters["requests"],
+        "upstream_errors": upstream.counters["errors"],
+        "calls": calls,
+    }
@@ -0,0 +1,215 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+from aqi_snapshots import SnapshotPublisher, SqliteSnapshotStore
+from aqi_callbacks import DETAILS, REPORT, encode_inline
+from tests.stubs import STATIONS, FakeBot, FakeCallbackQuery, FakeUpdate, make_bot, start_stub_server, time_aqi_commands
+
+
+def test_concurrent_aqi_commands_take_about_as_long_as_one():
+    server = start_stub_server(delay=0.2)
+
+    async def run():
+        bot = make_bot(server)
+        single = await time_aqi_commands(bot, 1)
+        bot.cache.entries.clear()
+        concurrent = await time_aqi_commands(bot, 20)
+        await bot.close()
+        return single, concurrent
+
+    try:
+        single, concurrent = asyncio.run(run())
+    finally:
+        server.shutdown()
+    assert concurrent < 2 * single
+
+
+def test_fetch_city_counts_each_lookup_once(stub):
+    async def run():
+        bot = make_bot(stub)
+        await bot.fetch_city("jakarta", detail=True)
+        units = bot.sources.fetch_units(bot.sources.cities["jakarta"], detail=True)
+        bot.cache.entries.pop(units[0].key)
+        before = bot.cache.stats()
+        await bot.fetch_city("jakarta", detail=True)
+        after = bot.cache.stats()
+        await bot.close()
+        return len(units), {key: after[key] - before[key] for key in ("hits", "misses", "coalesced")}
+
+    units, counted = asyncio.run(run())
+    assert counted == {"hits": units - 1, "misses": 1, "coalesced": 0}
+
+
+def test_bounds_refresh_makes_one_upstream_request(stub):
+    async def run():
+        bot = make_bot(stub)
+        stub.reset_counters()
+        readings = await bot.fetch_city("jakarta")
+        bounds_requests = stub.counters["requests"]
+        # Each prefetch refreshes the Jakarta box and the Singapore PSI once,
+        # even while reports race it for the same units
+        stub.reset_counters()
+        await asyncio.gather(bot.prefetch_all(), *(bot.fetch_city("jakarta") for _ in range(5)))
+        await bot.close()
+        return readings, bounds_requests, stub.counters["requests"]
+
+    readings, bounds_requests, prefetch_requests = asyncio.run(run())
+    assert bounds_requests == 1
+    assert prefetch_requests == 2
+    assert len(readings) == len({r.uid for r in readings})
+
+
+def test_average_counts_each_monitor_once(stub):
+    async def run():
+        summaries = {}
+        for mode in ("bounds", "feeds"):
+            bot = make_bot(stub)
+            city = bot.sources.cities["jakarta"]
+            if mode == "feeds":
+                city.bounds = None
+            readings = await bot.fetch_city("jakarta")
+            summaries[mode] = bot.city_summary(city, readings)
+            await bot.close()
+        return summaries
+
+    summaries = asyncio.run(run())
+    naive = int(sum(aqi for _, aqi, *_ in STATIONS.values()) / len(STATIONS))
+    assert summaries == {"bounds": 95, "feeds": 95}
+    assert naive == 93
+
+
+def test_nearest_lists_distinct_monitors_with_readings(stub):
+    async def run():
+        bot = make_bot(stub)
+        # Details index the configured feeds, which duplicate bounds stations
+        await bot.get_details_view("jakarta")
+        update = FakeUpdate(location=SimpleNamespace(latitude=-6.18, longitude=106.83))
+        await bot.location_command(update, None)
+        await bot.close()
+        return update.message.replies[-1]
+
+    message = asyncio.run(run())
+    assert "❌" not in message
+    assert message.count("Jakarta Central") == 1
+    assert message.count("🔢 AQI:") == 3
+
+
+def test_responders_answer_from_published_snapshots(stub, tmp_path):
+    path = str(tmp_path / "snapshots.db")
+
+    async def run():
+        ingest = make_bot(stub)
+        ingest.role = "ingest"
+        ingest.snapshots = SqliteSnapshotStore(path)
+        ingest.publisher = SnapshotPublisher(ingest.snapshots)
+        failed = await ingest.prefetch_all()
+        expected, _ = await ingest.get_details_view("jakarta")
+        await ingest.close()
+
+        stub.reset_counters()
+        responder = make_bot(stub)
+        responder.role = "responder"
+        responder.snapshots = SqliteSnapshotStore(path)
+        loaded = await responder.sync_snapshots()
+        details, _ = await responder.get_details_view("jakarta")
+        await time_aqi_commands(responder, 5)
+        await responder.close()
+        return failed, loaded, details == expected
+
+    failed, loaded, same = asyncio.run(run())
+    assert failed == 0 and loaded and same
+    assert stub.counters["requests"] == 0
+
+
+def test_responders_sharing_a_chat_edit_after_each_other(stub, tmp_path, monkeypatch):
+    monkeypatch.setenv("SNAPSHOT_BACKEND", f"sqlite:///{tmp_path / 'snapshots.db'}")
+    message = SimpleNamespace(chat=SimpleNamespace(id=1), message_id=7)
+    log = []
+
+    async def tap(bot, data):
+        await bot.button_callback(SimpleNamespace(callback_query=FakeCallbackQuery(data, 1, message, log)), None)
+
+    async def run():
+        monkeypatch.setenv("BOT_ROLE", "ingest")
+        ingest = make_bot(stub)
+        await ingest.prefetch_all()
+        await ingest.close()
+
+        monkeypatch.setenv("BOT_ROLE", "responder")
+        first, second = make_bot(stub), make_bot(stub)
+        for responder in (first, second):
+            await responder.sync_snapshots()
+        await tap(first, encode_inline(REPORT))
+        await tap(second, encode_inline(DETAILS, "jakarta", 0))
+        log.clear()
+        await tap(first, encode_inline(REPORT))
+        await first.close()
+        await second.close()
+
+    asyncio.run(run())
+    assert [kind for kind, _ in log] == ["answer", "edit"]
+
+
+def test_responders_share_trend_and_subscriptions_through_the_backend(stub, tmp_path, monkeypatch):
+    monkeypatch.setenv("SNAPSHOT_BACKEND", f"sqlite:///{tmp_path / 'snapshots.db'}")
+
+    async def run():
+        monkeypatch.setenv("BOT_ROLE", "ingest")
+        ingest = make_bot(stub)
+        await ingest.prefetch_all()
+        monkeypatch.setenv("BOT_ROLE", "responder")
+        responder = make_bot(stub)
+        await responder.sync_snapshots()
+
+        trend = FakeUpdate()
+        await responder.trend_command(trend, None)
+        subscribe = FakeUpdate()
+        subscribe.effective_chat = SimpleNamespace(id=42)
+        await responder.subscribe_command(subscribe, SimpleNamespace(args=["120"]))
+        applied = await ingest.apply_subscription_changes()
+        subscription = ingest.subscriptions.get(42)
+        expected = ingest.trend_text()
+        await responder.close()
+        await ingest.close()
+        return trend.message.replies[0], expected, applied, subscription
+
+    shown, expected, applied, subscription = asyncio.run(run())
+    assert shown == expected
+    assert applied == 1 and subscription == (120, 0)
+
+
+def test_cities_come_from_the_registry(stub, tmp_path, monkeypatch):
+    config = {
+        "providers": {
+            "aqicn": {"type": "aqicn", "base_url": "https://api.waqi.info", "label": "AQICN.org"},
+            "datagovsg": {"type": "datagovsg", "base_url": "https://api.data.gov.sg/v1/environment/psi", "label": "Data.gov.sg"},
+        },
+        "cities": [
+            {"key": "singapore", "name": "Singapore", "flag": "🇸🇬", "provider": "datagovsg", "scale": "psi",
+             "summary": "sg-national", "stations": [{"id": "sg-national", "source_id": "national", "name": "National"}]},
+            {"key": "bandung", "name": "Bandung", "flag": "🇮🇩", "provider": "aqicn", "scale": "aqi",
+             "stations": [{"id": "jakarta-selatan"}]},
+        ],
+    }
+    path = tmp_path / "sources.json"
+    path.write_text(json.dumps(config), encoding="utf-8")
+    monkeypatch.setenv("SOURCES_CONFIG", str(path))
+
+    async def run():
+        bot = make_bot(stub)
+        bot.application = SimpleNamespace(bot=FakeBot())
+        bot.subscriptions.subscribe(42, 1)
+        await bot.notify_subscribers()
+        trend = FakeUpdate()
+        await bot.trend_command(trend, None)
+        await bot.close()
+        return bot, trend.message.replies
+
+    bot, replies = asyncio.run(run())
+    assert [[button.text for button in row] for row in bot.report_keyboard.inline_keyboard] == [
+        ["🔄 Refresh"], ["📊 Detailed Singapore", "📈 Trend"], ["🇮🇩 Bandung Details"]
+    ]
+    assert [chat_id for _, chat_id in bot.application.bot.sent] == [42]
+    assert "Singapore" in bot.format_alert_message(60, 50, True)
+    assert len(replies) == 1
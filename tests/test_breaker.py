@@ -0,0 +1,77 @@
+import pytest
+
+from breaker import CLOSED, HALF_OPEN, OPEN, AdaptiveTimeout, CircuitBreaker, CircuitOpenError
+
+
+def test_circuit_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("host", failure_threshold=3, reset_timeout=60)
+    for _ in range(2):
+        assert breaker.check() is False
+        breaker.record_failure()
+    breaker.record_success()
+    for _ in range(3):
+        breaker.check()
+        breaker.record_failure()
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = CircuitBreaker("host", failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.check() is True
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.check()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.check() is False
+
+
+def test_failed_probe_opens_the_circuit_again():
+    breaker = CircuitBreaker("host", failure_threshold=5, reset_timeout=0)
+    for _ in range(5):
+        breaker.record_failure()
+    assert breaker.check() is True
+    breaker.record_failure()
+    assert breaker.state == OPEN
+
+
+def test_abandoned_probe_releases_the_slot():
+    breaker = CircuitBreaker("host", failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.check() is True
+    breaker.record_abandoned()
+    assert breaker.check() is True
+
+
+def test_adaptive_timeout_uses_the_maximum_until_enough_samples():
+    timeout = AdaptiveTimeout(maximum=10, min_samples=10)
+    for _ in range(9):
+        timeout.observe(0.1)
+    assert timeout.current() == 10
+    timeout.observe(0.1)
+    assert timeout.current() == 1.0
+
+
+def test_adaptive_timeout_follows_the_p95_latency():
+    timeout = AdaptiveTimeout(maximum=10, multiplier=3.0, min_samples=10)
+    for _ in range(20):
+        timeout.observe(0.8)
+    assert timeout.current() == pytest.approx(2.4)
+
+
+def test_only_calls_far_slower_than_usual_are_slow():
+    timeout = AdaptiveTimeout(maximum=10, slow_factor=2.0, slow_floor=0.5, min_samples=10)
+    assert not timeout.is_slow(5.0)
+    for _ in range(20):
+        timeout.observe(0.4)
+    assert timeout.is_slow(0.9)
+    assert not timeout.is_slow(0.7)
+    # Fast hosts are not held to a few milliseconds
+    fast = AdaptiveTimeout(maximum=10, slow_factor=2.0, slow_floor=0.5, min_samples=10)
+    for _ in range(20):
+        fast.observe(0.02)
+    assert not fast.is_slow(0.3)
+    assert fast.is_slow(0.6)
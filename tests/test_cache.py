@@ -0,0 +1,104 @@
+import asyncio
+import time
+
+from aqi_cache import ReadingCache
+
+
+def counting_fetcher(value="reading", delay=0.0):
+    calls = []
+
+    async def fetch():
+        calls.append(time.monotonic())
+        await asyncio.sleep(delay)
+        return value
+
+    return fetch, calls
+
+
+def test_fresh_values_are_served_from_cache():
+    async def run():
+        cache = ReadingCache(ttl=60)
+        fetch, calls = counting_fetcher()
+        assert await cache.get("k", fetch) == "reading"
+        assert await cache.get("k", fetch) == "reading"
+        return cache, calls
+
+    cache, calls = asyncio.run(run())
+    assert len(calls) == 1
+    assert (cache.misses, cache.hits) == (1, 1)
+
+
+def test_concurrent_cold_requests_share_one_fetch():
+    async def run():
+        cache = ReadingCache()
+        fetch, calls = counting_fetcher(delay=0.05)
+        values = await asyncio.gather(*(cache.get("k", fetch) for _ in range(20)))
+        return cache, calls, values
+
+    cache, calls, values = asyncio.run(run())
+    assert values == ["reading"] * 20
+    assert len(calls) == 1
+    assert (cache.misses, cache.coalesced) == (1, 19)
+    # Every one of them waited on upstream
+    assert cache.stats()["hit_ratio"] == 0.0
+
+
+def test_stale_value_is_served_while_one_refresh_runs():
+    async def run():
+        cache = ReadingCache(ttl=10, stale_ttl=60)
+        fetch, calls = counting_fetcher("old")
+        await cache.get("k", fetch)
+        cache.entries["k"].fetched_at -= 30
+        fetch, calls = counting_fetcher("new", delay=0.05)
+        stale = [await cache.get("k", fetch) for _ in range(3)]
+        await asyncio.sleep(0.1)
+        return cache, calls, stale, await cache.get("k", fetch)
+
+    cache, calls, stale, refreshed = asyncio.run(run())
+    assert stale == ["old"] * 3
+    assert refreshed == "new"
+    assert len(calls) == 1
+    assert cache.stale_hits == 3
+
+
+def test_failures_are_not_cached():
+    async def run():
+        cache = ReadingCache()
+
+        async def empty():
+            return None
+
+        assert await cache.get("k", empty) is None
+        fetch, calls = counting_fetcher()
+        assert await cache.get("k", fetch) == "reading"
+        return cache
+
+    cache = asyncio.run(run())
+    assert cache.upstream_errors == 1
+    assert cache.upstream_fetches == 2
+
+
+def test_get_fresh_counts_a_hit_only_within_the_ttl():
+    async def run():
+        cache = ReadingCache(ttl=10)
+        fetch, _ = counting_fetcher()
+        await cache.get("k", fetch)
+        fresh = cache.get_fresh("k")
+        cache.entries["k"].fetched_at -= 20
+        return cache, fresh, cache.get_fresh("k"), cache.get_fresh("missing")
+
+    cache, fresh, expired, missing = asyncio.run(run())
+    assert (fresh, expired, missing) == ("reading", None, None)
+    assert cache.hits == 1
+
+
+def test_put_keeps_the_more_recent_value():
+    cache = ReadingCache(ttl=60)
+    now = time.time()
+    assert cache.put("k", "newer", now - 5)
+    assert not cache.put("k", "older", now - 50)
+    assert cache.peek("k").value == "newer"
+    # Entries age from when they were stored elsewhere, not from now
+    assert cache.put("old", "snapshot", now - 120)
+    assert cache.get_fresh("k") == "newer"
+    assert cache.get_fresh("old") is None
@@ -0,0 +1,55 @@
+from aqi_callbacks import DETAILS, MAX_BYTES, MENU, REPORT, STATION, CallbackCodec, encode_inline
+
+
+def test_short_arguments_round_trip_inline():
+    codec = CallbackCodec()
+    data = codec.encode(DETAILS, "jakarta", 2)
+    assert data == "v1|d|jakarta|2"
+    assert codec.decode(data) == (DETAILS, ["jakarta", "2"])
+    assert codec.decode(codec.encode(MENU)) == (MENU, [])
+    assert not codec.states
+
+
+def test_long_arguments_are_kept_server_side_under_a_stable_token():
+    codec = CallbackCodec()
+    station = "aqicn-" + "x" * 80
+    data = codec.encode(STATION, station)
+    assert len(data.encode()) <= MAX_BYTES
+    assert encode_inline(STATION, station) is None
+    assert codec.encode(STATION, station) == data
+    assert codec.decode(data) == (STATION, [station])
+    assert len(codec.states) == 1
+
+
+def test_arguments_that_cannot_be_split_back_use_a_token():
+    codec = CallbackCodec()
+    data = codec.encode(STATION, "a|b")
+    assert data != "v1|s|a|b"
+    assert codec.decode(data) == (STATION, ["a|b"])
+
+
+def test_evicted_and_unknown_data_decode_as_expired():
+    codec = CallbackCodec(max_states=2)
+    first = codec.encode(STATION, "a" * 70)
+    codec.encode(STATION, "b" * 70)
+    codec.encode(STATION, "c" * 70)
+    assert codec.decode(first) is None
+    assert codec.decode("v0|r") is None
+    assert codec.decode("garbage") is None
+    assert codec.decode(None) is None
+
+
+def test_recently_used_tokens_survive_eviction():
+    codec = CallbackCodec(max_states=2)
+    first = codec.encode(STATION, "a" * 70)
+    second = codec.encode(STATION, "b" * 70)
+    assert codec.decode(first) is not None
+    codec.encode(STATION, "c" * 70)
+    assert codec.decode(first) == (STATION, ["a" * 70])
+    assert codec.decode(second) is None
+
+
+def test_legacy_callback_strings_still_route():
+    codec = CallbackCodec()
+    assert codec.decode("check_aqi") == (REPORT, [])
+    assert codec.decode("sg_details") == (DETAILS, ["singapore", "0"])
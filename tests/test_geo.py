@@ -0,0 +1,46 @@
+import math
+import random
+
+import pytest
+
+from aqi_geo import EARTH_RADIUS_KM, StationIndex
+from aqi_sources import City, Reading
+
+
+def haversine_km(a, b):
+    lat1, lon1, lat2, lon2 = map(math.radians, (*a, *b))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(h))
+
+
+def test_nearest_matches_a_linear_scan():
+    rng = random.Random(3)
+    positions = {f"s{i}": (rng.uniform(-60, 60), rng.uniform(-180, 180)) for i in range(500)}
+    index = StationIndex(positions)
+    for _ in range(50):
+        target = (rng.uniform(-60, 60), rng.uniform(-180, 180))
+        expected = sorted(positions, key=lambda key: haversine_km(target, positions[key]))[:3]
+        nearest = index.nearest(*target, k=3)
+        assert [key for key, _ in nearest] == expected
+        for key, km in nearest:
+            assert km == pytest.approx(haversine_km(target, positions[key]), abs=1e-6)
+
+
+def test_nearest_across_the_antimeridian():
+    index = StationIndex({"fiji": (-17.7, 179.9), "samoa": (-13.8, -171.8), "sydney": (-33.9, 151.2)})
+    assert index.nearest(-17.0, -179.9, k=1)[0][0] == "fiji"
+
+
+def test_max_km_drops_distant_stations():
+    index = StationIndex({"jakarta": (-6.18, 106.83), "singapore": (1.35, 103.82)})
+    assert [key for key, _ in index.nearest(-6.2, 106.8, k=2, max_km=100)] == ["jakarta"]
+
+
+def test_update_learns_and_moves_positions():
+    city = City("test", "Test", "", "aqicn", "aqi", [{"id": "a"}, {"id": "b"}])
+    index = StationIndex({"a": (0.0, 0.0)})
+    index.nearest(0, 0)
+    index.update([Reading(city.stations[1], geo=(10.0, 10.0)), Reading(city.stations[0], geo=None)])
+    assert len(index) == 2
+    index.update([Reading(city.stations[0], geo=(20.0, 20.0))])
+    assert index.nearest(19.0, 19.0, k=1)[0][0] == "a"
@@ -0,0 +1,36 @@
+import asyncio
+
+from aqi_history import DAILY, RAW, HistoryStore
+from tests.stubs import make_bot
+
+NOW = 1_700_000_000
+
+
+def test_compaction_folds_old_samples_through_the_resolution_index():
+    store = HistoryStore(":memory:", raw_days=1, retention_days=10)
+    old = NOW - 3 * 86400
+    store.record_many([("s", old, {"aqi": 80}), ("s", old + 3600, {"aqi": 100}), ("s", NOW, {"aqi": 50})])
+    plan = " ".join(row[-1] for row in store.conn.execute(
+        "EXPLAIN QUERY PLAN SELECT station, ts, payload FROM samples WHERE resolution = ? AND ts < ?", (RAW, NOW)
+    ))
+    store.compact(now=NOW)
+    samples = [(ts, round(values[0])) for ts, values in store.query("s", 0, NOW + 1)]
+    store.close()
+    assert "samples_resolution_ts" in plan
+    assert samples == [(old // DAILY * DAILY, 90), (NOW, 50)]
+
+
+def test_prefetch_records_every_fetched_reading_in_one_flush(stub):
+    async def run():
+        bot = make_bot(stub)
+        await bot.fetch_city("jakarta", detail=True)
+        pending = len(bot.history_pending)
+        await bot.prefetch_all()
+        stations = bot.history.stations()
+        left = len(bot.history_pending)
+        await bot.close()
+        return pending, stations, left
+
+    pending, stations, left = asyncio.run(run())
+    assert pending and left == 0
+    assert "jakarta-selatan" in stations and "sg-national" in stations
@@ -0,0 +1,65 @@
+import asyncio
+
+import httpx
+import pytest
+
+from aqi_http import UpstreamClient
+from breaker import CLOSED, OPEN, CircuitOpenError
+
+
+def warmed_client(stub, requests=12):
+    """A client that has learned the stub's normal (10ms) latency"""
+    host, port = stub.server_address
+    origin = f"http://{host}:{port}"
+    client = UpstreamClient(origin, timeout=1.5, failure_threshold=3, reset_timeout=0.2)
+
+    async def warm():
+        for _ in range(requests):
+            await client.get_json(f"{origin}/feed/jakarta/")
+
+    return client, f"{origin}/feed/jakarta/", warm
+
+
+async def call(client, url):
+    try:
+        return await client.get_json(url)
+    except (httpx.HTTPError, CircuitOpenError) as e:
+        return e
+
+
+@pytest.mark.parametrize("delay", [0.6, 1.2])
+def test_degraded_host_below_the_cap_opens_the_circuit(stub, delay):
+    async def run():
+        client, url, warm = warmed_client(stub)
+        await warm()
+        learned = client.adaptive_timeout.current()
+        stub.delay = delay
+        for _ in range(3):
+            await call(client, url)
+        state, timeout = client.breaker.state, client.adaptive_timeout.current()
+        await client.aclose()
+        return learned, state, timeout
+
+    learned, state, timeout = asyncio.run(run())
+    assert state == OPEN
+    # Slow answers and timeouts do not teach the timeout to wait longer
+    assert timeout == learned == 1.0
+
+
+def test_probe_lets_a_slower_but_healthy_host_recover(stub):
+    async def run():
+        client, url, warm = warmed_client(stub)
+        await warm()
+        stub.delay = 1.2
+        for _ in range(3):
+            await call(client, url)
+        assert client.breaker.state == OPEN
+        await asyncio.sleep(0.25)
+        # The probe gets the full 1.5s maximum instead of the learned 1.0s
+        status, _ = await client.get_json(url)
+        state = client.breaker.state
+        await client.aclose()
+        return status, state
+
+    status, state = asyncio.run(run())
+    assert (status, state) == (200, CLOSED)
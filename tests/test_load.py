@@ -0,0 +1,15 @@
+import asyncio
+
+from tests.stubs import replay_load
+
+# Regression budget for the synthetic update mix through the real
+# Application; generous enough for a shared CI runner
+P95_BUDGET_SECONDS = 2.0
+MIN_UPDATES_PER_SECOND = 15
+
+
+def test_load_stays_within_the_latency_budget():
+    results = asyncio.run(replay_load(count=300, concurrency=20, upstream_delay=0.05, api_delay=0.01))
+    assert results["errors"] == 0
+    assert results["p95"] < P95_BUDGET_SECONDS
+    assert results["throughput"] > MIN_UPDATES_PER_SECOND
@@ -0,0 +1,43 @@
+from aqi_quality import dedupe, reject_outliers, validate
+from aqi_sources import City, Reading
+
+NOW = 1_700_000_000
+
+
+def make_readings(*values, uids=None, ages=None):
+    city = City("test", "Test", "", "aqicn", "aqi", [{"id": f"s{i}"} for i in range(len(values))])
+    uids = uids or [None] * len(values)
+    ages = ages or [0] * len(values)
+    return [
+        Reading(station, value=value, uid=uid, observed_at=NOW - age)
+        for station, value, uid, age in zip(city.stations, values, uids, ages)
+    ]
+
+
+def test_dedupe_keeps_the_first_reading_per_uid():
+    readings = make_readings(87, 112, 87, 95, uids=[8294, 8295, 8294, None])
+    duplicates = set()
+    kept = list(dedupe(readings, duplicates))
+    assert [r.station.id for r in kept] == ["s0", "s1", "s3"]
+    assert duplicates == {"s2"}
+
+
+def test_validate_flags_invalid_and_stale_values():
+    readings = make_readings(87, None, "n/a", -1, 1200, True, 140, ages=[0, 0, 0, 0, 0, 0, 6 * 3600])
+    readings.append(Reading.missing(readings[0].station))
+    statuses = [r.status for r in validate(readings, stale_after=3 * 3600, now=NOW)]
+    assert statuses == ["ok", "invalid", "invalid", "invalid", "invalid", "invalid", "stale", "missing"]
+
+
+def test_reject_outliers_marks_values_far_from_the_median():
+    readings = list(validate(make_readings(87, 112, 95, 78, 104, 480), stale_after=3600, now=NOW))
+    reject_outliers(readings)
+    assert [r.status for r in readings] == ["ok"] * 5 + ["outlier"]
+
+
+def test_reject_outliers_leaves_small_or_tight_samples_alone():
+    few = list(validate(make_readings(20, 400, 30), stale_after=3600, now=NOW))
+    assert all(r.status == "ok" for r in reject_outliers(few))
+    # Ordinary spatial spread across a clean city is not an outlier
+    clean = list(validate(make_readings(50, 52, 51, 50, 58), stale_after=3600, now=NOW))
+    assert all(r.status == "ok" for r in reject_outliers(clean))
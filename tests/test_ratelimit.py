@@ -0,0 +1,19 @@
+from ratelimit import KeyedRateLimiter
+
+
+def test_limits_each_key_separately():
+    limiter = KeyedRateLimiter(0.001, 2)
+    assert [limiter.try_acquire("a") for _ in range(3)] == [True, True, False]
+    assert limiter.try_acquire("b")
+
+
+def test_least_recently_used_keys_are_evicted_past_max_keys():
+    limiter = KeyedRateLimiter(0.001, 1, max_keys=3)
+    for key in ("a", "b", "c"):
+        assert limiter.try_acquire(key)
+    assert not limiter.try_acquire("a")
+    # No bucket has refilled, yet the table stays bounded: "b" is the oldest
+    limiter.try_acquire("d")
+    assert list(limiter.buckets) == ["c", "a", "d"]
+    assert not limiter.try_acquire("a")
+    assert limiter.try_acquire("b")
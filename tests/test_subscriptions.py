@@ -0,0 +1,60 @@
+import asyncio
+
+from telegram.error import Forbidden, RetryAfter, TelegramError
+
+from jakarta_air_bot import JakartaAQIBot
+from subscriptions import NotificationDispatcher, SubscriptionStore
+
+
+class FlakyBot:
+    """Stand-in for telegram.Bot raising a fixed error per chat"""
+
+    def __init__(self, errors):
+        self.errors = errors
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        error = self.errors.get(chat_id)
+        if error is not None:
+            raise error
+        self.sent.append(chat_id)
+
+
+def test_failed_alerts_are_retried_on_the_next_evaluation():
+    store = SubscriptionStore(":memory:")
+    for chat_id in (1, 2, 3, 4):
+        store.subscribe(chat_id, 100)
+    dispatcher = NotificationDispatcher(store, global_rate=1000)
+    bot = FlakyBot({2: TelegramError("Timed out"), 3: RetryAfter(0), 4: Forbidden("Bot was blocked by the user")})
+
+    sent = asyncio.run(dispatcher.dispatch(bot, 160, lambda aqi, threshold, above: "alert"))
+
+    assert sent == 1 and bot.sent == [1]
+    assert sorted(store.all()) == [(1, 100, 1), (2, 100, 0), (3, 100, 0)]
+    assert [chat_id for chat_id, _, _ in dispatcher.evaluate(160)] == [2, 3]
+
+
+def test_alert_fanout_does_not_delay_the_next_prefetch():
+    async def run():
+        bot = JakartaAQIBot("test-telegram-token", "test-aqicn-token")
+        bot.prefetch_interval, bot.prefetch_offset = 0.05, 0
+        prefetches = []
+        fanout = asyncio.Event()
+
+        async def prefetch_all():
+            prefetches.append(1)
+            return 0
+
+        async def notify_subscribers():
+            # A fan-out to many subscribers that outlasts several prefetch intervals
+            await fanout.wait()
+
+        bot.prefetch_all, bot.notify_subscribers = prefetch_all, notify_subscribers
+        await bot.start_prefetch()
+        await asyncio.sleep(0.3)
+        running = not bot.notify_task.done()
+        await bot.close()
+        return len(prefetches), running
+
+    prefetches, running = asyncio.run(run())
+    assert running and prefetches >= 4
@@ -0,0 +1,39 @@
+import math
+
+import numpy as np
+
+from aqi_history import HistoryStore
+from aqi_trend import HOUR, build_trends, peak_hours
+
+NOW = 1_700_006_400  # midnight UTC
+
+
+def test_hour_of_day_profiles_per_station_and_pollutant():
+    store = HistoryStore(":memory:")
+    rng = np.random.default_rng(5)
+    samples = []
+    for station in ("a", "b"):
+        for ts in range(NOW - 3 * 86400, NOW, HOUR):
+            samples.append((station, ts, {"aqi": float(rng.integers(20, 200)), "pm25": float(rng.integers(5, 90))}))
+    store.record_many(samples)
+
+    per_station, citywide = build_trends(store, ["a", "b"], NOW, days=7, utc_offset=0)
+    store.close()
+
+    for pollutant in ("aqi", "pm25"):
+        for station in ("a", "b"):
+            expected = [
+                np.mean([values[pollutant] for s, ts, values in samples if s == station and ts // HOUR % 24 == hour])
+                for hour in range(24)
+            ]
+            assert np.allclose(per_station[station][pollutant].profile, expected)
+        pooled = [np.mean([values[pollutant] for _, ts, values in samples if ts // HOUR % 24 == hour])
+                  for hour in range(24)]
+        assert np.allclose(citywide[pollutant].profile, pooled)
+
+
+def test_peak_hours_skip_unseen_hours():
+    profile = np.full(24, math.nan)
+    assert peak_hours(profile) is None
+    profile[[3, 9, 17]] = [40, 10, 90]
+    assert peak_hours(profile) == (9, 17)